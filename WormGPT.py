@@ -3,10 +3,12 @@
 موبي - البوت الذكي المتقدم
 """
 
+import asyncio
+import copy
+import functools
 import os
-import json
 import logging
-import requests
+import signal
 import threading
 import time
 from datetime import datetime, timedelta
@@ -15,6 +17,31 @@ import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 import psutil
 
+from config import Config
+from handlers.admin_handlers import show_admin_stats
+from utils.ai_router import Backend, BackendRouter
+from utils.broadcast import BroadcastEngine, RUNNING as BROADCAST_RUNNING, DONE as BROADCAST_DONE
+from utils.cache import TTLCache
+from utils.chat_executor import ChatShardedExecutor
+from utils.context_builder import ContextBuilder
+from utils.delivery import DeliveryIndex, is_permanent_failure
+from utils.expiry import ExpiryScheduler
+from utils.http_client import CircuitOpenError, PooledHttpClient
+from utils.intents import IntentMatcher
+from utils.postprocess import ResponsePipeline
+from utils.ptb_bridge import to_telebot_update
+from utils.arabic import normalize_arabic
+from utils.response_cache import ResponseCache
+from utils.scheduler import AsyncScheduler, LANE_FREE, LANE_PRIORITY, RequestMerged, ThreadScheduler
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+from utils.streaming import AsyncStreamingReply, StreamingReply
+from utils.roles import RoleIndex, ROLE_ADMIN, ROLE_VIP, ROLE_BANNED
+from utils.startup import StartupTimer
+from utils.storage import JsonStorageBackend
+from utils.user_registry import LazyUserRegistry, UserRegistry
+from utils.webhook import WebhookServer
+from utils.write_behind import WriteBehindQueue
+
 # إعداد التسجيل
 logging.basicConfig(
     level=logging.INFO,
@@ -22,6 +49,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger("موبي_البوت")
 
+# قياس مراحل بدء التشغيل حتى الاستماع للرسائل
+startup_timer = StartupTimer()
+
 # التوكن
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '8253064655:AAExNIiYf09aqEsW42A-rTFQDG-P4skucx4')
 
@@ -49,14 +79,73 @@ class MemorySystem:
     def __init__(self):
         self.workspace = Path("/tmp/mobi_memory")
         self.workspace.mkdir(exist_ok=True)
-        self.conversations = {}
-        self.user_stats = self.load_user_stats()
-        self.admins = self.load_admins()
-        self.banned_users = self.load_banned_users()
-        self.vip_users = self.load_vip_users()
-        self.settings = self.load_settings()
+        with startup_timer.step("التخزين"):
+            self.storage = self.create_storage()
+        # ذاكرة مؤقتة للمحادثات: المسار الساخن يُخدم من الذاكرة والتخزين يُكتب لاحقاً
+        self.conversations = TTLCache(
+            max_size=Config.CONVERSATION_CACHE_SIZE,
+            ttl=Config.CONVERSATION_CACHE_TTL,
+            on_evict=self.on_conversation_evicted
+        )
+        # حالة الاشتراك في القناة لكل (قناة، مستخدم) - تُمسح عند تغيير القناة
+        self.subscriptions = TTLCache(
+            max_size=Config.SUBSCRIPTION_CACHE_SIZE,
+            ttl=Config.SUBSCRIPTION_CACHE_TTL
+        )
+        # فهرس انتهاء المحادثات حسب موعد انتهاء أقدم رسالة
+        self.conversation_expiry = ExpiryScheduler()
+        # سياق المحادثة للنظام مع ملخص تراكمي لكل مستخدم
+        self.context = ContextBuilder(
+            budget_chars=Config.CONTEXT_BUDGET_CHARS,
+            summary_chars=Config.CONTEXT_SUMMARY_CHARS,
+            turn_chars=Config.CONTEXT_TURN_CHARS,
+            max_users=Config.CONVERSATION_CACHE_SIZE,
+            ttl=Config.CONVERSATION_TTL
+        )
+        # سجل مضغوط بمفاتيح رقمية - يدمج السجلات المكررة (نص/رقم) مرة واحدة عند التحميل
+        with startup_timer.step("المستخدمين"):
+            self.user_stats, rewrite_snapshot = self.create_user_registry()
+        # فهرس الأدوار: القوائم تبقى متوافقة مع ملفات JSON لكن الفحص بزمن ثابت
+        with startup_timer.step("الأدوار"):
+            self.roles = RoleIndex()
+            self.admins = self.roles.load(ROLE_ADMIN, self.load_admins())
+            self.banned_users = self.roles.load(ROLE_BANNED, self.load_banned_users())
+            self.vip_users = self.roles.load(ROLE_VIP, self.load_vip_users())
+        with startup_timer.step("الإعدادات"):
+            self.settings = self.load_settings()
         self.temp_files = {}
-        self.broadcast_messages = {}
+        # مهام البث المحفوظة - الجارية منها تُستأنف عند بدء التشغيل
+        self.broadcast_messages = self.load_broadcast_messages() or {}
+        self.broadcast_messages.setdefault('jobs', {})
+        # محرك البث يعدل المهام تحت هذا القفل، والحفظ ينسخها تحته قبل الكتابة
+        self.broadcast_lock = threading.RLock()
+        self.broadcast_save_lock = threading.Lock()
+        # فهرس التوصيل: البث يمر على القابلين للوصول فقط
+        self.delivery = DeliveryIndex(
+            self.storage.load_delivery_status(),
+            get_user_ids=lambda: self.user_stats.keys(),
+            max_failures=Config.DELIVERY_MAX_FAILURES
+        )
+        
+        # الكتابة المؤجلة: التغييرات تُجمع ويكتبها خيط في دفعات
+        self.write_behind = None
+        if Config.WRITE_BEHIND_ENABLED:
+            self.write_behind = WriteBehindQueue(
+                interval=Config.WRITE_BEHIND_INTERVAL,
+                max_dirty=Config.WRITE_BEHIND_MAX_DIRTY
+            )
+            self.write_behind.register('user_stats_all', self.save_user_stats)
+            self.write_behind.register('user_stats', self.save_user_records, keyed=True)
+            self.write_behind.register('admins', self.save_admins)
+            self.write_behind.register('vip_users', self.save_vip_users)
+            self.write_behind.register('banned_users', self.save_banned_users)
+            self.write_behind.register('settings', self.save_settings)
+            self.write_behind.register('broadcast_messages', self.save_broadcast_messages)
+            self.write_behind.register('delivery_status', self.save_delivery_status)
+            self.write_behind.register('conversations', self.write_conversations, keyed=True)
+        
+        if rewrite_snapshot:
+            self.mark_dirty('user_stats_all')
         
         # التأكد من أن المطور مضاف كمسؤول
         self.ensure_developer_admin()
@@ -65,129 +154,144 @@ class MemorySystem:
         """التأكد من أن المطور مضاف كمسؤول"""
         if DEVELOPER_ID not in self.admins:
             self.admins.append(DEVELOPER_ID)
-            self.save_admins()
+            self.mark_dirty('admins')
             logger.info(f"✅ تم إضافة المطور {DEVELOPER_ID} إلى المشرفين")
         
         if DEVELOPER_ID not in self.vip_users:
             self.vip_users.append(DEVELOPER_ID)
-            self.save_vip_users()
+            self.mark_dirty('vip_users')
             logger.info(f"✅ تم إضافة المطور {DEVELOPER_ID} إلى VIP")
     
-    def get_user_file(self, user_id):
-        return self.workspace / f"user_{user_id}.json"
-    
-    def get_stats_file(self):
-        return self.workspace / "user_stats.json"
-    
-    def get_admins_file(self):
-        return self.workspace / "admins.json"
-    
-    def get_banned_file(self):
-        return self.workspace / "banned_users.json"
-    
-    def get_vip_file(self):
-        return self.workspace / "vip_users.json"
-    
-    def get_settings_file(self):
-        return self.workspace / "bot_settings.json"
+    def create_storage(self):
+        """إنشاء واجهة التخزين المحددة في الإعدادات"""
+        if Config.STORAGE_BACKEND == 'sqlite':
+            from memory import SQLiteStorageBackend
+            logger.info("🗄️ استخدام تخزين SQLite")
+            return SQLiteStorageBackend(self.workspace / Config.SQLITE_DB_NAME)
+        
+        conversation_store = None
+        if Config.CONVERSATION_STORE == 'mmap':
+            from utils.ring_store import RingBufferConversationStore
+            conversation_store = RingBufferConversationStore(
+                self.workspace / "conversations.ring",
+                capacity=Config.MAX_CONVERSATION_LENGTH,
+                message_size=Config.CONVERSATION_RING_MESSAGE_BYTES,
+                initial_slots=Config.CONVERSATION_RING_SLOTS
+            )
+        
+        return JsonStorageBackend(
+            self.workspace,
+            use_journal=Config.STATS_STORAGE_MODE == 'journal',
+            compact_interval=Config.JOURNAL_COMPACT_INTERVAL,
+            compact_threshold=Config.JOURNAL_COMPACT_THRESHOLD,
+            conversation_store=conversation_store
+        )
+    
+    def create_user_registry(self):
+        """التحميل الكسول من فهرس اللقطة إن وجد، وإلا التحميل الكامل - إرجاع (السجل، إعادة كتابة اللقطة)"""
+        if Config.LAZY_USER_LOADING:
+            index = self.storage.open_user_index()
+            if index is not None:
+                user_stats = LazyUserRegistry(index)
+                user_stats.load(self.storage.load_unindexed_user_stats())
+                logger.info(f"📇 فهرس المستخدمين: {len(user_stats)} مستخدم (تحميل عند الطلب)")
+                return user_stats, False
+        
+        user_stats = UserRegistry()
+        merged_records = user_stats.load(self.load_user_stats())
+        # بدون فهرس: كتابة لقطة مفهرسة في الخلفية حتى يكون التشغيل القادم كسولاً
+        needs_index = (Config.LAZY_USER_LOADING and isinstance(self.storage, JsonStorageBackend)
+                       and len(user_stats) > 0)
+        return user_stats, bool(merged_records) or needs_index
+    
+    def start_background_tasks(self):
+        """تشغيل خيوط الحفظ في الخلفية"""
+        if self.write_behind:
+            self.write_behind.start()
+        self.storage.start(lambda: self.user_stats)
+    
+    def mark_dirty(self, kind, key=None):
+        """تعليم البيانات كمتسخة - تُكتب فوراً إذا كانت الكتابة المؤجلة معطلة"""
+        if self.write_behind:
+            self.write_behind.mark_dirty(kind, key)
+        elif kind == 'user_stats':
+            self.save_user_records([key])
+        elif kind == 'user_stats_all':
+            self.save_user_stats()
+        elif kind == 'conversations':
+            self.write_conversations([key])
+        else:
+            getattr(self, f"save_{kind}")()
     
-    def get_broadcast_file(self):
-        return self.workspace / "broadcast_messages.json"
+    def flush(self):
+        """كتابة كل التغييرات المعلقة"""
+        if self.write_behind:
+            self.write_behind.flush()
     
     def load_user_stats(self):
-        stats_file = self.get_stats_file()
-        if stats_file.exists():
-            try:
-                with open(stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        return self.storage.load_user_stats()
     
     def load_admins(self):
-        admins_file = self.get_admins_file()
-        if admins_file.exists():
-            try:
-                with open(admins_file, 'r', encoding='utf-8') as f:
-                    admins = json.load(f)
-                    return admins
-            except:
-                return []
-        return []
+        return self.storage.load_list('admins')
     
     def load_banned_users(self):
-        banned_file = self.get_banned_file()
-        if banned_file.exists():
-            try:
-                with open(banned_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
+        return self.storage.load_list('banned_users')
     
     def load_vip_users(self):
-        vip_file = self.get_vip_file()
-        if vip_file.exists():
-            try:
-                with open(vip_file, 'r', encoding='utf-8') as f:
-                    vip_users = json.load(f)
-                    return vip_users
-            except:
-                return []
-        return []
+        return self.storage.load_list('vip_users')
     
     def load_settings(self):
-        settings_file = self.get_settings_file()
-        if settings_file.exists():
-            try:
-                with open(settings_file, 'r', encoding='utf-8') as f:
-                    loaded_settings = json.load(f)
-                    return {**BOT_SETTINGS, **loaded_settings}
-            except:
-                return BOT_SETTINGS
+        loaded_settings = self.storage.load_settings()
+        if loaded_settings:
+            return {**BOT_SETTINGS, **loaded_settings}
         return BOT_SETTINGS
     
     def load_broadcast_messages(self):
-        broadcast_file = self.get_broadcast_file()
-        if broadcast_file.exists():
-            try:
-                with open(broadcast_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        return self.storage.load_broadcast_messages()
     
     def save_user_stats(self):
-        stats_file = self.get_stats_file()
-        with open(stats_file, 'w', encoding='utf-8') as f:
-            json.dump(self.user_stats, f, ensure_ascii=False, indent=2)
+        self.storage.save_user_stats(self.user_stats)
+    
+    def save_user_records(self, user_ids):
+        """حفظ سجلات مستخدمين محددين فقط"""
+        records = [
+            (user_id, dict(self.user_stats[user_id]))
+            for user_id in user_ids if user_id in self.user_stats
+        ]
+        self.storage.save_user_records(records, self.user_stats)
     
     def save_admins(self):
-        admins_file = self.get_admins_file()
-        with open(admins_file, 'w', encoding='utf-8') as f:
-            json.dump(self.admins, f, ensure_ascii=False, indent=2)
+        self.storage.save_list('admins', self.admins)
     
     def save_banned_users(self):
-        banned_file = self.get_banned_file()
-        with open(banned_file, 'w', encoding='utf-8') as f:
-            json.dump(self.banned_users, f, ensure_ascii=False, indent=2)
+        self.storage.save_list('banned_users', self.banned_users)
     
     def save_vip_users(self):
-        vip_file = self.get_vip_file()
-        with open(vip_file, 'w', encoding='utf-8') as f:
-            json.dump(self.vip_users, f, ensure_ascii=False, indent=2)
+        self.storage.save_list('vip_users', self.vip_users)
     
     def save_settings(self):
-        settings_file = self.get_settings_file()
-        with open(settings_file, 'w', encoding='utf-8') as f:
-            json.dump(self.settings, f, ensure_ascii=False, indent=2)
+        self.storage.save_settings(self.settings)
     
     def save_broadcast_messages(self):
-        broadcast_file = self.get_broadcast_file()
-        with open(broadcast_file, 'w', encoding='utf-8') as f:
-            json.dump(self.broadcast_messages, f, ensure_ascii=False, indent=2)
+        # خيط البث والكتابة المؤجلة قد يحفظان معاً - الكتابة بالترتيب والأحدث آخراً
+        with self.broadcast_save_lock:
+            with self.broadcast_lock:
+                broadcast_messages = copy.deepcopy(self.broadcast_messages)
+            self.storage.save_broadcast_messages(broadcast_messages)
+    
+    def save_delivery_status(self):
+        self.storage.save_delivery_status(self.delivery.snapshot())
+    
+    def record_delivery(self, user_id, error=None):
+        """نتيجة إرسال رسالة من البوت للمستخدم (error = None عند النجاح)"""
+        if error is None:
+            self.delivery.record_success(user_id)
+        else:
+            self.delivery.record_failure(user_id, permanent=is_permanent_failure(error))
+        self.mark_dirty('delivery_status')
     
     def update_user_stats(self, user_id, username, first_name, message_text=""):
+        roles = self.roles.mask(user_id)
         if user_id not in self.user_stats:
             self.user_stats[user_id] = {
                 'username': username,
@@ -196,10 +300,9 @@ class MemorySystem:
                 'first_seen': datetime.now().isoformat(),
                 'last_seen': datetime.now().isoformat(),
                 'last_message': message_text[:100] if message_text else "",
-                'is_admin': user_id in self.admins,
-                'is_banned': user_id in self.banned_users,
-                'is_vip': user_id in self.vip_users,
-                'message_limit': self.settings.get('free_messages', 50),
+                'is_admin': bool(roles & ROLE_ADMIN),
+                'is_banned': bool(roles & ROLE_BANNED),
+                'is_vip': bool(roles & ROLE_VIP),
                 'used_messages': 0,
                 'points': 0
             }
@@ -208,24 +311,27 @@ class MemorySystem:
             self.user_stats[user_id]['last_seen'] = datetime.now().isoformat()
             if message_text:
                 self.user_stats[user_id]['last_message'] = message_text[:100]
-            self.user_stats[user_id]['is_admin'] = user_id in self.admins
-            self.user_stats[user_id]['is_banned'] = user_id in self.banned_users
-            self.user_stats[user_id]['is_vip'] = user_id in self.vip_users
+            self.user_stats[user_id]['is_admin'] = bool(roles & ROLE_ADMIN)
+            self.user_stats[user_id]['is_banned'] = bool(roles & ROLE_BANNED)
+            self.user_stats[user_id]['is_vip'] = bool(roles & ROLE_VIP)
             
-            if not self.is_vip(user_id) and not self.is_admin(user_id):
+            if not roles & (ROLE_VIP | ROLE_ADMIN):
                 self.user_stats[user_id]['used_messages'] += 1
         
-        self.save_user_stats()
+        self.mark_dirty('user_stats', user_id)
+        if self.delivery.record_seen(user_id):
+            self.mark_dirty('delivery_status')
     
     def can_send_message(self, user_id):
-        if self.is_vip(user_id) or self.is_admin(user_id):
+        if self.is_privileged(user_id):
             return True, "VIP"
         
         if user_id not in self.user_stats:
             return True, "جديد"
         
         used = self.user_stats[user_id].get('used_messages', 0)
-        limit = self.user_stats[user_id].get('message_limit', self.settings.get('free_messages', 50))
+        # الحد من الإعدادات عند القراءة - تغييره لا يمر على سجلات كل المستخدمين
+        limit = self.settings.get('free_messages', 50)
         
         if used < limit:
             return True, f"مجاني ({limit - used} متبقي)"
@@ -233,9 +339,8 @@ class MemorySystem:
             return False, f"انتهت الرسائل ({used}/{limit})"
     
     def add_vip(self, user_id, username, first_name):
-        if user_id not in self.vip_users:
-            self.vip_users.append(user_id)
-            self.save_vip_users()
+        if self.roles.add(user_id, ROLE_VIP):
+            self.mark_dirty('vip_users')
             if user_id in self.user_stats:
                 self.user_stats[user_id]['is_vip'] = True
             self.update_user_stats(user_id, username, first_name, "تم ترقيته إلى VIP")
@@ -243,21 +348,19 @@ class MemorySystem:
         return False
     
     def remove_vip(self, user_id):
-        if user_id in self.vip_users and user_id != DEVELOPER_ID:
-            self.vip_users.remove(user_id)
-            self.save_vip_users()
+        if user_id != DEVELOPER_ID and self.roles.remove(user_id, ROLE_VIP):
+            self.mark_dirty('vip_users')
             if user_id in self.user_stats:
                 self.user_stats[user_id]['is_vip'] = False
             return True
         return False
     
     def is_vip(self, user_id):
-        return user_id in self.vip_users
+        return self.roles.has(user_id, ROLE_VIP)
     
     def add_admin(self, user_id, username, first_name):
-        if user_id not in self.admins:
-            self.admins.append(user_id)
-            self.save_admins()
+        if self.roles.add(user_id, ROLE_ADMIN):
+            self.mark_dirty('admins')
             if user_id in self.user_stats:
                 self.user_stats[user_id]['is_admin'] = True
             self.update_user_stats(user_id, username, first_name, "تم ترقيته إلى مشرف")
@@ -265,27 +368,24 @@ class MemorySystem:
         return False
     
     def remove_admin(self, user_id):
-        if user_id in self.admins and user_id != DEVELOPER_ID:
-            self.admins.remove(user_id)
-            self.save_admins()
+        if user_id != DEVELOPER_ID and self.roles.remove(user_id, ROLE_ADMIN):
+            self.mark_dirty('admins')
             if user_id in self.user_stats:
                 self.user_stats[user_id]['is_admin'] = False
             return True
         return False
     
     def ban_user(self, user_id, username, first_name):
-        if user_id not in self.banned_users and user_id != DEVELOPER_ID:
-            self.banned_users.append(user_id)
-            self.save_banned_users()
+        if user_id != DEVELOPER_ID and self.roles.add(user_id, ROLE_BANNED):
+            self.mark_dirty('banned_users')
             if user_id in self.user_stats:
                 self.user_stats[user_id]['is_banned'] = True
             return True
         return False
     
     def unban_user(self, user_id):
-        if user_id in self.banned_users:
-            self.banned_users.remove(user_id)
-            self.save_banned_users()
+        if self.roles.remove(user_id, ROLE_BANNED):
+            self.mark_dirty('banned_users')
             if user_id in self.user_stats:
                 self.user_stats[user_id]['is_banned'] = False
             return True
@@ -294,7 +394,7 @@ class MemorySystem:
     def add_points(self, user_id, points):
         if user_id in self.user_stats:
             self.user_stats[user_id]['points'] = self.user_stats[user_id].get('points', 0) + points
-            self.save_user_stats()
+            self.mark_dirty('user_stats', user_id)
             return True
         return False
     
@@ -303,15 +403,19 @@ class MemorySystem:
             current_points = self.user_stats[user_id].get('points', 0)
             new_points = max(0, current_points - points)
             self.user_stats[user_id]['points'] = new_points
-            self.save_user_stats()
+            self.mark_dirty('user_stats', user_id)
             return True
         return False
     
     def is_admin(self, user_id):
-        return user_id in self.admins
+        return self.roles.has(user_id, ROLE_ADMIN)
     
     def is_banned(self, user_id):
-        return user_id in self.banned_users
+        return self.roles.has(user_id, ROLE_BANNED)
+    
+    def is_privileged(self, user_id):
+        """VIP أو مشرف - فحص واحد للقناع بدلاً من فحصين"""
+        return self.roles.has_any(user_id, ROLE_VIP | ROLE_ADMIN)
     
     def get_user_conversation(self, user_id):
         return self.load_conversation(user_id)
@@ -378,31 +482,54 @@ class MemorySystem:
     
     def update_settings(self, new_settings):
         self.settings.update(new_settings)
-        self.save_settings()
-        
-        new_limit = self.settings.get('free_messages', 50)
-        for user_id in self.user_stats:
-            if not self.is_vip(user_id) and not self.is_admin(user_id):
-                self.user_stats[user_id]['message_limit'] = new_limit
-        self.save_user_stats()
+        self.mark_dirty('settings')
+        if 'required_channel' in new_settings or 'subscription_enabled' in new_settings:
+            self.subscriptions.clear()
     
     def load_conversation(self, user_id):
-        user_file = self.get_user_file(user_id)
-        if user_file.exists():
-            try:
-                with open(user_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"❌ خطأ في تحميل محادثة المستخدم {user_id}: {e}")
-                return []
-        return []
+        conversation = self.conversations.get(user_id)
+        if conversation is None:
+            conversation = self.storage.load_conversation(user_id)
+            self.conversations.set(user_id, conversation)
+            self.schedule_conversation_expiry(user_id, conversation)
+        return list(conversation)
     
     def save_conversation(self, user_id, conversation):
-        self.conversations[user_id] = conversation
-        user_file = self.get_user_file(user_id)
+        if len(conversation) > 15:
+            # الرسائل التي تخرج من المحادثة المحفوظة تبقى في الملخص
+            self.context.fold(user_id, conversation[:-15])
+        conversation = conversation[-15:]
+        self.conversations.set(user_id, conversation)
+        self.schedule_conversation_expiry(user_id, conversation)
+        self.mark_dirty('conversations', user_id)
+    
+    def schedule_conversation_expiry(self, user_id, conversation):
+        """جدولة المحادثة على موعد انتهاء أقدم رسالة فيها"""
+        if not conversation:
+            self.conversation_expiry.cancel(user_id)
+            return
+        oldest = datetime.fromisoformat(conversation[0]['timestamp']).timestamp()
+        self.conversation_expiry.schedule(user_id, oldest + Config.CONVERSATION_TTL)
+    
+    def on_conversation_evicted(self, user_id, conversation):
+        """كتابة المحادثة المُخلاة من الذاكرة إذا لم تُحفظ بعد"""
+        if self.write_behind and self.write_behind.is_dirty('conversations', user_id):
+            self.write_conversation(user_id, conversation)
+    
+    def write_conversations(self, user_ids):
+        """كتابة محادثات المستخدمين إلى التخزين"""
+        for user_id in user_ids:
+            conversation = self.conversations.peek(user_id)
+            # غير موجودة: أُخليت من الذاكرة وكُتبت عند الإخلاء
+            if conversation is not None:
+                self.write_conversation(user_id, conversation)
+    
+    def write_conversation(self, user_id, conversation):
         try:
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(conversation[-15:], f, ensure_ascii=False, indent=2)
+            if not conversation:
+                self.storage.delete_conversation(user_id)
+                return
+            self.storage.save_conversation(user_id, conversation[-15:])
         except Exception as e:
             logger.error(f"❌ خطأ في حفظ محادثة المستخدم {user_id}: {e}")
     
@@ -415,37 +542,46 @@ class MemorySystem:
         })
         self.save_conversation(user_id, conversation)
     
+    def conversation_history(self, user_id):
+        """المحادثة بدون رسائل المستخدم الأخيرة التي لم يُرد عليها بعد"""
+        history = self.load_conversation(user_id)
+        while history and history[-1]['role'] == 'user':
+            history.pop()
+        return history
+    
+    def build_prompt(self, user_id, message):
+        """السؤال مع سياق المحادثة ضمن الميزانية (الرسالة كما هي في أول المحادثة)"""
+        return self.context.build(user_id, self.conversation_history(user_id), message)
+    
     def clear_conversation(self, user_id):
-        self.conversations[user_id] = []
-        user_file = self.get_user_file(user_id)
-        if user_file.exists():
-            user_file.unlink()
+        self.context.forget(user_id)
+        self.conversations.set(user_id, [])
+        self.conversation_expiry.cancel(user_id)
+        self.mark_dirty('conversations', user_id)
     
     def cleanup_old_conversations(self):
         """تنظيف المحادثات القديمة - يحذف كل شيء بعد 10 دقائق"""
         try:
-            current_time = datetime.now()
+            now = time.time()
             deleted_count = 0
-            for user_id in list(self.conversations.keys()):
+            # فقط المحادثات التي حان موعد انتهاء أقدم رسالة فيها
+            for user_id in self.conversation_expiry.pop_due(now):
                 conversation = self.get_user_conversation(user_id)
-                if conversation:
-                    # حذف جميع الرسائل الأقدم من 10 دقائق
-                    time_threshold = current_time - timedelta(minutes=10)
-                    cleaned_conversation = [
-                        msg for msg in conversation 
-                        if datetime.fromisoformat(msg['timestamp']) >= time_threshold
-                    ]
-                    
-                    # إذا لم يتبق أي رسائل، احذف الملف
-                    if not cleaned_conversation:
-                        user_file = self.get_user_file(user_id)
-                        if user_file.exists():
-                            user_file.unlink()
-                            deleted_count += 1
-                        if user_id in self.conversations:
-                            del self.conversations[user_id]
-                    else:
-                        self.save_conversation(user_id, cleaned_conversation)
+                time_threshold = now - Config.CONVERSATION_TTL
+                cleaned_conversation = [
+                    msg for msg in conversation 
+                    if datetime.fromisoformat(msg['timestamp']).timestamp() >= time_threshold
+                ]
+                
+                # إذا لم يتبق أي رسائل، احذف المحادثة
+                if not cleaned_conversation:
+                    if self.storage.delete_conversation(user_id):
+                        deleted_count += 1
+                    self.conversations.pop(user_id)
+                    self.conversation_expiry.cancel(user_id)
+                    self.context.forget(user_id)
+                else:
+                    self.save_conversation(user_id, cleaned_conversation)
             
             if deleted_count > 0:
                 logger.info(f"🧹 تم حذف {deleted_count} محادثة قديمة")
@@ -457,25 +593,145 @@ class MemorySystem:
 memory = MemorySystem()
 
 # نظام الذكاء الاصطناعي
+def create_ai_client():
+    """جلسة مشتركة لكل خادم: إعادة استخدام اتصال TLS بدلاً من مصافحة جديدة لكل رسالة"""
+    return PooledHttpClient(
+        timeout=Config.AI_TIMEOUT,
+        connect_timeout=Config.AI_CONNECT_TIMEOUT,
+        pool_size=Config.AI_POOL_SIZE,
+        max_retries=Config.AI_MAX_RETRIES,
+        backoff_base=Config.AI_BACKOFF_BASE,
+        backoff_max=Config.AI_BACKOFF_MAX,
+        retry_ratio=Config.AI_RETRY_BUDGET_RATIO,
+        failure_threshold=Config.AI_BREAKER_THRESHOLD,
+        reset_timeout=Config.AI_BREAKER_RESET
+    )
+
+def create_ai_router():
+    backends = [
+        Backend(backend['name'], backend['url'], create_ai_client(), alpha=Config.AI_EWMA_ALPHA)
+        for backend in Config.AI_BACKENDS
+    ]
+    return BackendRouter(
+        backends,
+        hedge=Config.AI_HEDGE_ENABLED,
+        hedge_percentile=Config.AI_HEDGE_PERCENTILE,
+        hedge_min_delay=Config.AI_HEDGE_MIN_DELAY,
+        explore_ratio=Config.AI_ROUTER_EXPLORE,
+        max_workers=Config.AI_HEDGE_WORKERS
+    )
+
 class AIService:
-    API_URL = "https://sii3.top/api/grok4.php"
+    # الخوادم وعملاؤها - العملاء غير المتزامنين تُنشأ داخل حلقة الأحداث في وضع asyncio فقط
+    router = create_ai_router()
+    
+    response_cache = ResponseCache(
+        max_size=Config.RESPONSE_CACHE_SIZE,
+        ttl=Config.RESPONSE_CACHE_TTL,
+        max_prompt_length=Config.RESPONSE_CACHE_MAX_PROMPT,
+        enabled=Config.RESPONSE_CACHE_ENABLED
+    )
+    
+    # الردود السريعة: جدول النوايا من الإعدادات (قابل للتعديل من لوحة الإدارة)
+    intents = IntentMatcher(memory.settings.get('intents') or Config.DEFAULT_INTENTS)
+    
+    # تنظيف ردود النظام بمراحل مُعدة مسبقاً
+    pipeline = ResponsePipeline(
+        stages=Config.RESPONSE_PIPELINE_STAGES,
+        filter_keywords=Config.RESPONSE_FILTER_KEYWORDS,
+        max_length=Config.RESPONSE_MAX_LENGTH
+    )
+    
+    # الأسئلة المتطابقة في نفس اللحظة تشترك في طلب واحد للنظام
+    single_flight = SingleFlight()
+    async_single_flight = AsyncSingleFlight()
+    
+    # حد عام للطلبات المتزامنة للنظام مع أولوية VIP والمشرفين ("أولوية في الرد")
+    scheduler = ThreadScheduler(
+        max_concurrent=Config.AI_MAX_CONCURRENT,
+        weights=Config.SCHEDULER_WEIGHTS,
+        max_pending_per_user=Config.SCHEDULER_MAX_PENDING_PER_USER
+    )
+    async_scheduler = AsyncScheduler(
+        max_concurrent=Config.AI_MAX_CONCURRENT,
+        weights=Config.SCHEDULER_WEIGHTS,
+        max_pending_per_user=Config.SCHEDULER_MAX_PENDING_PER_USER
+    )
+    
+    @staticmethod
+    def lane_for(user_id):
+        return LANE_PRIORITY if memory.is_privileged(user_id) else LANE_FREE
+    
+    @staticmethod
+    def check_access(user_id):
+        """رسالة الرفض إذا لم يكن مسموحاً للمستخدم، وإلا None"""
+        can_send, status = memory.can_send_message(user_id)
+        if not can_send:
+            return f"❌ انتهت رسائلك المجانية! ({status})\n\n💎 ترقى إلى VIP للاستخدام غير المحدود!\n/upgrade للترقية"
+        
+        if memory.is_banned(user_id):
+            return "❌ تم حظرك من استخدام موبي."
+        return None
     
     @staticmethod
-    def generate_response(user_id, user_message):
+    def intent_response(intent):
+        return intent['response'].replace('{developer}', DEVELOPER_USERNAME)
+    
+    @staticmethod
+    def local_response(user_id, user_message):
+        """رد محلي بدون اتصال إذا كانت الرسالة نية واضحة (تحية، المطور، VIP)، وإلا None"""
+        intent, confidence = AIService.intents.match(user_message)
+        if intent is None or not intent.get('local'):
+            return None
+        if confidence < intent.get('min_confidence', Config.INTENT_MIN_CONFIDENCE):
+            return None
+        response = AIService.intent_response(intent)
+        memory.add_message(user_id, "assistant", response)
+        logger.info(f"🎯 رد سريع ({intent['name']}, {confidence:.0%}): {response[:50]}...")
+        return response
+    
+    @staticmethod
+    def cached_response(user_id, user_message, bypass_cache=False):
+        """الرد من الذاكرة المؤقتة إن وجد (ويُحفظ في المحادثة)، وإلا None"""
+        # الرد المخزن لا يعرف سياق المحادثة - يُستخدم لأول رسالة فقط
+        if bypass_cache or memory.conversation_history(user_id):
+            return None
+        response = AIService.response_cache.get(user_message)
+        if response is not None:
+            memory.add_message(user_id, "assistant", response)
+            logger.info(f"⚡ رد من الذاكرة المؤقتة: {response[:50]}...")
+        return response
+    
+    @staticmethod
+    def generate_response(user_id, user_message, bypass_cache=False):
         try:
-            can_send, status = memory.can_send_message(user_id)
-            if not can_send:
-                return f"❌ انتهت رسائلك المجانية! ({status})\n\n💎 ترقى إلى VIP للاستخدام غير المحدود!\n/upgrade للترقية"
-            
-            if memory.is_banned(user_id):
-                return "❌ تم حظرك من استخدام موبي."
+            refusal = AIService.check_access(user_id)
+            if refusal:
+                return refusal
             
             memory.add_message(user_id, "user", user_message)
             
+            local = AIService.local_response(user_id, user_message)
+            if local is not None:
+                return local
+            
+            cached = AIService.cached_response(user_id, user_message, bypass_cache)
+            if cached is not None:
+                return cached
+            
             try:
-                response = AIService.api_call(user_message, user_id)
+                with AIService.scheduler.slot(user_id, AIService.lane_for(user_id), user_message,
+                                              timeout=Config.SCHEDULER_WAIT_TIMEOUT) as ticket:
+                    # رسائل المستخدم المدموجة تُرسل كسؤال واحد مع سياق المحادثة
+                    prompt = memory.build_prompt(user_id, "\n".join(ticket.payloads()))
+                    response = AIService.api_call(prompt, user_id)
                 if response and len(response.strip()) > 5:
+                    if prompt == user_message:
+                        AIService.response_cache.set(user_message, response)
                     return response
+            except RequestMerged:
+                # الرد سيصل مع رسالة المستخدم الأحدث
+                return None
             except Exception as api_error:
                 logger.warning(f"⚠️ النظام غير متاح: {api_error}")
             
@@ -486,75 +742,222 @@ class AIService:
             return "⚠️ عذراً، النظام يواجه صعوبات. جرب مرة أخرى!"
     
     @staticmethod
-    def api_call(message, user_id):
+    async def generate_response_async(user_id, user_message, bypass_cache=False):
+        """نفس generate_response لكن الاتصال بالنظام لا يحجز خيطاً أثناء الانتظار"""
         try:
-            api_url = f"{AIService.API_URL}?text={requests.utils.quote(message)}"
-            logger.info(f"🔗 موبي يتصل بالنظام: {api_url}")
+            refusal = AIService.check_access(user_id)
+            if refusal:
+                return refusal
             
-            response = requests.get(api_url, timeout=15)
+            memory.add_message(user_id, "user", user_message)
             
-            if response.status_code == 200:
-                ai_response = response.text.strip()
-                
-                # تنظيف الرد من JSON إذا كان موجوداً
-                if '{"date"' in ai_response and '"response"' in ai_response:
-                    import re
-                    match = re.search(r'"response":"([^"]+)"', ai_response)
-                    if match:
-                        ai_response = match.group(1)
-                
-                # تنظيف الرد من معلومات إضافية
-                lines = ai_response.split('\n')
-                clean_lines = []
-                for line in lines:
-                    if not any(x in line.lower() for x in ['dev:', 'support', 'channel', '@', 'don\'t forget']):
-                        clean_lines.append(line)
-                ai_response = '\n'.join(clean_lines).strip()
-                
-                if not ai_response or ai_response.isspace():
-                    ai_response = "🔄 موبي يفكر... جرب صياغة سؤالك بطريقة أخرى!"
-                
-                ai_response = ai_response.replace('\\n', '\n').replace('\\t', '\t')
-                if len(ai_response) > 2000:
-                    ai_response = ai_response[:2000] + "..."
-                
-                memory.add_message(user_id, "assistant", ai_response)
-                logger.info(f"✅ موبي رد: {ai_response[:100]}...")
-                return ai_response
+            local = AIService.local_response(user_id, user_message)
+            if local is not None:
+                return local
+            
+            cached = AIService.cached_response(user_id, user_message, bypass_cache)
+            if cached is not None:
+                return cached
+            
+            try:
+                async with AIService.async_scheduler.slot(user_id, AIService.lane_for(user_id), user_message,
+                                                          timeout=Config.SCHEDULER_WAIT_TIMEOUT) as ticket:
+                    prompt = memory.build_prompt(user_id, "\n".join(ticket.payloads()))
+                    response = await AIService.api_call_async(prompt, user_id)
+                if response and len(response.strip()) > 5:
+                    if prompt == user_message:
+                        AIService.response_cache.set(user_message, response)
+                    return response
+            except RequestMerged:
+                return None
+            except Exception as api_error:
+                logger.warning(f"⚠️ النظام غير متاح: {api_error}")
+            
+            return AIService.smart_response(user_message, user_id)
+            
+        except Exception as e:
+            logger.error(f"❌ خطأ في النظام: {e}")
+            return "⚠️ عذراً، النظام يواجه صعوبات. جرب مرة أخرى!"
+    
+    @staticmethod
+    def api_call(message, user_id):
+        try:
+            if Config.SINGLE_FLIGHT_ENABLED:
+                raw_text = AIService.single_flight.do(
+                    normalize_arabic(message) or message,
+                    lambda: AIService.fetch(message),
+                    timeout=Config.SINGLE_FLIGHT_TIMEOUT
+                )
             else:
-                raise Exception(f"خطأ في النظام: {response.status_code}")
-                
+                raw_text = AIService.fetch(message)
+            return AIService.process_api_response(raw_text, user_id)
+        
+        except CircuitOpenError:
+            # الرد البديل مباشرة بدون انتظار المهلة
+            raise
         except Exception as e:
             logger.error(f"❌ خطأ في النظام: {e}")
             raise
     
     @staticmethod
-    def smart_response(message, user_id):
-        message_lower = message.lower()
+    async def api_call_async(message, user_id):
+        try:
+            if Config.SINGLE_FLIGHT_ENABLED:
+                raw_text = await AIService.async_single_flight.do(
+                    normalize_arabic(message) or message,
+                    lambda: AIService.fetch_async(message),
+                    timeout=Config.SINGLE_FLIGHT_TIMEOUT
+                )
+            else:
+                raw_text = await AIService.fetch_async(message)
+            return AIService.process_api_response(raw_text, user_id)
+        
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ خطأ في النظام: {e}")
+            raise
+    
+    @staticmethod
+    def fetch(message):
+        """طلب واحد للنظام - إرجاع النص الخام"""
+        return AIService.router.get({'text': message}).text
+    
+    @staticmethod
+    async def fetch_async(message):
+        response = await AIService.router.get_async({'text': message})
+        return response.text
+    
+    @staticmethod
+    def clean_api_response(raw_text):
+        """تنظيف رد النظام (كاملاً أو جزئياً أثناء البث التدريجي)"""
+        return AIService.pipeline.run(raw_text)
+    
+    @staticmethod
+    def preview_api_response(raw_text):
+        """النص الجزئي القابل للعرض - فارغ حتى يبدأ نص الرد داخل JSON"""
+        if not AIService.pipeline.has_response_text(raw_text):
+            return ""
+        return AIService.clean_api_response(raw_text)
+    
+    @staticmethod
+    def process_api_response(raw_text, user_id):
+        """تنظيف رد النظام وحفظه في المحادثة"""
+        ai_response = AIService.clean_api_response(raw_text)
+        
+        if not ai_response or ai_response.isspace():
+            ai_response = "🔄 موبي يفكر... جرب صياغة سؤالك بطريقة أخرى!"
+        
+        memory.add_message(user_id, "assistant", ai_response)
+        logger.info(f"✅ موبي رد: {ai_response[:100]}...")
+        return ai_response
+    
+    @staticmethod
+    def generate_response_stream(user_id, user_message):
+        """مولد: نصوص جزئية (دوال تعيد النص المنظف عند الطلب) أثناء وصول الرد ثم النص النهائي كآخر عنصر"""
+        refusal = AIService.check_access(user_id)
+        if refusal:
+            yield refusal
+            return
+        
+        memory.add_message(user_id, "user", user_message)
+        
+        local = AIService.local_response(user_id, user_message)
+        if local is not None:
+            yield local
+            return
+        
+        cached = AIService.cached_response(user_id, user_message)
+        if cached is not None:
+            yield cached
+            return
         
-        responses = {
-            'مرحبا': 'أهلاً! أنا موبي 🤖! كيف يمكنني مساعدتك؟ 💫',
-            'السلام عليكم': 'وعليكم السلام ورحمة الله وبركاته! موبي جاهز لخدمتك. 🌟',
-            'شكرا': 'العفو! دائماً سعيد بمساعدتك. 😊',
-            'اسمك': 'أنا موبي! 🤖 المساعد الذكي!',
-            'من صنعك': f'السيد موبي - {DEVELOPER_USERNAME} 👑',
-            'من صنعك؟': f'السيد موبي - {DEVELOPER_USERNAME} 👑',
-            'صانعك': f'السيد موبي - {DEVELOPER_USERNAME} 👑',
-            'مطورك': f'السيد موبي - {DEVELOPER_USERNAME} 👑',
-            'مين صنعك': f'السيد موبي - {DEVELOPER_USERNAME} 👑',
-            'كيف حالك': 'أنا بخير الحمدلله! جاهز لمساعدتك. ⚡',
-            'مساعدة': 'موبي يمكنه مساعدتك في:\n• الإجابة على الأسئلة\n• الشرح والتوضيح\n• الكتابة والإبداع\n• حل المشكلات\nما الذي تحتاج؟ 🎯',
-            'مطور': f'السيد موبي - {DEVELOPER_USERNAME} 👑',
-            'موبي': 'نعم! أنا موبي هنا! 🤖 كيف يمكنني مساعدتك؟',
-            'vip': '🌟 نظام VIP يمنحك صلاحيات متقدمة! تواصل مع المطور.',
-            'بريميوم': '💎 اشترك في البريميوم للوصول غير المحدود!',
-            'ترقية': f'💎 للترقية إلى VIP تواصل مع {DEVELOPER_USERNAME}',
-        }
+        raw_text = ""
+        complete = False
+        try:
+            with AIService.scheduler.slot(user_id, AIService.lane_for(user_id), user_message,
+                                          timeout=Config.SCHEDULER_WAIT_TIMEOUT) as ticket:
+                prompt = memory.build_prompt(user_id, "\n".join(ticket.payloads()))
+                for chunk in AIService.router.stream({'text': prompt}):
+                    raw_text += chunk
+                    # التنظيف مؤجل حتى يحين موعد التعديل - لا مرور على النص كله مع كل جزء
+                    yield functools.partial(AIService.preview_api_response, raw_text)
+                complete = prompt == user_message
+        except RequestMerged:
+            return
+        except Exception as api_error:
+            logger.warning(f"⚠️ النظام غير متاح: {api_error}")
+        
+        yield AIService.finish_stream(user_id, user_message, raw_text, complete)
+    
+    @staticmethod
+    async def generate_response_stream_async(user_id, user_message):
+        refusal = AIService.check_access(user_id)
+        if refusal:
+            yield refusal
+            return
         
-        for key, response in responses.items():
-            if key in message_lower:
-                memory.add_message(user_id, "assistant", response)
+        memory.add_message(user_id, "user", user_message)
+        
+        local = AIService.local_response(user_id, user_message)
+        if local is not None:
+            yield local
+            return
+        
+        cached = AIService.cached_response(user_id, user_message)
+        if cached is not None:
+            yield cached
+            return
+        
+        raw_text = ""
+        complete = False
+        try:
+            async with AIService.async_scheduler.slot(user_id, AIService.lane_for(user_id), user_message,
+                                                      timeout=Config.SCHEDULER_WAIT_TIMEOUT) as ticket:
+                prompt = memory.build_prompt(user_id, "\n".join(ticket.payloads()))
+                async for chunk in AIService.router.stream_async({'text': prompt}):
+                    raw_text += chunk
+                    # التنظيف مؤجل حتى يحين موعد التعديل - لا مرور على النص كله مع كل جزء
+                    yield functools.partial(AIService.preview_api_response, raw_text)
+                complete = prompt == user_message
+        except RequestMerged:
+            return
+        except Exception as api_error:
+            logger.warning(f"⚠️ النظام غير متاح: {api_error}")
+        
+        yield AIService.finish_stream(user_id, user_message, raw_text, complete)
+    
+    @staticmethod
+    def finish_stream(user_id, user_message, raw_text, complete):
+        """النص النهائي للبث: الرد الكامل (أو ما وصل قبل الانقطاع) وإلا الرد البديل - complete يعني قابل للتخزين المؤقت"""
+        if raw_text.strip():
+            response = AIService.process_api_response(raw_text, user_id)
+            if len(response.strip()) > 5:
+                if complete:
+                    AIService.response_cache.set(user_message, response)
                 return response
+        return AIService.smart_response(user_message, user_id)
+    
+    @staticmethod
+    def get_stats():
+        """عدادات الاتصال بالنظام: الخوادم والطلبات الاحتياطية والدمج والجدولة"""
+        stats = AIService.router.stats()
+        stats['postprocess'] = AIService.pipeline.stats()
+        stats['single_flight'] = AIService.single_flight.stats()
+        stats['scheduler'] = AIService.scheduler.stats()
+        if AIService.router.async_ready:
+            stats['async_single_flight'] = AIService.async_single_flight.stats()
+            stats['async_scheduler'] = AIService.async_scheduler.stats()
+        return stats
+    
+    @staticmethod
+    def smart_response(message, user_id):
+        # النظام غير متاح: أي نية في الرسالة أفضل من الرد العام - بترتيب الجدول كما كان
+        intent = AIService.intents.first(message)
+        if intent is not None:
+            response = AIService.intent_response(intent)
+            memory.add_message(user_id, "assistant", response)
+            return response
         
         import random
         fallback_responses = [
@@ -572,14 +975,21 @@ def check_subscription(user_id):
     if not memory.settings.get('required_channel') or not memory.settings.get('subscription_enabled', False):
         return True
         
+    key = (memory.settings['required_channel'], user_id)
+    subscribed = memory.subscriptions.get(key)
+    if subscribed is not None:
+        return subscribed
+        
     try:
         chat_member = bot.get_chat_member(memory.settings['required_channel'], user_id)
-        if chat_member.status in ['member', 'administrator', 'creator']:
-            return True
-        return False
+        subscribed = chat_member.status in ['member', 'administrator', 'creator']
     except Exception as e:
+        # الخطأ لا يُخزن: قد يكون عابراً
         logger.error(f"❌ خطأ في التحقق من الاشتراك: {e}")
         return False
+    
+    memory.subscriptions.set(key, subscribed, ttl=None if subscribed else Config.SUBSCRIPTION_CACHE_NEGATIVE_TTL)
+    return subscribed
 
 def create_subscription_button():
     if not memory.settings.get('required_channel') or not memory.settings.get('subscription_enabled', False):
@@ -639,10 +1049,12 @@ def create_settings_menu():
     subscription_btn = InlineKeyboardButton("🔐 الاشتراك الإجباري", callback_data="settings_subscription")
     messages_btn = InlineKeyboardButton("💬 عدد الرسائل", callback_data="settings_messages")
     welcome_btn = InlineKeyboardButton("🎉 الترحيب", callback_data="settings_welcome")
+    intents_btn = InlineKeyboardButton("🧠 الردود السريعة", callback_data="settings_intents")
     back_btn = InlineKeyboardButton("🔙 رجوع", callback_data="admin_back")
     
     keyboard.add(channel_btn, subscription_btn)
     keyboard.add(messages_btn, welcome_btn)
+    keyboard.add(intents_btn)
     keyboard.add(back_btn)
     
     return keyboard
@@ -678,6 +1090,20 @@ def create_points_menu():
     
     return keyboard
 
+def create_intents_menu():
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    
+    add_btn = InlineKeyboardButton("➕ إضافة/تعديل", callback_data="intents_add")
+    delete_btn = InlineKeyboardButton("🗑️ حذف", callback_data="intents_delete")
+    reset_btn = InlineKeyboardButton("♻️ الافتراضي", callback_data="intents_reset")
+    back_btn = InlineKeyboardButton("🔙 رجوع", callback_data="admin_settings")
+    
+    keyboard.add(add_btn, delete_btn)
+    keyboard.add(reset_btn)
+    keyboard.add(back_btn)
+    
+    return keyboard
+
 def create_welcome_menu():
     keyboard = InlineKeyboardMarkup(row_width=2)
     
@@ -695,18 +1121,18 @@ def create_welcome_menu():
     
     return keyboard
 
-def require_subscription(func):
-    def wrapper(message):
-        if not memory.settings.get('required_channel') or not memory.settings.get('subscription_enabled', False):
-            return func(message)
-            
-        user_id = message.from_user.id
-        
-        if memory.is_vip(user_id) or memory.is_admin(user_id):
-            return func(message)
+def ensure_subscription(message):
+    """True إذا كان مسموحاً للمستخدم بالمتابعة، وإلا إرسال طلب الاشتراك"""
+    if not memory.settings.get('required_channel') or not memory.settings.get('subscription_enabled', False):
+        return True
         
-        if not check_subscription(user_id):
-            subscription_msg = f"""
+    user_id = message.from_user.id
+    
+    if memory.is_privileged(user_id):
+        return True
+    
+    if not check_subscription(user_id):
+        subscription_msg = f"""
 📢 **اشتراك إجباري مطلوب!**
 
 🔐 للوصول إلى موبي، يجب الاشتراك في قناتنا أولاً:
@@ -714,15 +1140,20 @@ def require_subscription(func):
 {memory.settings['required_channel']}
 
 ✅ بعد الاشتراك، اضغط على زر "تحقق من الاشتراك"
-            """
-            bot.send_message(
-                message.chat.id, 
-                subscription_msg, 
-                reply_markup=create_subscription_button(),
-                parse_mode='Markdown'
-            )
-            return
-        return func(message)
+        """
+        bot.send_message(
+            message.chat.id, 
+            subscription_msg, 
+            reply_markup=create_subscription_button(),
+            parse_mode='Markdown'
+        )
+        return False
+    return True
+
+def require_subscription(func):
+    def wrapper(message):
+        if ensure_subscription(message):
+            return func(message)
     return wrapper
 
 def send_welcome_message(chat_id, user_id):
@@ -778,6 +1209,7 @@ def handle_start_type(chat_id, user_id, force_text=False):
 /upgrade - ترقية إلى VIP
 /memory - إدارة الذاكرة
 /new - محادثة جديدة
+/fresh - رد جديد بدون الذاكرة المؤقتة
 /developer - المطور
 
 👑 **المطور:** {DEVELOPER_USERNAME}
@@ -827,6 +1259,7 @@ def handle_help(message):
 /upgrade - ترقية إلى VIP
 /memory - إدارة الذاكرة
 /new - بدء محادثة جديدة
+/fresh سؤالك - رد جديد من النظام بدل الرد المحفوظ
 /developer - معلومات المطور
 
 💎 **نظام VIP:**
@@ -917,6 +1350,31 @@ def handle_new(message):
     memory.clear_conversation(user_id)
     bot.send_message(message.chat.id, "🔄 تم بدء محادثة جديدة! يمكنك البدء بالحديث الآن.")
 
+FRESH_USAGE = "💡 اكتب سؤالك بعد الأمر: /fresh ما هو الذكاء الاصطناعي؟"
+
+def fresh_question(message):
+    parts = message.text.split(maxsplit=1)
+    return parts[1].strip() if len(parts) > 1 else ""
+
+@bot.message_handler(commands=['fresh'])
+@require_subscription
+def handle_fresh(message):
+    """/fresh سؤال - نفس محادثة الذكاء الاصطناعي لكن الرد من النظام وليس من الذاكرة المؤقتة"""
+    question = fresh_question(message)
+    if not question:
+        bot.send_message(message.chat.id, FRESH_USAGE)
+        return
+    
+    refusal = check_ai_message(message)
+    if refusal:
+        bot.send_message(message.chat.id, refusal)
+        return
+    
+    bot.send_chat_action(message.chat.id, 'typing')
+    response = AIService.generate_response(message.from_user.id, question, bypass_cache=True)
+    if response:
+        bot.send_message(message.chat.id, response)
+
 @bot.message_handler(commands=['memory'])
 @require_subscription
 def handle_memory(message):
@@ -938,6 +1396,46 @@ def handle_memory(message):
     """
     bot.send_message(message.chat.id, memory_text, parse_mode='Markdown')
 
+@bot.message_handler(commands=['cache'])
+def handle_cache(message):
+    """ذاكرة الردود المؤقتة للمشرفين: /cache - /cache flush - /cache on - /cache off"""
+    if not memory.is_admin(message.from_user.id):
+        bot.send_message(message.chat.id, "❌ ليس لديك صلاحية!")
+        return
+    
+    cache = AIService.response_cache
+    action = message.text.split()[1].lower() if len(message.text.split()) > 1 else ""
+    if action == 'flush':
+        count = cache.flush()
+        bot.send_message(message.chat.id, f"🧹 تم مسح {count} رد من الذاكرة المؤقتة")
+        return
+    if action in ('on', 'off'):
+        cache.enabled = action == 'on'
+        bot.send_message(message.chat.id, f"⚡ الذاكرة المؤقتة: {'🟢 مفعلة' if cache.enabled else '🔴 معطلة'}")
+        return
+    
+    stats = cache.stats()
+    total = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / total * 100 if total else 0
+    top_entries = "\n".join(f"• {entry.prompt[:40]} ({entry.hits})" for entry in cache.top()) or "لا يوجد"
+    
+    cache_text = f"""
+⚡ ذاكرة الردود المؤقتة
+
+الحالة: {'🟢 مفعلة' if stats['enabled'] else '🔴 معطلة'}
+الردود المحفوظة: {stats['size']}/{stats['max_size']}
+نسبة الإصابة: {hit_rate:.1f}% ({stats['hits']}/{total})
+المحذوفة: {stats['evictions']}
+
+الأكثر استخداماً:
+{top_entries}
+
+/cache flush - مسح
+/cache off - تعطيل
+/cache on - تفعيل
+    """
+    bot.send_message(message.chat.id, cache_text)
+
 # حالات المستخدم
 broadcast_state = {}
 admin_state = {}
@@ -947,38 +1445,90 @@ settings_state = {}
 points_state = {}
 send_user_state = {}
 welcome_state = {}
+intent_state = {}
+
+def broadcast_payload(message, broadcast_type):
+    """محتوى البث القابل للحفظ (نص أو معرف ملف) - None إذا لم يطابق النوع المحدد"""
+    if broadcast_type == 'text' and message.text:
+        return {'text': message.text}
+    if broadcast_type == 'photo' and message.photo:
+        return {'file_id': message.photo[-1].file_id, 'caption': message.caption}
+    if broadcast_type in ('video', 'audio', 'document'):
+        media = getattr(message, broadcast_type, None)
+        if media:
+            return {'file_id': media.file_id, 'caption': message.caption}
+    return None
+
+def deliver_broadcast(chat_id, job):
+    """إرسال محتوى البث لمستخدم واحد - يُستدعى من مرسلي محرك البث"""
+    payload = job['payload']
+    caption = payload.get('caption') or "📢 إشعار من الإدارة"
+    if job['kind'] == 'text':
+        bot.send_message(chat_id, f"📢 إشعار من الإدارة:\n\n{payload['text']}")
+    elif job['kind'] == 'photo':
+        bot.send_photo(chat_id, payload['file_id'], caption=caption)
+    elif job['kind'] == 'video':
+        bot.send_video(chat_id, payload['file_id'], caption=caption)
+    elif job['kind'] == 'audio':
+        bot.send_audio(chat_id, payload['file_id'], caption=caption)
+    elif job['kind'] == 'document':
+        bot.send_document(chat_id, payload['file_id'], caption=caption)
+
+def broadcast_recipients(job):
+    # القابلون للوصول فقط، مع تخطي المرسل
+    return [chat_id for chat_id in memory.delivery.reachable_ids() if chat_id != job['admin_id']]
+
+def broadcast_progress_text(job):
+    done = job['sent'] + job['failed']
+    percent = done / job['total'] * 100 if job['total'] else 100
+    status = {BROADCAST_RUNNING: '⏳ جارٍ الإرسال', BROADCAST_DONE: '✅ اكتمل'}.get(job['status'], '⛔ أُوقف')
+    return f"""
+📢 البث {job['id']}
+
+الحالة: {status}
+التقدم: {done}/{job['total']} ({percent:.0f}%)
+✅ نجح: {job['sent']}
+❌ فشل: {job['failed']}
+    """
+
+def report_broadcast(job):
+    """تحديث رسالة التقدم عند المشرف (مع زر الإيقاف أثناء الإرسال)"""
+    keyboard = None
+    if job['status'] == BROADCAST_RUNNING:
+        keyboard = InlineKeyboardMarkup()
+        keyboard.add(InlineKeyboardButton("⛔ إيقاف البث", callback_data=f"cancel_broadcast_{job['id']}"))
+    if job.get('progress_message_id'):
+        bot.edit_message_text(broadcast_progress_text(job), job['admin_id'], job['progress_message_id'], reply_markup=keyboard)
+    else:
+        sent = bot.send_message(job['admin_id'], broadcast_progress_text(job), reply_markup=keyboard)
+        with memory.broadcast_lock:
+            job['progress_message_id'] = sent.message_id
+        memory.mark_dirty('broadcast_messages')
+
+broadcaster = BroadcastEngine(
+    memory.broadcast_messages['jobs'],
+    send=deliver_broadcast,
+    recipients=broadcast_recipients,
+    # حفظ متزامن وليس عبر الكتابة المؤجلة: التوقف المفاجئ يعيد دفعة واحدة على الأكثر
+    save=memory.save_broadcast_messages,
+    report=report_broadcast,
+    on_result=memory.record_delivery,
+    lock=memory.broadcast_lock,
+    rate=Config.BROADCAST_RATE,
+    workers=Config.BROADCAST_WORKERS,
+    batch_size=Config.BROADCAST_BATCH_SIZE,
+    report_interval=Config.BROADCAST_REPORT_INTERVAL
+)
 
 def send_broadcast_message(user_id, message, broadcast_type):
-    """إرسال البث لجميع المستخدمين"""
-    success_count = 0
-    total_users = len(memory.user_stats)
-    failed_users = []
-    
-    for chat_id in memory.user_stats.keys():
-        if chat_id == user_id:  # تخطي المرسل
-            continue
-        try:
-            if broadcast_type == 'text' and message.text:
-                bot.send_message(chat_id, f"📢 إشعار من الإدارة:\n\n{message.text}")
-            elif broadcast_type == 'photo' and message.photo:
-                bot.send_photo(chat_id, message.photo[-1].file_id, caption=message.caption or "📢 إشعار من الإدارة")
-            elif broadcast_type == 'video' and message.video:
-                bot.send_video(chat_id, message.video.file_id, caption=message.caption or "📢 إشعار من الإدارة")
-            elif broadcast_type == 'audio' and message.audio:
-                bot.send_audio(chat_id, message.audio.file_id, caption=message.caption or "📢 إشعار من الإدارة")
-            elif broadcast_type == 'document' and message.document:
-                bot.send_document(chat_id, message.document.file_id, caption=message.caption or "📢 إشعار من الإدارة")
-            success_count += 1
-        except Exception as e:
-            failed_users.append(chat_id)
-            continue
-    
-    result_text = f"✅ تم إرسال البث إلى {success_count}/{total_users} مستخدم"
-    if failed_users:
-        result_text += f"\n❌ فشل الإرسال لـ {len(failed_users)} مستخدم"
-    
-    bot.send_message(user_id, result_text)
+    """بدء البث في الخلفية - المعالج يعود فوراً والتقدم يظهر في رسالة تتحدث"""
     broadcast_state.pop(user_id, None)
+    payload = broadcast_payload(message, broadcast_type)
+    if payload is None:
+        bot.send_message(user_id, "❌ أرسل المحتوى المناسب للنوع المحدد")
+        return
+    
+    broadcaster.submit(user_id, broadcast_type, payload)
 
 @bot.message_handler(func=lambda message: True, content_types=['text', 'photo', 'video', 'audio', 'document'])
 @require_subscription  
@@ -1052,27 +1602,14 @@ def handle_all_messages(message):
             welcome_state.pop(user_id, None)
             return
         
+        # تعديل الردود السريعة
+        if user_id in intent_state:
+            save_intent_edit(user_id, intent_state.pop(user_id), message.text or "")
+            return
+        
         # معالجة الرسائل العادية (نص فقط للذكاء الاصطناعي)
         if message.content_type == 'text':
-            memory.update_user_stats(user_id, message.from_user.username, message.from_user.first_name, message.text)
-            
-            if memory.is_banned(user_id):
-                bot.send_message(message.chat.id, "❌ تم حظرك من استخدام البوت.")
-                return
-            
-            can_send, status = memory.can_send_message(user_id)
-            if not can_send:
-                bot.send_message(message.chat.id, f"❌ انتهت رسائلك المجانية! ({status})\n\n💎 ترقى إلى VIP للاستخدام غير المحدود!\n/upgrade للترقية")
-                return
-            
-            bot.send_chat_action(message.chat.id, 'typing')
-            
-            response = AIService.generate_response(user_id, message.text)
-            
-            if response:
-                bot.send_message(message.chat.id, response)
-            
-            logger.info(f"💬 معالجة رسالة من {message.from_user.first_name}")
+            handle_ai_message(message)
         else:
             # للوسائط الأخرى، نرسل رسالة تفاعلية فقط
             bot.send_message(message.chat.id, "📁 تلقيت ملفك! للاستفادة الكاملة من موبي، أرسل رسائل نصية للتفاعل مع الذكاء الاصطناعي. 🤖")
@@ -1080,12 +1617,105 @@ def handle_all_messages(message):
     except Exception as e:
         logger.error(f"❌ خطأ في المعالجة: {e}")
 
+def has_pending_state(user_id):
+    """هل ينتظر المشرف إدخالاً (بث، إرسال لمستخدم، ترحيب)"""
+    return (user_id in broadcast_state or user_id in send_user_state or user_id in welcome_state
+            or user_id in intent_state)
+
+def check_ai_message(message):
+    """تحديث الإحصائيات والتحقق قبل الذكاء الاصطناعي - رسالة الرفض أو None"""
+    user_id = message.from_user.id
+    memory.update_user_stats(user_id, message.from_user.username, message.from_user.first_name, message.text)
+    
+    if memory.is_banned(user_id):
+        return "❌ تم حظرك من استخدام البوت."
+    
+    can_send, status = memory.can_send_message(user_id)
+    if not can_send:
+        return f"❌ انتهت رسائلك المجانية! ({status})\n\n💎 ترقى إلى VIP للاستخدام غير المحدود!\n/upgrade للترقية"
+    return None
+
+def handle_ai_message(message):
+    refusal = check_ai_message(message)
+    if refusal:
+        bot.send_message(message.chat.id, refusal)
+        return
+    
+    bot.send_chat_action(message.chat.id, 'typing')
+    
+    if Config.STREAMING_REPLIES:
+        stream_ai_reply(message)
+        return
+    
+    response = AIService.generate_response(message.from_user.id, message.text)
+    
+    if response:
+        bot.send_message(message.chat.id, response)
+    
+    logger.info(f"💬 معالجة رسالة من {message.from_user.first_name}")
+
+def stream_ai_reply(message):
+    """الرد التدريجي: أول جزء يُرسل فوراً ثم تُعدل نفس الرسالة حتى يكتمل الرد"""
+    reply = StreamingReply(bot, message.chat.id, min_interval=Config.STREAM_EDIT_INTERVAL)
+    text = ""
+    for text in AIService.generate_response_stream(message.from_user.id, message.text):
+        reply.update(text)
+    reply.finish(text)
+    logger.info(f"💬 معالجة رسالة من {message.from_user.first_name} ({reply.edits} تعديل)")
+
+async def stream_ai_reply_async(message, ptb_bot):
+    reply = AsyncStreamingReply(ptb_bot, message.chat.id, min_interval=Config.STREAM_EDIT_INTERVAL)
+    text = ""
+    async for text in AIService.generate_response_stream_async(message.from_user.id, message.text):
+        await reply.update(text)
+    await reply.finish(text)
+    logger.info(f"💬 معالجة رسالة من {message.from_user.first_name} ({reply.edits} تعديل)")
+
+async def handle_ai_message_async(message, ptb_bot):
+    """نفس handle_ai_message عبر bot غير المتزامن من python-telegram-bot"""
+    refusal = check_ai_message(message)
+    if refusal:
+        await ptb_bot.send_message(message.chat.id, refusal)
+        return
+    
+    await ptb_bot.send_chat_action(message.chat.id, 'typing')
+    
+    if Config.STREAMING_REPLIES:
+        await stream_ai_reply_async(message, ptb_bot)
+        return
+    
+    response = await AIService.generate_response_async(message.from_user.id, message.text)
+    
+    if response:
+        await ptb_bot.send_message(message.chat.id, response)
+    
+    logger.info(f"💬 معالجة رسالة من {message.from_user.first_name}")
+
+async def handle_fresh_async(message, ptb_bot):
+    """نفس handle_fresh عبر العميل غير المتزامن وقاطعه"""
+    question = fresh_question(message)
+    if not question:
+        await ptb_bot.send_message(message.chat.id, FRESH_USAGE)
+        return
+    
+    refusal = check_ai_message(message)
+    if refusal:
+        await ptb_bot.send_message(message.chat.id, refusal)
+        return
+    
+    await ptb_bot.send_chat_action(message.chat.id, 'typing')
+    response = await AIService.generate_response_async(message.from_user.id, question, bypass_cache=True)
+    if response:
+        await ptb_bot.send_message(message.chat.id, response)
+
 # معالجة الأزرار
 @bot.callback_query_handler(func=lambda call: True)
 def handle_callback(call):
     user_id = call.from_user.id
     
     if call.data == "check_subscription":
+        # المستخدم يقول إنه اشترك الآن: تحقق فعلي بدل الحالة المخزنة
+        memory.subscriptions.pop((memory.settings.get('required_channel'), user_id))
         if check_subscription(user_id):
             bot.answer_callback_query(call.id, "✅ مشترك! يمكنك استخدام البوت الآن.")
             bot.delete_message(call.message.chat.id, call.message.message_id)
@@ -1110,7 +1740,7 @@ def handle_callback(call):
         return
     
     elif call.data == "admin_stats":
-        show_admin_stats(call)
+        show_admin_stats(bot, call, memory)
     elif call.data == "admin_users":
         show_users_list(call)
     elif call.data == "admin_manage":
@@ -1131,12 +1761,33 @@ def handle_callback(call):
         show_admin_panel(call)
     
     # أزرار البث
+    elif call.data.startswith("cancel_broadcast_"):
+        if broadcaster.cancel(call.data[len("cancel_broadcast_"):]):
+            bot.answer_callback_query(call.id, "⛔ سيتوقف البث بعد الدفعة الحالية")
+        else:
+            bot.answer_callback_query(call.id, "ℹ️ البث انتهى بالفعل")
     elif call.data.startswith("broadcast_"):
         broadcast_type = call.data.split("_")[1]
         broadcast_state[user_id] = {'type': broadcast_type}
         bot.send_message(user_id, f"📢 أرسل {'النص' if broadcast_type == 'text' else 'الصورة' if broadcast_type == 'photo' else 'الفيديو' if broadcast_type == 'video' else 'الصوت' if broadcast_type == 'audio' else 'الملف'} الذي تريد بثه:")
         bot.answer_callback_query(call.id, f"📢 بث {broadcast_type}")
     
+    # أزرار الردود السريعة
+    elif call.data == "settings_intents":
+        show_intents_menu(call)
+    elif call.data == "intents_reset":
+        save_intents(Config.DEFAULT_INTENTS)
+        bot.answer_callback_query(call.id, "♻️ تمت استعادة الردود الافتراضية")
+        show_intents_menu(call)
+    elif call.data in ("intents_add", "intents_delete"):
+        action = call.data.split("_")[1]
+        intent_state[user_id] = action
+        if action == 'add':
+            bot.send_message(user_id, "🧠 أرسل النية بهذا الشكل:\nالاسم | كلمة، كلمة | الرد\n\n({developer} يُستبدل بمعرف المطور - نفس الاسم يستبدل النية الموجودة)")
+        else:
+            bot.send_message(user_id, "🗑️ أرسل اسم النية التي تريد حذفها:")
+        bot.answer_callback_query(call.id, "🧠 الردود السريعة")
+    
     # أزرار الترحيب
     elif call.data == "settings_welcome":
         show_welcome_menu(call)
@@ -1151,6 +1802,51 @@ def handle_callback(call):
             bot.send_message(user_id, f"🎉 أرسل {'النص' if welcome_type == 'text' else 'الصورة' if welcome_type == 'photo' else 'الفيديو' if welcome_type == 'video' else 'الصوت'} الترحيبي:")
             bot.answer_callback_query(call.id, f"🎉 ترحيب {welcome_type}")
 
+def show_settings_menu(call):
+    bot.edit_message_text("⚙️ الإعدادات\n\nاختر الإعداد الذي تريد تعديله:", call.message.chat.id, call.message.message_id,
+                        reply_markup=create_settings_menu())
+    bot.answer_callback_query(call.id, "⚙️ الإعدادات")
+
+def show_intents_menu(call):
+    lines = [
+        f"{'⚡' if intent.get('local') else '💤'} {intent['name']}: {'، '.join(intent.get('keywords', [])[:4])}"
+        for intent in AIService.intents.table()
+    ]
+    intents_text = "🧠 الردود السريعة (تُرد بدون اتصال بالنظام)\n\n" + ("\n".join(lines) or "لا يوجد")
+    bot.edit_message_text(intents_text[:4000], call.message.chat.id, call.message.message_id,
+                        reply_markup=create_intents_menu())
+    bot.answer_callback_query(call.id, "🧠 الردود السريعة")
+
+def save_intents(intents):
+    """حفظ جدول النوايا في الإعدادات وإعادة بناء آلة المطابقة"""
+    memory.update_settings({'intents': intents})
+    AIService.intents.load(intents)
+
+def save_intent_edit(user_id, action, text):
+    try:
+        intents = AIService.intents.table()
+        if action == 'delete':
+            remaining = [intent for intent in intents if intent['name'] != text.strip()]
+            if len(remaining) == len(intents):
+                bot.send_message(user_id, "❌ لا توجد نية بهذا الاسم")
+                return
+            save_intents(remaining)
+            bot.send_message(user_id, f"✅ تم حذف النية: {text.strip()}")
+            return
+        
+        parts = [part.strip() for part in text.split("|", 2)]
+        keywords = [keyword.strip() for keyword in parts[1].replace("،", ",").split(",") if keyword.strip()] if len(parts) == 3 else []
+        if len(parts) != 3 or not parts[0] or not keywords or not parts[2]:
+            bot.send_message(user_id, "❌ الشكل غير صحيح! مثال:\nتحية | مرحبا، اهلا | أهلاً بك! 👋")
+            return
+        intent = {"name": parts[0], "keywords": keywords, "response": parts[2], "local": True}
+        intents = [existing for existing in intents if existing['name'] != intent['name']] + [intent]
+        save_intents(intents)
+        bot.send_message(user_id, f"✅ تم حفظ النية: {intent['name']} ({len(keywords)} كلمة)")
+    except Exception as e:
+        logger.error(f"❌ خطأ في حفظ الردود السريعة: {e}")
+        bot.send_message(user_id, f"❌ خطأ في الحفظ: {e}")
+
 def show_welcome_menu(call):
     welcome_content = memory.settings.get('welcome_content', {})
     current_type = welcome_content.get('type', 'text')
@@ -1194,37 +1890,80 @@ def keep_alive():
             # اختبار بسيط للحفاظ على الاتصال
             bot.get_me()
             logger.info("🫀 البوت حي ويعمل...")
+            logger.info(f"📡 اتصال النظام: {AIService.get_stats()}")
+            if isinstance(bot.worker_pool, ChatShardedExecutor):
+                logger.info(f"🧵 المعالجات: {bot.worker_pool.stats()}")
+            if webhook_server is not None:
+                logger.info(f"📥 webhook: {webhook_server.stats()}")
             time.sleep(300)
         except Exception as e:
             logger.error(f"❌ خطأ في الحفاظ على الحياة: {e}")
             time.sleep(60)
 
+def run_health_probes():
+    """اختبار النظام في الخلفية حتى لا يؤخر بدء الاستماع للرسائل"""
+    # عبر الجلسة المشتركة لكل خادم حتى يبقى الاتصال جاهزاً لأول رسالة
+    for backend in AIService.router.backends:
+        started = time.perf_counter()
+        try:
+            response = backend.client.get(backend.url, params={'text': 'test'}, timeout=10)
+            logger.info(f"✅ النظام يعمل ({backend.name}): {response.status_code} ({(time.perf_counter() - started) * 1000:.0f}ms)")
+        except Exception as api_error:
+            logger.warning(f"⚠️ النظام غير متاح ({backend.name}): {api_error}")
+
+def start_service_threads():
+    """خيوط الحفاظ على الحياة والتنظيف والحفظ - مشتركة بين الوضعين"""
+    threading.Thread(target=keep_alive, daemon=True).start()
+    threading.Thread(target=cleanup_old_data, daemon=True).start()
+    memory.start_background_tasks()
+    # استئناف البث الذي توقف بإعادة التشغيل
+    broadcaster.start()
+
+def install_chat_executor():
+    """بدل مجموعة الخيوط المشتركة: رسائل نفس المحادثة بالترتيب على خيط واحد
+    
+    في وضعي الاستطلاع وwebhook فقط - وضع asyncio لا يستخدم خيوط telebot"""
+    if isinstance(bot.worker_pool, ChatShardedExecutor):
+        return
+    # خيوط ThreadPool الافتراضية تتوقف وحدها خلال نصف ثانية - بدون انتظار عند بدء التشغيل
+    for worker in bot.worker_pool.workers:
+        worker.stop()
+    bot.worker_pool = ChatShardedExecutor(
+        bot,
+        num_shards=Config.HANDLER_SHARDS,
+        max_pending_per_chat=Config.HANDLER_MAX_PENDING_PER_CHAT,
+        queue_size=Config.HANDLER_SHARD_QUEUE
+    )
+
+def handle_shutdown(signum, frame):
+    """حفظ البيانات المعلقة قبل الإيقاف"""
+    logger.info("🛑 إيقاف موبي - حفظ البيانات المعلقة...")
+    memory.flush()
+    raise SystemExit(0)
+
 def main():
     logger.info("🚀 بدء تشغيل موبي مع جميع الميزات...")
     
     try:
         # إزالة أي instance سابقة والتأكد من عدم وجود تعارض
         logger.info("🔄 إزالة الwebhook السابق...")
-        bot.remove_webhook()
-        time.sleep(3)
+        with startup_timer.step("الwebhook"):
+            bot.remove_webhook()
         
-        # اختبار النظام والتحقق من المطور
-        try:
-            test_url = f"{AIService.API_URL}?text=test"
-            response = requests.get(test_url, timeout=10)
-            logger.info(f"✅ النظام يعمل: {response.status_code}")
-            
-        except Exception as api_error:
-            logger.warning(f"⚠️ النظام غير متاح: {api_error}")
+        # اختبار النظام في الخلفية - التعارض مع instance سابقة يعالجه infinity_polling بإعادة المحاولة
+        threading.Thread(target=run_health_probes, daemon=True).start()
         
         logger.info(f"✅ موبي جاهز - المطور: {DEVELOPER_USERNAME} (ID: {DEVELOPER_ID})")
         logger.info("🤖 البوت يعمل الآن ويستمع للرسائل...")
         
         # بدء خيوط الخدمة
-        threading.Thread(target=keep_alive, daemon=True).start()
-        threading.Thread(target=cleanup_old_data, daemon=True).start()
+        with startup_timer.step("خيوط الخدمة"):
+            install_chat_executor()
+            start_service_threads()
+            signal.signal(signal.SIGTERM, handle_shutdown)
         
         # تشغيل البوت مع معالجة أفضل للأخطاء
+        startup_timer.report()
         logger.info("🎯 بدء الاستماع للرسائل...")
         bot.infinity_polling(timeout=60, long_polling_timeout=60)
         
@@ -1234,5 +1973,166 @@ def main():
         time.sleep(10)
         main()
 
+# وضع webhook: Telegram يرسل التحديثات إلى خادم HTTP مدمج بدل getUpdates
+webhook_server = None
+
+def process_webhook_updates(updates):
+    # process_new_updates يوزعها على خيوط telebot كما في الاستطلاع
+    bot.process_new_updates([telebot.types.Update.de_json(update) for update in updates])
+
+def webhook_backlog():
+    # تحديثات قُبلت ولم تُعالج بعد في خيوط المعالجات
+    return bot.worker_pool.stats()['queued']
+
+def main_webhook():
+    """الاستطلاع احتياطي: بدون عنوان عام، أو إذا تعذر فتح المنفذ أو تسجيل الwebhook"""
+    global webhook_server
+    logger.info("🚀 بدء تشغيل موبي (وضع webhook)...")
+    
+    if not Config.WEBHOOK_URL:
+        logger.warning("⚠️ لا يوجد عنوان webhook عام (MOBI_WEBHOOK_URL) - التحول إلى الاستطلاع")
+        return main()
+    
+    try:
+        with startup_timer.step("خادم webhook"):
+            webhook_server = WebhookServer(
+                process_webhook_updates,
+                secret_token=Config.WEBHOOK_SECRET,
+                path=Config.WEBHOOK_PATH,
+                host=Config.WEBHOOK_HOST,
+                port=Config.WEBHOOK_PORT,
+                queue_size=Config.WEBHOOK_QUEUE_SIZE,
+                backlog=webhook_backlog,
+                max_backlog=Config.WEBHOOK_MAX_BACKLOG
+            )
+            install_chat_executor()
+            webhook_server.start()
+            # الخادم يستمع قبل التسجيل حتى لا يُرفض أول تحديث
+            http_thread = webhook_server.serve_in_background()
+        
+        with startup_timer.step("الwebhook"):
+            bot.set_webhook(
+                url=Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=['message', 'callback_query']
+            )
+    except Exception as e:
+        logger.error(f"❌ تعذر تشغيل webhook: {e} - التحول إلى الاستطلاع")
+        if webhook_server is not None:
+            webhook_server.stop()
+            webhook_server = None
+        return main()
+    
+    threading.Thread(target=run_health_probes, daemon=True).start()
+    with startup_timer.step("خيوط الخدمة"):
+        start_service_threads()
+        signal.signal(signal.SIGTERM, handle_shutdown)
+    startup_timer.report()
+    logger.info(f"✅ موبي جاهز - المطور: {DEVELOPER_USERNAME} (ID: {DEVELOPER_ID})")
+    
+    # الخيط الرئيسي ينتظر بمهلة قصيرة حتى تصله إشارة SIGTERM
+    while http_thread.is_alive():
+        http_thread.join(1)
+
+# وضع asyncio: نفس المعالجات فوق Application من python-telegram-bot
+TELEBOT_COMMANDS = {
+    'start': handle_start,
+    'help': handle_help,
+    'status': handle_status,
+    'upgrade': handle_upgrade,
+    'developer': handle_developer,
+    'new': handle_new,
+    'memory': handle_memory,
+    'cache': handle_cache
+}
+
+MESSAGE_CONTENT_TYPES = ('text', 'photo', 'video', 'audio', 'document')
+
+async def on_ptb_message(update, context):
+    """الأوامر والحالات تعمل في خيط، ومحادثة الذكاء الاصطناعي تبقى في حلقة الأحداث"""
+    try:
+        message = to_telebot_update(update).message
+        if message is None or message.content_type not in MESSAGE_CONTENT_TYPES:
+            return
+        
+        if message.content_type == 'text' and message.text.startswith('/'):
+            command = message.text.split()[0][1:].split('@')[0]
+            if command == 'fresh':
+                # طلب ذكاء اصطناعي: يبقى في حلقة الأحداث مثل الرسائل العادية
+                if await asyncio.to_thread(ensure_subscription, message):
+                    await handle_fresh_async(message, context.bot)
+                return
+            if command in TELEBOT_COMMANDS:
+                await asyncio.to_thread(TELEBOT_COMMANDS[command], message)
+                return
+        
+        if message.content_type != 'text' or has_pending_state(message.from_user.id):
+            await asyncio.to_thread(handle_all_messages, message)
+            return
+        
+        if not await asyncio.to_thread(ensure_subscription, message):
+            return
+        await handle_ai_message_async(message, context.bot)
+        
+    except Exception as e:
+        logger.error(f"❌ خطأ في المعالجة: {e}")
+
+async def on_ptb_callback(update, context):
+    try:
+        await asyncio.to_thread(handle_callback, to_telebot_update(update).callback_query)
+    except Exception as e:
+        logger.error(f"❌ خطأ في معالجة الزر: {e}")
+
+def main_async():
+    """تشغيل موبي على Application غير المتزامن من python-telegram-bot"""
+    from telegram.ext import Application, CallbackQueryHandler, MessageHandler, filters
+    from utils.async_http_client import AsyncPooledHttpClient
+    
+    logger.info("🚀 بدء تشغيل موبي (وضع asyncio)...")
+    
+    async def post_init(application):
+        AIService.router.attach_async(lambda: AsyncPooledHttpClient(
+            timeout=Config.AI_TIMEOUT,
+            connect_timeout=Config.AI_CONNECT_TIMEOUT,
+            pool_size=Config.AI_ASYNC_POOL_SIZE,
+            max_retries=Config.AI_MAX_RETRIES,
+            backoff_base=Config.AI_BACKOFF_BASE,
+            backoff_max=Config.AI_BACKOFF_MAX,
+            retry_ratio=Config.AI_RETRY_BUDGET_RATIO,
+            failure_threshold=Config.AI_BREAKER_THRESHOLD,
+            reset_timeout=Config.AI_BREAKER_RESET
+        ))
+        threading.Thread(target=run_health_probes, daemon=True).start()
+        with startup_timer.step("خيوط الخدمة"):
+            start_service_threads()
+        startup_timer.report()
+        logger.info(f"✅ موبي جاهز - المطور: {DEVELOPER_USERNAME} (ID: {DEVELOPER_ID})")
+    
+    async def post_shutdown(application):
+        logger.info("🛑 إيقاف موبي - حفظ البيانات المعلقة...")
+        await AIService.router.close_async()
+        memory.flush()
+    
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(Config.ASYNC_CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE, on_ptb_message))
+    application.add_handler(CallbackQueryHandler(on_ptb_callback))
+    
+    # run_polling يحذف الwebhook ويتعامل مع SIGTERM بنفسه
+    logger.info("🎯 بدء الاستماع للرسائل...")
+    application.run_polling(timeout=60)
+
 if __name__ == "__main__":
-    main()
+    if Config.RUNTIME == 'asyncio':
+        main_async()
+    elif Config.RUNTIME == 'webhook':
+        main_webhook()
+    else:
+        main()
@@ -3,6 +3,7 @@
 إعدادات موبي - البوت الذكي المتقدم
 """
 
+import hashlib
 import os
 
 # إعدادات البوت
@@ -25,11 +26,148 @@ class Config:
     # إعدادات API الذكاء الاصطناعي
     AI_API_URL = "https://sii3.top/api/grok4.php"
     AI_TIMEOUT = 15
+    AI_CONNECT_TIMEOUT = 3.05  # فشل سريع إذا كان الخادم متوقفاً
+    # حد عام للطلبات المتزامنة للنظام (يطبقه المجدول أدناه)
+    AI_MAX_CONCURRENT = 16
+    # اتصالات دائمة (keep-alive) في المجمع - طلب أساسي واحتياطي لكل طلب متزامن دون انتظار اتصال
+    AI_POOL_SIZE = 2 * AI_MAX_CONCURRENT
+    AI_MAX_RETRIES = 2
+    AI_RETRY_BUDGET_RATIO = 0.2  # إعادة محاولة لكل 5 طلبات كحد أقصى
+    AI_BACKOFF_BASE = 0.25  # ثواني - تتضاعف مع عشوائية كاملة
+    AI_BACKOFF_MAX = 2.0
+    AI_BREAKER_THRESHOLD = 5  # فشل متتالي قبل فتح قاطع الدائرة
+    AI_BREAKER_RESET = 30  # ثواني قبل الطلب التجريبي
+    AI_ASYNC_POOL_SIZE = 100  # اتصالات httpx في وضع asyncio
+    
+    # خوادم النظام: MOBI_AI_BACKENDS="name=url,name=url" - الافتراضي الخادم الأصلي فقط
+    AI_BACKENDS = [
+        {"name": name.strip(), "url": url.strip()}
+        for name, url in (item.split("=", 1) for item in os.getenv('MOBI_AI_BACKENDS', '').split(",") if "=" in item)
+    ] or [{"name": "grok4", "url": AI_API_URL}]
+    AI_EWMA_ALPHA = 0.2  # وزن آخر قياس في متوسط الزمن والأخطاء
+    AI_ROUTER_EXPLORE = 0.05  # نسبة الطلبات التي تجرب خادماً غير الأفضل لتحديث قياساته
+    # الطلب الاحتياطي: إذا لم يرد الخادم الأول خلال النسبة المئوية لزمنه يُرسل نفس الطلب لخادم ثانٍ
+    AI_HEDGE_ENABLED = os.getenv('MOBI_AI_HEDGE', 'false').lower() == 'true'
+    AI_HEDGE_PERCENTILE = 0.95
+    AI_HEDGE_MIN_DELAY = 0.5  # ثواني - لا طلب احتياطي قبلها مهما كان الخادم سريعاً
+    AI_HEDGE_WORKERS = 2 * AI_MAX_CONCURRENT  # خيوط الطلبات الأساسية والاحتياطية معاً
+    
+    # جدولة الطلبات: حتى AI_MAX_CONCURRENT طلباً متزامناً، وأولوية لـ VIP والمشرفين
+    SCHEDULER_WEIGHTS = {"priority": 4, "free": 1}  # حصة كل مسار من الفتحات
+    SCHEDULER_MAX_PENDING_PER_USER = 2  # الرسالة الزائدة تُدمج مع أقدم رسالة منتظرة
+    SCHEDULER_WAIT_TIMEOUT = 60  # ثواني قبل الرد البديل
+    
+    # ذاكرة الردود المؤقتة: الأسئلة المتكررة (بعد تطبيع العربية) لا تصل للنظام
+    RESPONSE_CACHE_ENABLED = os.getenv('MOBI_RESPONSE_CACHE', 'true').lower() == 'true'
+    RESPONSE_CACHE_SIZE = 5000
+    RESPONSE_CACHE_TTL = 3600  # ثواني
+    RESPONSE_CACHE_MAX_PROMPT = 200  # الأسئلة الأطول لا تُخزن
+    
+    # معالجة ردود النظام: المراحل بالترتيب، وكل سطر فيه إحدى الكلمات يُحذف
+    RESPONSE_PIPELINE_STAGES = ["extract", "unescape", "filter", "truncate"]
+    RESPONSE_FILTER_KEYWORDS = ["dev:", "support", "channel", "@", "don't forget"]
+    RESPONSE_MAX_LENGTH = 2000
+    
+    # الردود السريعة: النوايا تُطابق قبل الاتصال بالنظام ({developer} يُستبدل بمعرف المطور)
+    # local=True: يُرد محلياً إذا غطت كلمات النية نسبة min_confidence من الرسالة على الأقل
+    # الجدول الافتراضي هو جدول smart_response الأصلي بنفس الكلمات ونفس الترتيب (أول نية في الترتيب تفوز في الرد البديل)
+    INTENT_MIN_CONFIDENCE = 0.5
+    DEFAULT_INTENTS = [
+        {"name": "تحية", "keywords": ["مرحبا"], "response": "أهلاً! أنا موبي 🤖! كيف يمكنني مساعدتك؟ 💫", "local": True},
+        {"name": "سلام", "keywords": ["السلام عليكم"], "response": "وعليكم السلام ورحمة الله وبركاته! موبي جاهز لخدمتك. 🌟", "local": True},
+        {"name": "شكر", "keywords": ["شكرا"], "response": "العفو! دائماً سعيد بمساعدتك. 😊", "local": False},
+        {"name": "الاسم", "keywords": ["اسمك"], "response": "أنا موبي! 🤖 المساعد الذكي!", "local": False},
+        {"name": "من صنعك", "keywords": ["من صنعك", "من صنعك؟"], "response": "السيد موبي - {developer} 👑", "local": True},
+        {"name": "صانعك", "keywords": ["صانعك"], "response": "السيد موبي - {developer} 👑", "local": True},
+        {"name": "مطورك", "keywords": ["مطورك"], "response": "السيد موبي - {developer} 👑", "local": True},
+        {"name": "مين صنعك", "keywords": ["مين صنعك"], "response": "السيد موبي - {developer} 👑", "local": True},
+        {"name": "الحال", "keywords": ["كيف حالك"], "response": "أنا بخير الحمدلله! جاهز لمساعدتك. ⚡", "local": False},
+        {"name": "المساعدة", "keywords": ["مساعدة"], "response": "موبي يمكنه مساعدتك في:\n• الإجابة على الأسئلة\n• الشرح والتوضيح\n• الكتابة والإبداع\n• حل المشكلات\nما الذي تحتاج؟ 🎯", "local": False},
+        {"name": "مطور", "keywords": ["مطور"], "response": "السيد موبي - {developer} 👑", "local": True},
+        {"name": "موبي", "keywords": ["موبي"], "response": "نعم! أنا موبي هنا! 🤖 كيف يمكنني مساعدتك؟", "local": False},
+        {"name": "VIP", "keywords": ["vip"], "response": "🌟 نظام VIP يمنحك صلاحيات متقدمة! تواصل مع المطور.", "local": True},
+        {"name": "بريميوم", "keywords": ["بريميوم"], "response": "💎 اشترك في البريميوم للوصول غير المحدود!", "local": True},
+        {"name": "الترقية", "keywords": ["ترقية"], "response": "💎 للترقية إلى VIP تواصل مع {developer}", "local": True}
+    ]
+    
+    # دمج الأسئلة المتطابقة المعلقة في طلب واحد للنظام
+    SINGLE_FLIGHT_ENABLED = True
+    SINGLE_FLIGHT_TIMEOUT = 30  # أقصى انتظار لطلب مشترك (ثواني)
+    
+    # الردود التدريجية: أول جزء من رد النظام يظهر فوراً ثم تُعدل الرسالة حتى يكتمل
+    # (الطلبات التدريجية لا تُدمج عبر single-flight لأن كل مستخدم يقرأ رده بنفسه)
+    STREAMING_REPLIES = os.getenv('MOBI_STREAMING', 'false').lower() == 'true'
+    STREAM_EDIT_INTERVAL = 1.0  # ثواني بين التعديلات - حد Telegram تقريباً تعديل واحد في الثانية لكل محادثة
+    
+    # وضع التشغيل: "polling" (telebot بخيوط)، "webhook" (نفس المعالجات عبر خادم HTTP) أو "asyncio" (python-telegram-bot غير متزامن)
+    RUNTIME = os.getenv('MOBI_RUNTIME', 'polling')
+    ASYNC_CONCURRENT_UPDATES = 256  # تحديثات تُعالج في نفس الوقت في وضع asyncio
+    # خيوط المعالجات في وضع telebot - كل محادثة مثبتة على خيط، وكل خيط يبقى مشغولاً طوال طلب الذكاء الاصطناعي،
+    # لذلك العدد أضعاف AI_MAX_CONCURRENT: الطلبات الزائدة تنتظر في المجدول (حيث تعمل أولوية VIP) لا خلف محادثة أخرى
+    HANDLER_SHARDS = int(os.getenv('MOBI_HANDLER_SHARDS') or 4 * AI_MAX_CONCURRENT)
+    # تحديثات محادثة واحدة تنتظر في خيطها - الزائد لا يُقبل حتى لا تؤخر محادثة مغرقة جاراتها على نفس الخيط
+    HANDLER_MAX_PENDING_PER_CHAT = SCHEDULER_MAX_PENDING_PER_USER + 1
+    HANDLER_SHARD_QUEUE = 100  # حد طابور كل خيط
+    
+    # وضع webhook (MOBI_RUNTIME=webhook): خادم HTTP مدمج بدل الاستطلاع، والاستطلاع احتياطي إذا فشل التسجيل
+    WEBHOOK_URL = os.getenv('MOBI_WEBHOOK_URL') or os.getenv('RENDER_EXTERNAL_URL', '')
+    WEBHOOK_PATH = '/telegram'
+    WEBHOOK_HOST = '0.0.0.0'
+    WEBHOOK_PORT = int(os.getenv('PORT', '8443'))
+    # الرمز السري الافتراضي مشتق من التوكن حتى لا يُنشر خادم بدون تحقق
+    WEBHOOK_SECRET = os.getenv('MOBI_WEBHOOK_SECRET') or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32]
+    WEBHOOK_QUEUE_SIZE = 1000  # تحديثات بانتظار المعالجة قبل الرد بـ 503
+    WEBHOOK_MAX_BACKLOG = 500  # تحديثات في طوابير المعالجات قبل إيقاف التمرير إليها
+    WEBHOOK_MAX_CONNECTIONS = 40  # اتصالات Telegram المتزامنة بالخادم
+    
+    # البث في الخلفية: حد Telegram حوالي 30 رسالة في الثانية لكل البوت
+    BROADCAST_RATE = 30  # رسائل في الثانية
+    BROADCAST_WORKERS = 4  # مرسلون متوازيون (الزمن يضيع في انتظار الشبكة)
+    BROADCAST_BATCH_SIZE = 100  # يُحفظ التقدم بعد كل دفعة
+    BROADCAST_REPORT_INTERVAL = 3.0  # ثواني بين تحديثات رسالة التقدم عند المشرف
+    DELIVERY_MAX_FAILURES = 3  # فشل متتالي قبل اعتبار المستخدم غير قابل للوصول (الحظر 403 فوراً)
     
     # إعدادات الذاكرة
     MEMORY_WORKSPACE = "/tmp/mobi_memory"
     MAX_CONVERSATION_LENGTH = 15
     CLEANUP_INTERVAL = 300  # 5 دقائق
+    CONVERSATION_TTL = 600  # تُحذف الرسائل الأقدم من 10 دقائق
+    
+    # سياق المحادثة المرسل للنظام (بالأحرف لأن الطلب GET والرابط محدود الطول)
+    CONTEXT_BUDGET_CHARS = 1200  # آخر الرسائل + الملخص، بدون سؤال المستخدم الحالي
+    CONTEXT_SUMMARY_CHARS = 300  # حجم الملخص التراكمي للرسائل الأقدم
+    CONTEXT_TURN_CHARS = 300  # أقصى طول لكل رسالة داخل السياق
+    
+    # واجهة التخزين: "json" (ملفات في مجلد العمل) أو "sqlite"
+    STORAGE_BACKEND = os.getenv('MOBI_STORAGE_BACKEND', 'json')
+    SQLITE_DB_NAME = "mobi_memory.db"
+    
+    # تخزين إحصائيات المستخدمين في وضع json: "journal" (سجل إلحاقي) أو "json" (إعادة كتابة الملف كاملاً)
+    STATS_STORAGE_MODE = os.getenv('MOBI_STATS_STORAGE', 'journal')
+    JOURNAL_COMPACT_INTERVAL = 300  # ثواني
+    JOURNAL_COMPACT_THRESHOLD = 5000  # عدد السجلات قبل الضغط المبكر
+    
+    # الكتابة المؤجلة: تجميع التغييرات وكتابتها في دفعات من خيط منفصل
+    WRITE_BEHIND_ENABLED = True
+    WRITE_BEHIND_INTERVAL = 2.0  # ثواني بين كل دفعة
+    WRITE_BEHIND_MAX_DIRTY = 500  # عدد السجلات المتسخة قبل الكتابة المبكرة
+    
+    # ذاكرة المحادثات المؤقتة (LRU + TTL)
+    CONVERSATION_CACHE_SIZE = 10000  # عدد المحادثات في الذاكرة
+    CONVERSATION_CACHE_TTL = 600  # ثواني
+    
+    # ذاكرة حالة الاشتراك الإجباري: المشترك يُتحقق منه نادراً وغير المشترك بسرعة حتى يرى اشتراكه
+    SUBSCRIPTION_CACHE_SIZE = 50000
+    SUBSCRIPTION_CACHE_TTL = 600  # ثواني للمشترك
+    SUBSCRIPTION_CACHE_NEGATIVE_TTL = 30  # ثواني لغير المشترك
+    
+    # مخزن المحادثات في وضع json: "files" (ملف لكل مستخدم) أو "mmap" (ملف حلقي واحد)
+    CONVERSATION_STORE = os.getenv('MOBI_CONVERSATION_STORE', 'files')
+    CONVERSATION_RING_SLOTS = 1024  # عدد الخانات الأولي - يتضاعف عند الامتلاء
+    CONVERSATION_RING_MESSAGE_BYTES = 4096  # أقصى حجم لنص الرسالة (UTF-8)
+    
+    # بدء التشغيل الكسول: سجلات المستخدمين تُقرأ من فهرس اللقطة عند أول وصول
+    LAZY_USER_LOADING = os.getenv('MOBI_LAZY_USERS', 'true').lower() == 'true'
     
     # إعدادات التسجيل
     LOG_LEVEL = "INFO"
@@ -5,6 +5,7 @@
 
 import logging
 from datetime import datetime
+from itertools import islice
 
 logger = logging.getLogger("موبي_المشرفين")
 
@@ -14,6 +15,7 @@ def show_admin_stats(bot, call, memory):
         total_users = memory.get_total_users()
         active_today = memory.get_active_today()
         total_messages = sum(stats.get('message_count', 0) for stats in memory.user_stats.values())
+        reachable, dead = memory.delivery.counts()
         
         stats_text = f"""
 📊 **إحصائيات البوت**
@@ -22,6 +24,10 @@ def show_admin_stats(bot, call, memory):
 • الإجمالي: {total_users}
 • النشطين اليوم: {active_today}
 
+📬 **التوصيل:**
+• قابلون للوصول: {reachable}
+• غير قابلين (حظروا البوت أو فشل متكرر): {dead}
+
 💬 **الرسائل:**
 • الإجمالي: {total_messages}
 
@@ -53,7 +59,7 @@ def show_users_list(bot, call, memory):
     try:
         users_text = "👥 **قائمة المستخدمين**\n\n"
         
-        for i, (user_id, stats) in enumerate(list(memory.user_stats.items())[:50], 1):
+        for i, (user_id, stats) in enumerate(islice(memory.user_stats.items(), 50), 1):
             username = stats.get('username', 'بدون معرف')
             first_name = stats.get('first_name', 'بدون اسم')
             message_count = stats.get('message_count', 0)
@@ -1,83 +1,199 @@
 import sqlite3
 import json
+import threading
 from datetime import datetime, timedelta
 import logging
 
+from utils.storage import StorageBackend
+
 logger = logging.getLogger(__name__)
 
+def to_epoch(value):
+    """تحويل وقت (نص ISO أو رقم أو datetime) إلى ثواني epoch"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return None
+
+def from_epoch(value):
+    """تحويل ثواني epoch إلى نص ISO كما يتوقعه باقي البوت"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value).isoformat()
+
 class MemoryManager:
-    def __init__(self, db_path="bot_memory.db"):
+    def __init__(self, db_path="bot_memory.db", preload=True):
         self.db_path = db_path
+        self.local = threading.local()
         self.user_stats = {}
         self.conversations = {}
         self.admins = {}
         self.banned_users = {}
         self.init_database()
-        self.load_from_database()
+        if preload:
+            self.load_from_database()
+
+    def get_connection(self):
+        """اتصال دائم لكل خيط بوضع WAL - القراء لا يحجبون الكتّاب"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
 
     def init_database(self):
-        """تهيئة قاعدة البيانات"""
+        """تهيئة قاعدة البيانات وتطبيق الترحيلات المعلقة"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            conn = self.get_connection()
+            current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            
+            for version, description, migration in self.MIGRATIONS:
+                if version <= current_version:
+                    continue
+                # كل ترحيل في معاملة واحدة مع رقم الإصدار حتى لا تبقى القاعدة نصف مرحّلة
+                conn.execute("BEGIN")
+                try:
+                    migration(self, conn.cursor())
+                    conn.execute(f"PRAGMA user_version = {version}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                logger.info(f"🔧 ترحيل قاعدة البيانات {version}: {description}")
             
-            # جدول إحصائيات المستخدمين
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    messages_count INTEGER DEFAULT 0,
-                    points INTEGER DEFAULT 0,
-                    join_date TEXT,
-                    last_seen TEXT
-                )
-            ''')
-            
-            # جدول المحادثات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    role TEXT,
-                    content TEXT,
-                    timestamp TEXT,
-                    FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
-                )
-            ''')
-            
-            # جدول المشرفين
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS admins (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    added_date TEXT
-                )
-            ''')
-            
-            # جدول المستخدمين المحظورين
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS banned_users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    ban_date TEXT,
-                    reason TEXT
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
             logger.info("✅ تم تهيئة قاعدة البيانات بنجاح")
         except Exception as e:
             logger.error(f"❌ خطأ في تهيئة قاعدة البيانات: {e}")
 
+    def migrate_base_schema(self, cursor):
+        """الجداول الأساسية"""
+        # جدول إحصائيات المستخدمين
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                messages_count INTEGER DEFAULT 0,
+                points INTEGER DEFAULT 0,
+                join_date TEXT,
+                last_seen TEXT
+            )
+        ''')
+        
+        # جدول المحادثات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                role TEXT,
+                content TEXT,
+                timestamp TEXT,
+                FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
+            )
+        ''')
+        
+        # جدول المشرفين
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS admins (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                added_date TEXT
+            )
+        ''')
+        
+        # جدول المستخدمين المحظورين
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS banned_users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                ban_date TEXT,
+                reason TEXT
+            )
+        ''')
+
+    def migrate_memory_system_tables(self, cursor):
+        """جداول وأعمدة MemorySystem"""
+        # جدول مستخدمي VIP
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vip_users (
+                user_id INTEGER PRIMARY KEY,
+                added_date TEXT
+            )
+        ''')
+        
+        # جدول الإعدادات والبيانات العامة (قيم JSON)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS key_value (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        
+        # أعمدة MemorySystem الإضافية في جدول المستخدمين
+        existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(user_stats)")}
+        for column, column_type in (
+            ('last_message', 'TEXT'),
+            ('message_limit', 'INTEGER'),
+            ('used_messages', 'INTEGER DEFAULT 0')
+        ):
+            if column not in existing_columns:
+                cursor.execute(f"ALTER TABLE user_stats ADD COLUMN {column} {column_type}")
+
+    def migrate_epoch_timestamps(self, cursor):
+        """تحويل أوقات المحادثات من نص ISO إلى ثواني epoch صحيحة"""
+        cursor.connection.create_function("iso_to_epoch", 1, to_epoch)
+        cursor.execute('''
+            CREATE TABLE conversations_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                role TEXT,
+                content TEXT,
+                timestamp INTEGER,
+                FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO conversations_new (id, user_id, role, content, timestamp)
+            SELECT id, user_id, role, content, iso_to_epoch(timestamp) FROM conversations
+        ''')
+        cursor.execute("DROP TABLE conversations")
+        cursor.execute("ALTER TABLE conversations_new RENAME TO conversations")
+
+    def migrate_indexes(self, cursor):
+        """فهارس القراءة حسب المستخدم والوقت"""
+        cursor.execute("DROP INDEX IF EXISTS idx_conversations_user")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conversations_user_time
+            ON conversations (user_id, timestamp)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_stats_last_seen
+            ON user_stats (last_seen)
+        ''')
+
+    # (الإصدار، الوصف، الدالة) - أضف الترحيلات الجديدة في النهاية فقط
+    MIGRATIONS = (
+        (1, "الجداول الأساسية", migrate_base_schema),
+        (2, "جداول MemorySystem", migrate_memory_system_tables),
+        (3, "أوقات epoch للمحادثات", migrate_epoch_timestamps),
+        (4, "فهرس (user_id, timestamp)", migrate_indexes),
+    )
+
     def load_from_database(self):
         """تحميل البيانات من قاعدة البيانات"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             # تحميل إحصائيات المستخدمين
@@ -112,7 +228,6 @@ class MemoryManager:
                     'reason': row[4]
                 }
             
-            conn.close()
             logger.info("✅ تم تحميل البيانات من قاعدة البيانات")
         except Exception as e:
             logger.error(f"❌ خطأ في تحميل البيانات: {e}")
@@ -120,7 +235,7 @@ class MemoryManager:
     def save_user_stats(self, user_id, user_info):
         """حفظ إحصائيات المستخدم"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -139,7 +254,6 @@ class MemoryManager:
             ))
             
             conn.commit()
-            conn.close()
             
             # تحديث الذاكرة
             self.user_stats[user_id] = user_info
@@ -151,16 +265,15 @@ class MemoryManager:
     def add_conversation(self, user_id, role, content):
         """إضافة محادثة جديدة"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
                 INSERT INTO conversations (user_id, role, content, timestamp)
                 VALUES (?, ?, ?, ?)
-            ''', (user_id, role, content, datetime.now().isoformat()))
+            ''', (user_id, role, content, to_epoch(datetime.now())))
             
             conn.commit()
-            conn.close()
             return True
         except Exception as e:
             logger.error(f"❌ خطأ في إضافة المحادثة: {e}")
@@ -169,14 +282,14 @@ class MemoryManager:
     def get_user_conversation(self, user_id, limit=20):
         """الحصول على محادثة المستخدم"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
                 SELECT role, content, timestamp 
                 FROM conversations 
                 WHERE user_id = ? 
-                ORDER BY timestamp DESC 
+                ORDER BY timestamp DESC, id DESC 
                 LIMIT ?
             ''', (user_id, limit))
             
@@ -185,10 +298,9 @@ class MemoryManager:
                 conversations.append({
                     'role': row[0],
                     'content': row[1],
-                    'timestamp': row[2]
+                    'timestamp': from_epoch(row[2])
                 })
             
-            conn.close()
             return conversations[::-1]  # عكس الترتيب للحصول على الأقدم أولاً
         except Exception as e:
             logger.error(f"❌ خطأ في جلب المحادثة: {e}")
@@ -197,16 +309,16 @@ class MemoryManager:
     def get_recent_messages(self, user_id, minutes=10):
         """الحصول على الرسائل الحديثة"""
         try:
-            time_threshold = (datetime.now() - timedelta(minutes=minutes)).isoformat()
+            time_threshold = to_epoch(datetime.now() - timedelta(minutes=minutes))
             
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
                 SELECT role, content, timestamp 
                 FROM conversations 
                 WHERE user_id = ? AND timestamp > ?
-                ORDER BY timestamp DESC
+                ORDER BY timestamp DESC, id DESC
             ''', (user_id, time_threshold))
             
             recent_messages = []
@@ -214,10 +326,9 @@ class MemoryManager:
                 recent_messages.append({
                     'role': row[0],
                     'content': row[1],
-                    'timestamp': row[2]
+                    'timestamp': from_epoch(row[2])
                 })
             
-            conn.close()
             return recent_messages
         except Exception as e:
             logger.error(f"❌ خطأ في جلب الرسائل الحديثة: {e}")
@@ -233,7 +344,7 @@ class MemoryManager:
             if user_id in self.admins:
                 return False
             
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -242,7 +353,6 @@ class MemoryManager:
             ''', (user_id, username, first_name, datetime.now().isoformat()))
             
             conn.commit()
-            conn.close()
             
             self.admins[user_id] = {
                 'username': username,
@@ -260,13 +370,12 @@ class MemoryManager:
             if user_id not in self.admins:
                 return False
             
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
             
             conn.commit()
-            conn.close()
             
             del self.admins[user_id]
             return True
@@ -280,7 +389,7 @@ class MemoryManager:
             if user_id in self.banned_users:
                 return False
             
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -289,7 +398,6 @@ class MemoryManager:
             ''', (user_id, username, first_name, datetime.now().isoformat(), reason))
             
             conn.commit()
-            conn.close()
             
             self.banned_users[user_id] = {
                 'username': username,
@@ -308,13 +416,12 @@ class MemoryManager:
             if user_id not in self.banned_users:
                 return False
             
-            conn = sqlite3.connect(self.db_path)
+            conn = self.get_connection()
             cursor = conn.cursor()
             
             cursor.execute("DELETE FROM banned_users WHERE user_id = ?", (user_id,))
             
             conn.commit()
-            conn.close()
             
             del self.banned_users[user_id]
             return True
@@ -336,7 +443,7 @@ class MemoryManager:
             if user_id in self.user_stats:
                 self.user_stats[user_id]['points'] = points
                 
-                conn = sqlite3.connect(self.db_path)
+                conn = self.get_connection()
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -344,12 +451,171 @@ class MemoryManager:
                 ''', (points, user_id))
                 
                 conn.commit()
-                conn.close()
                 return True
             return False
         except Exception as e:
             logger.error(f"❌ خطأ في تحديث النقاط: {e}")
             return False
 
-# إنشاء كائن الذاكرة العالمي
-memory = MemoryManager()
+class SQLiteStorageBackend(StorageBackend):
+    """تخزين MemorySystem في SQLite باستخدام مخطط MemoryManager"""
+
+    # أعمدة جدول المستخدمين مقابل مفاتيح سجل MemorySystem
+    USER_COLUMNS = (
+        ('username', 'username'),
+        ('first_name', 'first_name'),
+        ('messages_count', 'message_count'),
+        ('points', 'points'),
+        ('join_date', 'first_seen'),
+        ('last_seen', 'last_seen'),
+        ('last_message', 'last_message'),
+        ('message_limit', 'message_limit'),
+        ('used_messages', 'used_messages')
+    )
+
+    LIST_TABLES = {
+        'admins': ('admins', 'added_date'),
+        'vip_users': ('vip_users', 'added_date'),
+        'banned_users': ('banned_users', 'ban_date')
+    }
+
+    def __init__(self, db_path):
+        self.manager = MemoryManager(str(db_path), preload=False)
+        columns = ", ".join(column for column, _ in self.USER_COLUMNS)
+        placeholders = ", ".join("?" for _ in self.USER_COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column, _ in self.USER_COLUMNS)
+        self.upsert_user_sql = f'''
+            INSERT INTO user_stats (user_id, {columns})
+            VALUES (?, {placeholders})
+            ON CONFLICT(user_id) DO UPDATE SET {updates}
+        '''
+
+    def get_connection(self):
+        return self.manager.get_connection()
+
+    def _user_row(self, user_id, record):
+        return (user_id,) + tuple(record.get(key) for _, key in self.USER_COLUMNS)
+
+    def load_user_stats(self):
+        conn = self.get_connection()
+        columns = ", ".join(column for column, _ in self.USER_COLUMNS)
+        rows = conn.execute(f'''
+            SELECT user_id, {columns},
+                   EXISTS (SELECT 1 FROM admins a WHERE a.user_id = u.user_id),
+                   EXISTS (SELECT 1 FROM banned_users b WHERE b.user_id = u.user_id),
+                   EXISTS (SELECT 1 FROM vip_users v WHERE v.user_id = u.user_id)
+            FROM user_stats u
+        ''').fetchall()
+
+        user_stats = {}
+        for row in rows:
+            record = {key: row[i + 1] for i, (_, key) in enumerate(self.USER_COLUMNS)}
+            record['message_count'] = record['message_count'] or 0
+            record['points'] = record['points'] or 0
+            record['used_messages'] = record['used_messages'] or 0
+            record['last_message'] = record['last_message'] or ""
+            record['is_admin'], record['is_banned'], record['is_vip'] = (bool(flag) for flag in row[-3:])
+            user_stats[row[0]] = record
+        return user_stats
+
+    def save_user_stats(self, user_stats):
+        self.save_user_records(list(user_stats.items()), user_stats)
+
+    def save_user_records(self, records, user_stats):
+        conn = self.get_connection()
+        with conn:
+            conn.executemany(self.upsert_user_sql, [
+                self._user_row(user_id, record) for user_id, record in records
+            ])
+
+    def load_list(self, name):
+        table, _ = self.LIST_TABLES[name]
+        conn = self.get_connection()
+        return [row[0] for row in conn.execute(f"SELECT user_id FROM {table} ORDER BY rowid")]
+
+    def save_list(self, name, user_ids):
+        table, date_column = self.LIST_TABLES[name]
+        user_ids = list(user_ids)
+        conn = self.get_connection()
+        with conn:
+            existing = {row[0] for row in conn.execute(f"SELECT user_id FROM {table}")}
+            removed = existing.difference(user_ids)
+            conn.executemany(f"DELETE FROM {table} WHERE user_id = ?", [(user_id,) for user_id in removed])
+            now = datetime.now().isoformat()
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {table} (user_id, {date_column}) VALUES (?, ?)",
+                [(user_id, now) for user_id in user_ids if user_id not in existing]
+            )
+
+    def _load_value(self, key, default):
+        row = self.get_connection().execute(
+            "SELECT value FROM key_value WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return default
+
+    def _save_value(self, key, value):
+        conn = self.get_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO key_value (key, value) VALUES (?, ?)",
+                (key, json.dumps(value, ensure_ascii=False))
+            )
+
+    def load_settings(self):
+        return self._load_value('bot_settings', None)
+
+    def save_settings(self, settings):
+        self._save_value('bot_settings', settings)
+
+    def load_broadcast_messages(self):
+        return self._load_value('broadcast_messages', {})
+
+    def save_broadcast_messages(self, broadcast_messages):
+        self._save_value('broadcast_messages', broadcast_messages)
+
+    def load_delivery_status(self):
+        return self._load_value('delivery_status', {})
+
+    def save_delivery_status(self, delivery_status):
+        self._save_value('delivery_status', delivery_status)
+
+    def load_conversation(self, user_id):
+        rows = self.get_connection().execute('''
+            SELECT role, content, timestamp
+            FROM conversations
+            WHERE user_id = ?
+            ORDER BY timestamp, id
+        ''', (user_id,)).fetchall()
+        return [{'role': row[0], 'content': row[1], 'timestamp': from_epoch(row[2])} for row in rows]
+
+    def save_conversation(self, user_id, conversation):
+        conn = self.get_connection()
+        with conn:
+            conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+            conn.executemany('''
+                INSERT INTO conversations (user_id, role, content, timestamp)
+                VALUES (?, ?, ?, ?)
+            ''', [(user_id, msg['role'], msg['content'], to_epoch(msg['timestamp'])) for msg in conversation])
+
+    def delete_conversation(self, user_id):
+        conn = self.get_connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+# كائن الذاكرة العام - يُنشأ عند أول طلب: الاستيراد (كما في SQLiteStorageBackend) لا ينشئ bot_memory.db
+_memory = None
+_memory_lock = threading.Lock()
+
+def get_memory():
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                _memory = MemoryManager()
+    return _memory
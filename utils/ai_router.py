@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+توجيه طلبات الذكاء الاصطناعي بين عدة خوادم: اختيار حسب متوسط الزمن والأخطاء (EWMA)،
+انتقال للخادم التالي عند الفشل، وطلب احتياطي (hedge) إذا تأخر الخادم الأول
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.http_client import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger("موبي_الموجه")
+
+class Backend:
+    """خادم واحد: عميله المتزامن (وغير المتزامن في وضع asyncio) ومتوسطاته المتحركة"""
+
+    def __init__(self, name, url, client, alpha=0.2, error_penalty=4.0):
+        self.name = name
+        self.url = url
+        self.client = client
+        self.async_client = None
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = deque(maxlen=200)
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def record_success(self, elapsed):
+        with self.lock:
+            self.requests += 1
+            self.latency = elapsed if self.latency is None else self.alpha * elapsed + (1 - self.alpha) * self.latency
+            self.error_rate = (1 - self.alpha) * self.error_rate
+            self.samples.append(elapsed)
+
+    def record_failure(self, elapsed):
+        with self.lock:
+            self.requests += 1
+            self.failures += 1
+            # الفشل البطيء (انتهاء المهلة) يرفع متوسط الزمن أيضاً
+            self.latency = elapsed if self.latency is None else self.alpha * elapsed + (1 - self.alpha) * self.latency
+            self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+
+    def score(self):
+        """الأقل أفضل - الخادم بدون قياسات يُجرب أولاً"""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + self.error_penalty * self.error_rate)
+
+    def available(self, use_async=False):
+        """قاطع العميل الذي يستخدمه المسار الحالي - المتزامن والغير متزامن منفصلان"""
+        client = self.async_client if use_async else self.client
+        return client.breaker.state != CircuitBreaker.OPEN
+
+    def hedge_delay(self, percentile, min_delay):
+        """موعد الطلب الاحتياطي: النسبة المئوية لزمن هذا الخادم (وليس أقل من min_delay)"""
+        samples = sorted(self.samples)
+        if len(samples) < 20:
+            return max(min_delay, (self.latency or 0.0) * 2)
+        return max(min_delay, samples[min(len(samples) - 1, int(len(samples) * percentile))])
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'url': self.url,
+                'latency_ewma_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+                'error_rate': round(self.error_rate, 3),
+                'score': round(self.score(), 4),
+                'requests': self.requests,
+                'failures': self.failures
+            }
+        # عدادات العميل نفسه: إعادة المحاولة والقاطع
+        stats['http'] = self.client.stats()
+        if self.async_client is not None:
+            stats['async_http'] = self.async_client.stats()
+        return stats
+
+class BackendRouter:
+    """نفس الواجهة للوضعين: get/stream للخيوط و get_async/stream_async لحلقة الأحداث"""
+
+    def __init__(self, backends, hedge=False, hedge_percentile=0.95, hedge_min_delay=0.5,
+                 explore_ratio=0.05, max_workers=32):
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.explore_ratio = explore_ratio
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-hedge") if hedge else None
+        self.lock = threading.Lock()
+        self.counters = {'hedges': 0, 'hedge_wins': 0, 'failovers': 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def ranked(self, use_async=False):
+        """الخوادم بالترتيب: المتاحة حسب النتيجة ثم التي قاطعها مفتوح"""
+        ranked = sorted(self.backends, key=lambda backend: (not backend.available(use_async), backend.score()))
+        # استكشاف عرضي حتى لا تبقى نتيجة خادم بطيء سابقاً قديمة للأبد
+        if len(ranked) > 1 and ranked[1].available(use_async) and random.random() < self.explore_ratio:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    # ---- الخيوط ----
+
+    def _call(self, backend, params, timeout):
+        started = time.perf_counter()
+        try:
+            response = backend.client.get(backend.url, params=params, timeout=timeout)
+            if response.status_code != 200:
+                raise Exception(f"خطأ في النظام: {response.status_code}")
+        except CircuitOpenError:
+            raise
+        except Exception:
+            backend.record_failure(time.perf_counter() - started)
+            raise
+        backend.record_success(time.perf_counter() - started)
+        return response
+
+    def _failover(self, backends, params, timeout, last_error=None):
+        for backend in backends:
+            if last_error is not None:
+                self._count('failovers')
+            try:
+                logger.info(f"🔗 موبي يتصل بالنظام: {backend.name}")
+                return self._call(backend, params, timeout)
+            except Exception as e:
+                logger.warning(f"⚠️ الخادم {backend.name} غير متاح: {e}")
+                last_error = e
+        raise last_error or CircuitOpenError("لا يوجد خادم متاح")
+
+    def get(self, params, timeout=None):
+        ranked = self.ranked()
+        if not self.hedge or len(ranked) < 2 or not ranked[1].available():
+            return self._failover(ranked, params, timeout)
+
+        primary, secondary = ranked[0], ranked[1]
+        logger.info(f"🔗 موبي يتصل بالنظام: {primary.name}")
+        futures = {self.executor.submit(self._call, primary, params, timeout): primary}
+        done, _ = wait(futures, timeout=primary.hedge_delay(self.hedge_percentile, self.hedge_min_delay))
+        if not done:
+            self._count('hedges')
+            logger.info(f"⏱️ {primary.name} تأخر - طلب احتياطي إلى {secondary.name}")
+            futures[self.executor.submit(self._call, secondary, params, timeout)] = secondary
+
+        # أول رد ناجح يفوز، والطلب الخاسر يكمل في الخلفية ويُحسب في المتوسطات
+        pending = set(futures)
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if futures[future] is secondary:
+                    self._count('hedge_wins')
+                return response
+
+        tried = set(futures.values())
+        return self._failover([backend for backend in ranked if backend not in tried], params, timeout, last_error)
+
+    def stream(self, params, timeout=None):
+        """مولد أجزاء الرد - الانتقال لخادم آخر ممكن فقط قبل وصول أول جزء (بدون طلب احتياطي)"""
+        last_error = None
+        for backend in self.ranked():
+            started = time.perf_counter()
+            chunks = backend.client.stream(backend.url, params=params, timeout=timeout)
+            try:
+                logger.info(f"🔗 موبي يتصل بالنظام (تدريجي): {backend.name}")
+                first = next(chunks)
+            except StopIteration:
+                backend.record_success(time.perf_counter() - started)
+                return
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+            except Exception as e:
+                backend.record_failure(time.perf_counter() - started)
+                logger.warning(f"⚠️ الخادم {backend.name} غير متاح: {e}")
+                last_error = e
+                self._count('failovers')
+                continue
+            # زمن أول جزء هو ما يشعر به المستخدم
+            backend.record_success(time.perf_counter() - started)
+            yield first
+            yield from chunks
+            return
+        raise last_error or CircuitOpenError("لا يوجد خادم متاح")
+
+    # ---- حلقة الأحداث ----
+
+    def attach_async(self, factory):
+        """إنشاء عميل غير متزامن لكل خادم - داخل حلقة الأحداث"""
+        for backend in self.backends:
+            backend.async_client = factory()
+
+    @property
+    def async_ready(self):
+        return all(backend.async_client is not None for backend in self.backends)
+
+    async def close_async(self):
+        for backend in self.backends:
+            if backend.async_client is not None:
+                await backend.async_client.close()
+                backend.async_client = None
+
+    async def _call_async(self, backend, params, timeout):
+        started = time.perf_counter()
+        try:
+            response = await backend.async_client.get(backend.url, params=params, timeout=timeout)
+            if response.status_code != 200:
+                raise Exception(f"خطأ في النظام: {response.status_code}")
+        except (CircuitOpenError, asyncio.CancelledError):
+            raise
+        except Exception:
+            backend.record_failure(time.perf_counter() - started)
+            raise
+        backend.record_success(time.perf_counter() - started)
+        return response
+
+    async def _failover_async(self, backends, params, timeout, last_error=None):
+        for backend in backends:
+            if last_error is not None:
+                self._count('failovers')
+            try:
+                logger.info(f"🔗 موبي يتصل بالنظام: {backend.name}")
+                return await self._call_async(backend, params, timeout)
+            except Exception as e:
+                logger.warning(f"⚠️ الخادم {backend.name} غير متاح: {e}")
+                last_error = e
+        raise last_error or CircuitOpenError("لا يوجد خادم متاح")
+
+    async def get_async(self, params, timeout=None):
+        ranked = self.ranked(use_async=True)
+        if not self.hedge or len(ranked) < 2 or not ranked[1].available(use_async=True):
+            return await self._failover_async(ranked, params, timeout)
+
+        primary, secondary = ranked[0], ranked[1]
+        logger.info(f"🔗 موبي يتصل بالنظام: {primary.name}")
+        tasks = {asyncio.ensure_future(self._call_async(primary, params, timeout)): primary}
+        last_error = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=primary.hedge_delay(self.hedge_percentile, self.hedge_min_delay))
+            if not done:
+                self._count('hedges')
+                logger.info(f"⏱️ {primary.name} تأخر - طلب احتياطي إلى {secondary.name}")
+                tasks[asyncio.ensure_future(self._call_async(secondary, params, timeout))] = secondary
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    if tasks[task] is secondary:
+                        self._count('hedge_wins')
+                    return task.result()
+        finally:
+            # الطلب الخاسر يُلغى - لا خيوط محجوزة في هذا الوضع
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        tried = set(tasks.values())
+        return await self._failover_async([backend for backend in ranked if backend not in tried], params, timeout, last_error)
+
+    async def stream_async(self, params):
+        last_error = None
+        for backend in self.ranked(use_async=True):
+            started = time.perf_counter()
+            chunks = backend.async_client.stream(backend.url, params=params)
+            try:
+                logger.info(f"🔗 موبي يتصل بالنظام (تدريجي): {backend.name}")
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                backend.record_success(time.perf_counter() - started)
+                return
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+            except Exception as e:
+                backend.record_failure(time.perf_counter() - started)
+                logger.warning(f"⚠️ الخادم {backend.name} غير متاح: {e}")
+                last_error = e
+                self._count('failovers')
+                continue
+            backend.record_success(time.perf_counter() - started)
+            try:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+            return
+        raise last_error or CircuitOpenError("لا يوجد خادم متاح")
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['hedge_enabled'] = self.hedge
+        stats['backends'] = {backend.name: backend.stats() for backend in self.backends}
+        return stats
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+تطبيع النص العربي للمقارنة: التشكيل والتطويل وأشكال الحروف وعلامات الترقيم
+"""
+
+import re
+import string
+import unicodedata
+
+# التشكيل وعلامات القرآن والتطويل تُحذف
+_REMOVED = (
+    [chr(c) for c in range(0x064B, 0x0660)] +
+    [chr(0x0670), chr(0x0640)] +
+    [chr(c) for c in range(0x06D6, 0x06EE)]
+)
+
+# توحيد أشكال الألف والياء والتاء المربوطة
+_UNIFIED = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه'
+}
+
+# علامات الترقيم العربية واللاتينية تصبح مسافات
+_PUNCTUATION = string.punctuation + '،؛؟«»…“”‘’'
+
+_TABLE = str.maketrans({
+    **{char: None for char in _REMOVED},
+    **_UNIFIED,
+    **{char: ' ' for char in _PUNCTUATION}
+})
+
+_SPACES = re.compile(r'\s+')
+
+def normalize_arabic(text):
+    """نص موحد للمقارنة: 'مَرْحَباً!!  يا صديقي؟' -> 'مرحبا يا صديقي'"""
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKC', text).lower().translate(_TABLE)
+    return _SPACES.sub(' ', text).strip()
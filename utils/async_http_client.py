@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+عميل HTTP غير متزامن (httpx) لخدمة الذكاء الاصطناعي - نفس القاطع والميزانية والعدادات
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from utils.http_client import HttpClientBase, RETRYABLE_STATUS, RetryableStatusError
+
+class AsyncPooledHttpClient(HttpClientBase):
+    """مئات الطلبات المعلقة تنتظر في حلقة الأحداث بدون حجز خيوط"""
+
+    def __init__(self, timeout=15, connect_timeout=3.05, pool_size=100, **kwargs):
+        super().__init__(**kwargs)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def get(self, url, params=None, timeout=None):
+        """طلب GET - يرفع CircuitOpenError فوراً إذا كان القاطع مفتوحاً"""
+        self._admit()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                if timeout is None:
+                    response = await self.client.get(url, params=params)
+                else:
+                    response = await self.client.get(url, params=params, timeout=timeout)
+                if response.status_code in RETRYABLE_STATUS:
+                    raise RetryableStatusError(response)
+                self._completed(started, response.status_code)
+                return response
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, RetryableStatusError):
+                if not self._should_retry(attempt):
+                    self._failed(started)
+                    raise
+                attempt += 1
+                await asyncio.sleep(self._backoff(attempt))
+            except Exception:
+                # انتهاء مهلة القراءة لا يُعاد - المستخدم انتظر المهلة كاملة بالفعل
+                self._failed(started)
+                raise
+
+    async def stream(self, url, params=None):
+        """مولد غير متزامن لأجزاء نص الرد فور وصولها (النجاح يُحسب عند وصول الرؤوس)"""
+        self._admit()
+        started = time.perf_counter()
+        headers_received = False
+        try:
+            async with self.client.stream('GET', url, params=params) as response:
+                headers_received = True
+                self._completed(started, response.status_code)
+                if response.status_code != 200:
+                    raise Exception(f"خطأ في النظام: {response.status_code}")
+                async for chunk in response.aiter_text():
+                    if chunk:
+                        yield chunk
+        except Exception:
+            # الفشل قبل وصول الرؤوس فقط يُحسب على قاطع الدائرة
+            if not headers_received:
+                self._failed(started)
+            raise
+
+    async def close(self):
+        await self.client.aclose()
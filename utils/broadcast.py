@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+محرك البث في الخلفية: معدل إرسال عام يحترم حدود Telegram، مجموعة مرسلين صغيرة،
+انتظار retry_after عند 429، وتقدم محفوظ يُستأنف بعد إعادة التشغيل
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.streaming import retry_after
+
+logger = logging.getLogger("موبي_البث")
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+class TokenBucket:
+    """دلو رموز مشترك بين كل المرسلين - acquire ينتظر حتى يتوفر رمز"""
+
+    def __init__(self, rate=30.0, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """429 من Telegram يوقف كل المرسلين وليس المرسل الذي تلقاه فقط"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            # الرموز تعود بالتدريج بعد الإيقاف - مدة الإيقاف نفسها لا تُحتسب دفعة كاملة
+            self.updated = self.paused_until
+
+class BroadcastEngine:
+    """مهمة بث واحدة في كل مرة، ترسل على دفعات ويُحفظ المؤشر بعد كل دفعة
+
+    send(chat_id, job): إرسال المحتوى لمستخدم واحد
+    recipients(job): معرفات المستلمين مرتبة تصاعدياً
+    save(): حفظ jobs فوراً (القاموس نفسه محفوظ في تخزين البوت) - نقطة الاستئناف بعد كل دفعة
+    report(job): تحديث رسالة التقدم عند المشرف - أول استدعاء من submit قبل بدء خيط البث
+    on_result(chat_id, error): نتيجة كل إرسال (error = None عند النجاح)
+    lock: القفل الذي يأخذه حافظ jobs عند نسخها - كل تعديل على المهام يتم تحته"""
+
+    def __init__(self, jobs, send, recipients, save, report=None, on_result=None, lock=None,
+                 rate=30.0, workers=4, batch_size=100, max_attempts=3, report_interval=3.0, keep_finished=20):
+        self.jobs = jobs
+        self.send = send
+        self.recipients = recipients
+        self.save = save
+        self.report = report
+        self.on_result = on_result
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.report_interval = report_interval
+        self.keep_finished = keep_finished
+        self.lock = lock or threading.RLock()
+        self.thread = None
+
+    def submit(self, admin_id, kind, payload):
+        job = {
+            'id': uuid.uuid4().hex[:8],
+            'admin_id': admin_id,
+            'kind': kind,
+            'payload': payload,
+            'status': RUNNING,
+            'cursor': None,
+            'sent': 0,
+            'failed': 0,
+            'total': 0,
+            'created_at': datetime.now().isoformat(),
+            'progress_message_id': None
+        }
+        job['total'] = sum(1 for _ in self.recipients(job))
+        with self.lock:
+            self.jobs[job['id']] = job
+            # المهام المنتهية القديمة لا تُحفظ للأبد
+            finished = sorted((old for old in self.jobs.values() if old['status'] != RUNNING),
+                              key=lambda old: old['created_at'])
+            for old in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self.jobs[old['id']]
+        self.save()
+        # رسالة التقدم تُنشأ هنا قبل أن يستطيع خيط البث تحديثها - وإلا قد ينشئ كل منهما رسالة
+        self._report(job)
+        self.start()
+        return job
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['status'] != RUNNING:
+                return False
+            job['status'] = CANCELLED
+        self.save()
+        return True
+
+    def pending(self):
+        with self.lock:
+            return sorted((job for job in self.jobs.values() if job['status'] == RUNNING),
+                          key=lambda job: job['created_at'])
+
+    def start(self):
+        """تشغيل خيط البث إذا كانت هناك مهام - يُستدعى عند الإرسال وعند بدء التشغيل للاستئناف"""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name="broadcast", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="broadcast-sender") as pool:
+            while True:
+                jobs = self.pending()
+                if not jobs:
+                    return
+                try:
+                    self.run_job(jobs[0], pool)
+                except Exception as e:
+                    logger.error(f"❌ خطأ في البث {jobs[0]['id']}: {e}")
+                    with self.lock:
+                        jobs[0]['status'] = CANCELLED
+                    self.save()
+
+    def run_job(self, job, pool):
+        if job['cursor'] is not None:
+            logger.info(f"🔁 استئناف البث {job['id']} من {job['sent'] + job['failed']}/{job['total']}")
+        else:
+            logger.info(f"📢 بدء البث {job['id']} إلى {job['total']} مستخدم")
+        cursor = job['cursor']
+        batch = []
+        last_report = 0.0
+        for chat_id in self.recipients(job):
+            if cursor is not None and chat_id <= cursor:
+                continue
+            batch.append(chat_id)
+            if len(batch) < self.batch_size:
+                continue
+            if not self.run_batch(job, batch, pool):
+                return
+            batch = []
+            if time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                self._report(job)
+        if batch and not self.run_batch(job, batch, pool):
+            return
+        with self.lock:
+            # الإلغاء قد يصل بعد آخر دفعة
+            if job['status'] == RUNNING:
+                job['status'] = DONE
+            job['finished_at'] = datetime.now().isoformat()
+        self.save()
+        self._report(job)
+        logger.info(f"✅ انتهى البث {job['id']}: {job['sent']} نجاح، {job['failed']} فشل")
+
+    def run_batch(self, job, batch, pool):
+        """إرسال دفعة ثم حفظ المؤشر - إعادة التشغيل تعيد دفعة واحدة على الأكثر"""
+        if job['status'] != RUNNING:
+            self._report(job)
+            return False
+        results = list(pool.map(lambda chat_id: self.deliver(job, chat_id), batch))
+        with self.lock:
+            job['sent'] += sum(results)
+            job['failed'] += len(results) - sum(results)
+            job['cursor'] = batch[-1]
+        self.save()
+        return True
+
+    def deliver(self, job, chat_id):
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            try:
+                self.send(chat_id, job)
+                self._result(chat_id, None)
+                return True
+            except Exception as e:
+                seconds = retry_after(e)
+                if seconds is None or attempt == self.max_attempts - 1:
+                    self._result(chat_id, e)
+                    return False
+                logger.warning(f"⚠️ حد Telegram: إيقاف البث {seconds} ثانية")
+                self.bucket.pause(seconds)
+        return False
+
+    def _result(self, chat_id, error):
+        if self.on_result:
+            self.on_result(chat_id, error)
+
+    def _report(self, job):
+        if not self.report:
+            return
+        try:
+            self.report(job)
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر تحديث تقدم البث: {e}")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+ذاكرة مؤقتة محدودة الحجم بإخلاء LRU وانتهاء صلاحية TTL
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """الأقدم استخداماً يُخلى أولاً عند امتلاء الحجم، وكل عنصر ينتهي بعد ttl ثانية"""
+
+    def __init__(self, max_size=1000, ttl=600, on_evict=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.data = OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        evicted = None
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.data[key]
+                self.misses += 1
+                evicted = (key, value)
+            else:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return value
+        self._evicted([evicted])
+        return default
+
+    def set(self, key, value, ttl=None):
+        evicted = []
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                evicted.append(self.data.popitem(last=False))
+        self._evicted([(old_key, entry[0]) for old_key, entry in evicted])
+
+    def peek(self, key, default=None):
+        """قراءة بدون تحديث ترتيب الاستخدام أو الإحصائيات ولو انتهت الصلاحية"""
+        with self.lock:
+            entry = self.data.get(key)
+        return default if entry is None else entry[0]
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def __len__(self):
+        return len(self.data)
+
+    def keys(self):
+        with self.lock:
+            return list(self.data.keys())
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def purge_expired(self):
+        """إزالة العناصر المنتهية - إرجاع عددها"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [(key, entry[0]) for key, entry in self.data.items() if entry[1] <= now]
+            for key, _ in expired:
+                del self.data[key]
+        self._evicted(expired)
+        return len(expired)
+
+    def stats(self):
+        return {
+            'size': len(self.data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def _evicted(self, items):
+        items = [item for item in items if item is not None]
+        if not items:
+            return
+        self.evictions += len(items)
+        # الاستدعاء خارج القفل حتى تتمكن الدالة من الكتابة إلى التخزين
+        if self.on_evict:
+            for key, value in items:
+                self.on_evict(key, value)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+منفذ معالجات telebot موزع حسب المحادثة: تحديثات نفس المحادثة على نفس الخيط بالترتيب،
+والمحادثات المختلفة على خيوط مختلفة بالتوازي
+"""
+
+import logging
+import queue
+import threading
+import traceback
+
+logger = logging.getLogger("موبي_المنفذ")
+
+def chat_key(update):
+    """معرف المحادثة لرسالة أو زر أو أي تحديث فيه from_user - None إذا لم يوجد"""
+    chat = getattr(update, 'chat', None)
+    if chat is not None:
+        return chat.id
+    message = getattr(update, 'message', None)
+    if message is not None and getattr(message, 'chat', None) is not None:
+        return message.chat.id
+    user = getattr(update, 'from_user', None)
+    return user.id if user is not None else None
+
+class ChatShardedExecutor:
+    """بديل telebot.util.ThreadPool بنفس الواجهة (put, raise_exceptions, clear_exceptions, close)
+
+    المحادثة تُثبت على خيط واحد: chat_id % num_shards - معالج بطيء يؤخر المحادثات
+    التي تشاركه نفس الخيط فقط، وعدد الخيوط يُرفع دون أن تتسابق رسائل المستخدم الواحد
+
+    max_pending_per_chat: محادثة تغرق خيطها لا تحجز أمام غيرها أكثر من هذا العدد،
+    وqueue_size حد طابور كل خيط - الزائد لا يُقبل وput تُرجع False"""
+
+    def __init__(self, telebot, num_shards=8, key=chat_key, max_pending_per_chat=3, queue_size=100):
+        self.telebot = telebot
+        self.num_shards = num_shards
+        self.key = key
+        self.max_pending_per_chat = max_pending_per_chat
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(num_shards)]
+        self.pending = {}
+        self.peaks = [0] * num_shards
+        self.processed = [0] * num_shards
+        self.errors = 0
+        self.overflow = 0
+        self.next_shard = 0
+        self.lock = threading.Lock()
+        self.exception_event = threading.Event()
+        self.exception_info = None
+        self.running = True
+        self.workers = [
+            threading.Thread(target=self._work, args=(shard,), name=f"chat-shard-{shard}", daemon=True)
+            for shard in range(num_shards)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def shard_for(self, chat_id):
+        if chat_id is not None:
+            return chat_id % self.num_shards
+        # بدون محادثة: لا ترتيب مطلوب فتوزع بالتناوب
+        with self.lock:
+            self.next_shard = (self.next_shard + 1) % self.num_shards
+            return self.next_shard
+
+    def put(self, func, *args, **kwargs):
+        """True إذا قُبل التحديث، وFalse إذا امتلأ طابور المحادثة أو الخيط (يُسقط ويُحسب في overflow)"""
+        chat_id = self.key(args[0]) if args else None
+        shard = self.shard_for(chat_id)
+        tasks = self.queues[shard]
+        with self.lock:
+            if chat_id is not None and self.pending.get(chat_id, 0) >= self.max_pending_per_chat:
+                return self._reject(chat_id)
+            try:
+                tasks.put_nowait((chat_id, func, args, kwargs))
+            except queue.Full:
+                return self._reject(chat_id)
+            if chat_id is not None:
+                self.pending[chat_id] = self.pending.get(chat_id, 0) + 1
+            depth = tasks.qsize()
+            if depth > self.peaks[shard]:
+                self.peaks[shard] = depth
+        return True
+
+    def _reject(self, chat_id):
+        # تحت القفل
+        self.overflow += 1
+        logger.warning(f"⚠️ تحديث زائد من المحادثة {chat_id} - لم يُقبل")
+        return False
+
+    def _work(self, shard):
+        tasks = self.queues[shard]
+        while self.running:
+            try:
+                chat_id, func, args, kwargs = tasks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self._on_exception(e)
+            finally:
+                with self.lock:
+                    if chat_id is not None:
+                        remaining = self.pending[chat_id] - 1
+                        if remaining:
+                            self.pending[chat_id] = remaining
+                        else:
+                            del self.pending[chat_id]
+            self.processed[shard] += 1
+
+    def _on_exception(self, error):
+        with self.lock:
+            self.errors += 1
+        # نفس سلوك ThreadPool: exception_handler أولاً، وإلا يُرفع في حلقة الاستطلاع
+        if self.telebot.exception_handler is not None and self.telebot.exception_handler.handle(error):
+            return
+        logger.error(f"❌ خطأ في معالج: {error}\n{traceback.format_exc()}")
+        self.exception_info = error
+        self.exception_event.set()
+
+    def raise_exceptions(self):
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self):
+        self.exception_event.clear()
+
+    def close(self):
+        self.running = False
+        for worker in self.workers:
+            if worker is not threading.current_thread():
+                worker.join()
+
+    def stats(self):
+        """عمق طابور كل خيط الآن وأعلى عمق وصل إليه"""
+        depths = [tasks.qsize() for tasks in self.queues]
+        return {
+            'shards': self.num_shards,
+            'depth': depths,
+            'peak_depth': list(self.peaks),
+            'queued': sum(depths),
+            'processed': sum(self.processed),
+            'overflow': self.overflow,
+            'errors': self.errors
+        }
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+بناء سياق المحادثة للنظام: آخر الرسائل ضمن ميزانية حجم ثابتة + ملخص تراكمي لما خرج منها
+"""
+
+import threading
+from collections import deque
+
+from utils.cache import TTLCache
+
+ROLE_LABELS = {"user": "المستخدم", "assistant": "موبي"}
+
+class RollingSummary:
+    """ملخص المستخدم: مقتطفات الرسائل المطوية بالترتيب حتى آخر رسالة (cursor)"""
+    __slots__ = ('cursor', 'parts', 'length')
+
+    def __init__(self):
+        self.cursor = ""
+        self.parts = deque()
+        self.length = 0
+
+    def text(self):
+        return " | ".join(self.parts)
+
+class ContextBuilder:
+    """السياق يُبنى من الأحدث للأقدم حتى تنفد الميزانية، والرسائل خارج النافذة
+    تُطوى في الملخص مرة واحدة فقط (الطي تراكمي بمؤشر آخر رسالة مطوية)"""
+
+    def __init__(self, budget_chars=1200, summary_chars=300, turn_chars=300, snippet_chars=80,
+                 max_users=10000, ttl=600):
+        self.budget_chars = budget_chars
+        self.summary_chars = summary_chars
+        self.turn_chars = turn_chars
+        self.snippet_chars = snippet_chars
+        self.summaries = TTLCache(max_size=max_users, ttl=ttl)
+        self.lock = threading.Lock()
+
+    def _clip(self, text, limit):
+        text = " ".join(str(text).split())
+        return text if len(text) <= limit else text[:limit - 1] + "…"
+
+    def _render(self, turn):
+        label = ROLE_LABELS.get(turn.get('role'), turn.get('role'))
+        return f"{label}: {self._clip(turn.get('content', ''), self.turn_chars)}"
+
+    def _snippet(self, turn):
+        # أول جملة فقط من كل رسالة تكفي لتذكير النظام بموضوعها
+        content = " ".join(str(turn.get('content', '')).split())
+        for mark in ('.', '؟', '?', '!', '\n'):
+            index = content.find(mark)
+            if 0 < index < self.snippet_chars:
+                content = content[:index + 1]
+        label = ROLE_LABELS.get(turn.get('role'), turn.get('role'))
+        return f"{label}: {self._clip(content, self.snippet_chars)}"
+
+    def fold(self, user_id, turns):
+        """طي رسائل خرجت من النافذة في ملخص المستخدم - الرسائل المطوية سابقاً تُتجاهل"""
+        if not turns:
+            return
+        with self.lock:
+            summary = self.summaries.get(user_id)
+            if summary is None:
+                summary = RollingSummary()
+            for turn in turns:
+                timestamp = turn.get('timestamp', '')
+                if timestamp and timestamp <= summary.cursor:
+                    continue
+                snippet = self._snippet(turn)
+                summary.parts.append(snippet)
+                summary.length += len(snippet) + 3
+                summary.cursor = timestamp or summary.cursor
+            # الأقدم يسقط أولاً حتى يبقى الملخص ضمن حجمه
+            while summary.length > self.summary_chars and len(summary.parts) > 1:
+                summary.length -= len(summary.parts.popleft()) + 3
+            self.summaries.set(user_id, summary)
+
+    def forget(self, user_id):
+        self.summaries.pop(user_id)
+
+    def summary(self, user_id):
+        summary = self.summaries.get(user_id)
+        return summary.text() if summary else ""
+
+    def build(self, user_id, history, message):
+        """النص المرسل للنظام - الرسالة كما هي إذا لم يكن هناك سياق سابق"""
+        if not history:
+            return message
+
+        folded = self.summaries.get(user_id)
+        cursor = folded.cursor if folded else ""
+        window = []
+        used = 0
+        start = len(history)
+        remaining = self.budget_chars - self.summary_chars
+        for index in range(len(history) - 1, -1, -1):
+            timestamp = history[index].get('timestamp', '')
+            if cursor and timestamp and timestamp <= cursor:
+                # مطوية في الملخص سابقاً - لا تعود للنافذة حرفياً حين تتسع الميزانية أو تُعاد المحادثة
+                break
+            line = self._render(history[index])
+            if used + len(line) + 1 > remaining:
+                break
+            window.append(line)
+            used += len(line) + 1
+            start = index
+
+        self.fold(user_id, history[:start])
+        summary = self.summary(user_id)
+        if not window and not summary:
+            return message
+
+        lines = []
+        if summary:
+            lines.append(f"[ملخص ما سبق: {self._clip(summary, self.summary_chars)}]")
+        lines.extend(reversed(window))
+        lines.append(f"{ROLE_LABELS['user']}: {message}")
+        return "\n".join(lines)
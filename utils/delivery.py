@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+حالة التوصيل لكل مستخدم: آخر نجاح، الفشل المتتالي، والحظر - وفهرس المستخدمين القابلين للوصول
+"""
+
+import threading
+import time
+
+# أخطاء نهائية: المستخدم حظر البوت أو حذف حسابه - لا فائدة من إعادة المحاولة
+PERMANENT_DESCRIPTIONS = ('blocked', 'deactivated', 'chat not found', 'peer_id_invalid', 'user not found')
+
+def is_permanent_failure(error):
+    code = getattr(error, 'error_code', None)
+    description = str(getattr(error, 'description', '') or error).lower()
+    if code == 403:
+        return True
+    return code == 400 and any(text in description for text in PERMANENT_DESCRIPTIONS)
+
+class DeliveryIndex:
+    """records[user_id] = [آخر نجاح (epoch), الفشل المتتالي, محظور] - قوائم صغيرة لأن العدد بعشرات الآلاف
+
+    المستخدم يصبح غير قابل للوصول إذا حظر البوت أو فشل max_failures مرة متتالية،
+    ويعود قابلاً للوصول عند أول نجاح أو أول رسالة منه"""
+
+    def __init__(self, records=None, get_user_ids=None, max_failures=3):
+        self.max_failures = max_failures
+        self.get_user_ids = get_user_ids
+        self.records = {int(user_id): list(record) for user_id, record in (records or {}).items()}
+        self.dead = {user_id for user_id, record in self.records.items() if self._is_dead(record)}
+        # يُبنى عند أول استخدام حتى لا يمر بدء التشغيل على كل المستخدمين
+        self.reachable = None
+        self.lock = threading.Lock()
+
+    def _is_dead(self, record):
+        return record[2] or record[1] >= self.max_failures
+
+    def _ensure_reachable(self):
+        if self.reachable is None:
+            user_ids = self.get_user_ids() if self.get_user_ids else self.records.keys()
+            self.reachable = {int(user_id) for user_id in user_ids} - self.dead
+
+    def _revive(self, user_id):
+        self.dead.discard(user_id)
+        if self.reachable is not None:
+            self.reachable.add(user_id)
+
+    def record_success(self, user_id):
+        with self.lock:
+            self.records[user_id] = [int(time.time()), 0, False]
+            self._revive(user_id)
+
+    def record_failure(self, user_id, permanent=False):
+        with self.lock:
+            record = self.records.setdefault(user_id, [None, 0, False])
+            record[1] += 1
+            record[2] = record[2] or permanent
+            if self._is_dead(record):
+                self.dead.add(user_id)
+                if self.reachable is not None:
+                    self.reachable.discard(user_id)
+
+    def record_seen(self, user_id):
+        """رسالة من المستخدم تعني أنه لم يحظر البوت - إرجاع True إذا تغيرت حالته"""
+        if user_id not in self.dead and (self.reachable is None or user_id in self.reachable):
+            record = self.records.get(user_id)
+            if record is None or not record[1]:
+                return False
+        with self.lock:
+            record = self.records.get(user_id)
+            if record is not None:
+                record[1] = 0
+                record[2] = False
+            self._revive(user_id)
+        return True
+
+    def reachable_ids(self):
+        """المستخدمون القابلون للوصول مرتبين تصاعدياً (ترتيب ثابت لاستئناف البث)"""
+        with self.lock:
+            self._ensure_reachable()
+            return sorted(self.reachable)
+
+    def counts(self):
+        with self.lock:
+            self._ensure_reachable()
+            return len(self.reachable), len(self.dead)
+
+    def snapshot(self):
+        with self.lock:
+            return {str(user_id): list(record) for user_id, record in self.records.items()}
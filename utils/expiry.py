@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+جدولة انتهاء الصلاحية بالكومة (heap)
+"""
+
+import heapq
+import itertools
+import threading
+
+class ExpiryScheduler:
+    """كل مفتاح مجدول على موعد انتهائه، والتنظيف يلمس المستحق فقط"""
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def schedule(self, key, deadline):
+        """جدولة (أو إعادة جدولة) مفتاح - المدخل القديم في الكومة يُهمل عند خروجه"""
+        with self.lock:
+            if self.deadlines.get(key) == deadline:
+                return
+            self.deadlines[key] = deadline
+            heapq.heappush(self.heap, (deadline, next(self.counter), key))
+            # إعادة بناء الكومة إذا تراكمت المدخلات الملغاة
+            if len(self.heap) > 2 * len(self.deadlines) + 64:
+                self.heap = [(d, next(self.counter), k) for k, d in self.deadlines.items()]
+                heapq.heapify(self.heap)
+
+    def cancel(self, key):
+        with self.lock:
+            self.deadlines.pop(key, None)
+
+    def pop_due(self, now):
+        """إرجاع المفاتيح التي حان موعدها وإزالتها من الجدول"""
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self.heap)
+                if self.deadlines.get(key) == deadline:
+                    del self.deadlines[key]
+                    due.append(key)
+        return due
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
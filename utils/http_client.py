@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+عميل HTTP مشترك لخدمة الذكاء الاصطناعي: اتصالات دائمة، ميزانية إعادة محاولة وقاطع دائرة
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("موبي_الاتصال")
+
+# أكواد تستحق إعادة المحاولة - الخادم مشغول أو متعطل مؤقتاً
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+class CircuitOpenError(Exception):
+    """قاطع الدائرة مفتوح - الطلب لم يُرسل"""
+
+class RetryableStatusError(Exception):
+    def __init__(self, response):
+        super().__init__(f"خطأ مؤقت من الخادم: {response.status_code}")
+        self.response = response
+
+class CircuitBreaker:
+    """مغلق: الطلبات تمر. مفتوح: رفض فوري. نصف مفتوح: طلب تجريبي واحد يقرر"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            # نصف مفتوح: طلب تجريبي واحد فقط في نفس الوقت
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("✅ قاطع الدائرة: الخدمة عادت - إغلاق")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"⚠️ قاطع الدائرة مفتوح لمدة {self.reset_timeout} ثانية بعد {self.failures} فشل")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class RetryBudget:
+    """كل طلب يضيف جزءاً من محاولة، وكل إعادة محاولة تستهلك محاولة كاملة"""
+
+    def __init__(self, ratio=0.2, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class HttpClientBase:
+    """القاطع والميزانية والعدادات المشتركة بين العميل المتزامن وغير المتزامن"""
+
+    def __init__(self, max_retries=2, backoff_base=0.25, backoff_max=2.0, retry_ratio=0.2,
+                 failure_threshold=5, reset_timeout=30):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retry_budget = RetryBudget(retry_ratio)
+        self.lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'successes': 0,
+            'failures': 0,
+            'retries': 0,
+            'short_circuited': 0
+        }
+        self.latencies = deque(maxlen=500)
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt):
+        # Full jitter: عشوائي بين 0 والحد الأقصى الأسي
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _admit(self):
+        """رفض فوري إذا كان القاطع مفتوحاً، وإلا إضافة حصة الطلب للميزانية"""
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError("الخدمة متوقفة مؤقتاً (قاطع الدائرة مفتوح)")
+        self._count('requests')
+        self.retry_budget.deposit()
+
+    def _succeeded(self, started):
+        self.latencies.append(time.perf_counter() - started)
+        self.breaker.record_success()
+        self._count('successes')
+
+    def _completed(self, started, status_code):
+        """رد وصل: أي 5xx فشل للقاطع حتى لو لم يكن قابلاً لإعادة المحاولة (500 دائم يعني خادماً معطلاً)"""
+        if status_code >= 500:
+            self._failed(started)
+        else:
+            self._succeeded(started)
+
+    def _should_retry(self, attempt):
+        if attempt >= self.max_retries or not self.retry_budget.withdraw():
+            return False
+        self._count('retries')
+        return True
+
+    def _failed(self, started):
+        self.latencies.append(time.perf_counter() - started)
+        self.breaker.record_failure()
+        self._count('failures')
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        latencies = sorted(self.latencies)
+        if latencies:
+            stats['latency_avg_ms'] = round(sum(latencies) / len(latencies) * 1000, 1)
+            stats['latency_p95_ms'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1)
+        stats['breaker'] = self.breaker.state
+        return stats
+
+class PooledHttpClient(HttpClientBase):
+    """جلسة requests مشتركة بمجمع اتصالات، مع عدادات للنجاح والفشل والزمن"""
+
+    def __init__(self, timeout=15, connect_timeout=3.05, pool_size=20, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        """طلب GET - يرفع CircuitOpenError فوراً إذا كان القاطع مفتوحاً"""
+        self._admit()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout or self.timeout, stream=stream)
+                if response.status_code in RETRYABLE_STATUS:
+                    raise RetryableStatusError(response)
+                self._completed(started, response.status_code)
+                return response
+            except (requests.ConnectionError, RetryableStatusError):
+                if not self._should_retry(attempt):
+                    self._failed(started)
+                    raise
+                attempt += 1
+                time.sleep(self._backoff(attempt))
+            except Exception:
+                # انتهاء مهلة القراءة لا يُعاد - المستخدم انتظر المهلة كاملة بالفعل
+                self._failed(started)
+                raise
+
+    def stream(self, url, params=None, timeout=None):
+        """مولد لأجزاء نص الرد فور وصولها (النجاح يُحسب عند وصول الرؤوس)"""
+        response = self.get(url, params=params, timeout=timeout, stream=True)
+        try:
+            if response.status_code != 200:
+                raise Exception(f"خطأ في النظام: {response.status_code}")
+            response.encoding = response.encoding or 'utf-8'
+            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                if chunk:
+                    yield chunk
+        finally:
+            response.close()
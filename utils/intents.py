@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+مطابقة النوايا بآلة Aho-Corasick على النص العربي بعد تطبيعه: كل الكلمات المفتاحية في مرور واحد
+"""
+
+import threading
+from collections import deque
+
+from utils.arabic import normalize_arabic
+
+class AhoCorasick:
+    """آلة بحث متعدد الأنماط: زمن البحث خطي في طول النص مهما كان عدد الأنماط"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        # goto[state] = {حرف: حالة}، fail[state]، outputs[state] = فهارس الأنماط المنتهية هنا
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                state = next_state
+            self.outputs[state].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def find(self, text):
+        """(موضع النهاية، فهرس النمط) لكل تطابق"""
+        state = 0
+        goto = self.goto
+        fail = self.fail
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in self.outputs[state]:
+                yield position, index
+
+class IntentMatcher:
+    """جدول النوايا: {'name', 'keywords', 'response', 'local'} - الثقة = نسبة النص التي تغطيها كلمات النية"""
+
+    def __init__(self, intents=()):
+        self.lock = threading.Lock()
+        self.load(intents)
+
+    def load(self, intents):
+        """إعادة بناء الآلة - تُستدعى عند تعديل الجدول من لوحة الإدارة"""
+        intents = [dict(intent) for intent in intents]
+        patterns = []
+        owners = []
+        for index, intent in enumerate(intents):
+            for keyword in intent.get('keywords', []):
+                normalized = normalize_arabic(keyword)
+                if normalized:
+                    patterns.append(normalized)
+                    owners.append(index)
+        automaton = AhoCorasick(patterns)
+        with self.lock:
+            self.intents = intents
+            self.owners = owners
+            self.automaton = automaton
+
+    def _covered(self, text, whole_words=True):
+        """(النوايا، النص المطبع، {فهرس النية: مواضع الأحرف التي غطتها كلماتها})
+
+        whole_words: التطابق على كلمات كاملة فقط ('vip' لا تطابق 'vipers')، وبدونه
+        أي جزء من النص يكفي فتُلتقط أشكال مثل 'وشكرا' و'بالترقية' و'الvip'"""
+        normalized = normalize_arabic(text)
+        with self.lock:
+            intents, owners, automaton = self.intents, self.owners, self.automaton
+        covered = {}
+        if not normalized:
+            return intents, normalized, covered
+
+        last = len(normalized) - 1
+        for end, index in automaton.find(normalized):
+            start = end - len(automaton.patterns[index]) + 1
+            if whole_words and ((start > 0 and normalized[start - 1] != ' ') or
+                                (end < last and normalized[end + 1] != ' ')):
+                continue
+            covered.setdefault(owners[index], set()).update(range(start, end + 1))
+        return intents, normalized, covered
+
+    def first(self, text):
+        """أول نية في ترتيب الجدول تظهر كلمتها في أي جزء من النص (سلوك جدول الردود الأصلي)، أو None"""
+        intents, _, covered = self._covered(text, whole_words=False)
+        return intents[min(covered)] if covered else None
+
+    def match(self, text):
+        """(النية، الثقة) للنية الأعلى ثقة، أو (None, 0.0)"""
+        intents, normalized, covered = self._covered(text)
+        if not covered:
+            return None, 0.0
+
+        best, confidence = None, 0.0
+        for owner, positions in covered.items():
+            score = len(positions) / len(normalized)
+            # عند التساوي النية الأسبق في الجدول تفوز
+            if score > confidence or (score == confidence and best is not None and owner < best):
+                best, confidence = owner, score
+        if best is None:
+            return None, 0.0
+        return intents[best], min(1.0, confidence)
+
+    def table(self):
+        with self.lock:
+            return [dict(intent) for intent in self.intents]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+سجل إلحاقي لإحصائيات المستخدمين مع ضغط في الخلفية
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from utils.roles import normalize_user_id
+from utils.user_index import SnapshotIndex, write_indexed_snapshot
+from utils.user_registry import merge_duplicate_user_ids
+
+logger = logging.getLogger("موبي_السجل")
+
+class StatsJournal:
+    """كل تغيير لمستخدم يُلحق كسطر واحد، والضاغط يدمج السجل في لقطة كاملة"""
+
+    def __init__(self, snapshot_path, compact_interval=300, compact_threshold=5000):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = self.snapshot_path.with_name(self.snapshot_path.name + ".journal")
+        self.rotated_path = self.snapshot_path.with_name(self.snapshot_path.name + ".journal.old")
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        self.lock = threading.Lock()
+        # ضغط واحد في كل مرة من البداية للنهاية - منفصل عن قفل الإلحاق حتى لا تنتظر الكتابة
+        self.compact_lock = threading.Lock()
+        self.journal_file = None
+        self.pending_entries = 0
+        self.compactor_thread = None
+        self.wakeup = threading.Event()
+        self.compact_requested = False
+
+    def load(self, include_snapshot=True):
+        """إعادة بناء الحالة: اللقطة ثم السجل المدوّر ثم السجل الحالي
+
+        بدون اللقطة تُرجع فقط السجلات التي لم تُضغط بعد (للتحميل الكسول عبر الفهرس)
+        """
+        state = {}
+        if include_snapshot and self.snapshot_path.exists():
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f, object_pairs_hook=merge_duplicate_user_ids)
+                state = {normalize_user_id(user_id): record for user_id, record in snapshot.items()}
+            except Exception as e:
+                logger.error(f"❌ خطأ في تحميل لقطة الإحصائيات: {e}")
+                state = {}
+
+        replayed = 0
+        for path in (self.rotated_path, self.journal_path):
+            replayed += self._replay(path, state)
+
+        if replayed:
+            logger.info(f"📜 تمت إعادة تشغيل {replayed} سجل من الإحصائيات")
+        self.pending_entries = replayed
+        return state
+
+    def _replay(self, path, state):
+        if not path.exists():
+            return 0
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # سطر غير مكتمل بسبب توقف مفاجئ أثناء الكتابة
+                    continue
+                # كل سطر نسخة كاملة وأحدث من سجل المستخدم
+                state[normalize_user_id(entry['id'])] = entry['data']
+                count += 1
+        return count
+
+    def _open_journal(self):
+        if self.journal_file is None:
+            self.journal_file = open(self.journal_path, 'a', encoding='utf-8')
+        return self.journal_file
+
+    def append(self, user_id, record):
+        """إلحاق سجل مستخدم واحد - تكلفة ثابتة مهما كان عدد المستخدمين"""
+        self.append_many([(user_id, record)])
+
+    def append_many(self, records):
+        """إلحاق عدة سجلات بكتابة واحدة"""
+        lines = "".join(
+            json.dumps({"id": user_id, "data": record}, ensure_ascii=False, separators=(',', ':')) + "\n"
+            for user_id, record in records
+        )
+        if not lines:
+            return
+        with self.lock:
+            journal = self._open_journal()
+            journal.write(lines)
+            journal.flush()
+            self.pending_entries += len(records)
+            if self.pending_entries >= self.compact_threshold:
+                self.wakeup.set()
+
+    def compact(self, state):
+        """دمج السجل في لقطة جديدة ثم حذفه
+
+        ضغطان متداخلان قد يكتب الأقدم لقطته فوق الأحدث، أو يحذف السجل المدوّر
+        بعد أن ضم إليه الآخر سطوراً أحدث - لذلك كل المراحل تحت compact_lock"""
+        with self.compact_lock:
+            with self.lock:
+                # نسخ السجلات تحت القفل حتى تكون اللقطة متسقة مع تدوير السجل
+                data = state.snapshot_items()
+
+                if self.journal_file is not None:
+                    self.journal_file.close()
+                    self.journal_file = None
+
+                if self.journal_path.exists():
+                    if self.rotated_path.exists():
+                        # ضغط سابق لم يكتمل - نضم السجل الحالي إليه
+                        with open(self.rotated_path, 'a', encoding='utf-8') as rotated, \
+                                open(self.journal_path, 'r', encoding='utf-8') as journal:
+                            rotated.write(journal.read())
+                        self.journal_path.unlink()
+                    else:
+                        os.replace(self.journal_path, self.rotated_path)
+                self.pending_entries = 0
+
+            write_indexed_snapshot(self.snapshot_path, data)
+            state.attach_index(SnapshotIndex.open(self.snapshot_path))
+
+            if self.rotated_path.exists():
+                self.rotated_path.unlink()
+        logger.info(f"🗜️ تم ضغط سجل الإحصائيات ({len(data)} مستخدم)")
+
+    def request_compaction(self, state):
+        """لقطة كاملة مطلوبة: خيط الضغط يكتبها إذا كان يعمل، وإلا تُكتب هنا"""
+        if self.compactor_thread is None:
+            self.compact(state)
+            return
+        self.compact_requested = True
+        self.wakeup.set()
+
+    def start_compactor(self, get_state):
+        """تشغيل خيط الضغط في الخلفية"""
+        if self.compactor_thread is not None:
+            return
+        self.compactor_thread = threading.Thread(
+            target=self._compactor_loop, args=(get_state,), daemon=True
+        )
+        self.compactor_thread.start()
+
+    def _compactor_loop(self, get_state):
+        last_compact = time.monotonic()
+        while True:
+            self.wakeup.wait(timeout=self.compact_interval)
+            self.wakeup.clear()
+            try:
+                due = time.monotonic() - last_compact >= self.compact_interval
+                requested, self.compact_requested = self.compact_requested, False
+                if requested or (self.pending_entries and (due or self.pending_entries >= self.compact_threshold)):
+                    self.compact(get_state())
+                    last_compact = time.monotonic()
+            except Exception as e:
+                logger.error(f"❌ خطأ في ضغط سجل الإحصائيات: {e}")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+معالجة ردود النظام بمراحل مُعدة مسبقاً: استخراج نص الرد من JSON، فك الرموز،
+حذف أسطر الإعلانات بنمط واحد مُجمّع، ثم القص - مع قياس زمن كل مرحلة
+"""
+
+import json
+import re
+import threading
+import time
+
+DEFAULT_STAGES = ("extract", "unescape", "filter", "truncate")
+
+# حقل الرد داخل JSON كامل أو مقطوع (أثناء البث) - يتجاوز علامات الاقتباس المهربة
+_RESPONSE_FIELD = re.compile(r'"response"\s*:\s*"((?:[^"\\]|\\.)*)')
+# رمز هروب غير مكتمل في نهاية نص مقطوع
+_PARTIAL_ESCAPE = re.compile(r'\\(?:u[0-9a-fA-F]{0,3})?$')
+_LITERAL_ESCAPES = re.compile(r'\\[nt]')
+_ESCAPES = {'\\n': '\n', '\\t': '\t'}
+
+def compile_keywords(keywords):
+    """كل الكلمات في نمط واحد بدون تمييز حالة الأحرف، يبدأ بفئة أحرفها الأولى:
+    ['dev:', '@'] -> [@Dd](?:(?<=@)|(?<=[Dd])(?i:ev:))
+    محرك re يقفز مباشرة إلى مواضع هذه الأحرف بدلاً من تجربة كل موضع في النص العربي"""
+    groups = {}
+    for keyword in keywords:
+        groups.setdefault(keyword[0].lower(), []).append(keyword[1:])
+    first = sorted({char for lower in groups for char in (lower, lower.upper())})
+    branches = []
+    for lower, rests in sorted(groups.items()):
+        cases = ''.join(re.escape(char) for char in sorted({lower, lower.upper()}))
+        lookbehind = f"(?<=[{cases}])"
+        if any(not rest for rest in rests):
+            # كلمة من حرف واحد: الحرف الأول يكفي
+            branches.append(lookbehind)
+        else:
+            branches.append(lookbehind + "(?i:" + '|'.join(re.escape(rest) for rest in rests) + ")")
+    return re.compile("[" + ''.join(re.escape(char) for char in first) + "](?:" + '|'.join(branches) + ")")
+
+class ResponsePipeline:
+    """كل مرحلة دالة نص -> نص، والترتيب من الإعدادات"""
+
+    def __init__(self, stages=DEFAULT_STAGES, filter_keywords=(), max_length=2000):
+        self.max_length = max_length
+        self.filter_pattern = compile_keywords(filter_keywords) if filter_keywords else None
+        self.stages = [(name, getattr(self, f"_{name}")) for name in stages]
+        self.timings = {name: [0, 0] for name in stages}
+        self.lock = threading.Lock()
+
+    def _decode_field(self, value):
+        value = _PARTIAL_ESCAPE.sub('', value)
+        try:
+            return json.loads(f'"{value}"')
+        except ValueError:
+            return value
+
+    def _extract(self, text):
+        text = text.strip()
+        if not text.startswith('{') or '"response"' not in text:
+            return text
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict) and isinstance(data.get('response'), str):
+                return data['response']
+        except ValueError:
+            # JSON مقطوع أثناء البث التدريجي
+            pass
+        match = _RESPONSE_FIELD.search(text)
+        return self._decode_field(match.group(1)) if match else text
+
+    def _unescape(self, text):
+        if '\\' not in text:
+            return text
+        return _LITERAL_ESCAPES.sub(lambda match: _ESCAPES[match.group(0)], text)
+
+    def _filter(self, text):
+        """حذف كل سطر فيه كلمة محظورة - مرور واحد: البحث يقفز من سطر محذوف إلى ما بعده"""
+        if self.filter_pattern is None:
+            return text.strip()
+        pieces = []
+        start = 0
+        match = self.filter_pattern.search(text)
+        while match:
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            line_end = text.find('\n', match.end())
+            pieces.append(text[start:line_start])
+            if line_end == -1:
+                start = len(text)
+                break
+            start = line_end + 1
+            match = self.filter_pattern.search(text, start)
+        pieces.append(text[start:])
+        return ''.join(pieces).strip()
+
+    def _truncate(self, text):
+        if len(text) > self.max_length:
+            return text[:self.max_length] + "..."
+        return text
+
+    def run(self, text):
+        for name, stage in self.stages:
+            started = time.perf_counter_ns()
+            text = stage(text)
+            elapsed = time.perf_counter_ns() - started
+            with self.lock:
+                timing = self.timings[name]
+                timing[0] += 1
+                timing[1] += elapsed
+        return text
+
+    def has_response_text(self, text):
+        """في البث: JSON بدأ لكن حقل الرد لم يصل بعد -> لا شيء للعرض"""
+        return not text.lstrip().startswith('{') or _RESPONSE_FIELD.search(text) is not None
+
+    def stats(self):
+        """متوسط زمن كل مرحلة بالميكروثانية"""
+        with self.lock:
+            return {
+                name: {'runs': runs, 'avg_us': round(total / runs / 1000, 2) if runs else 0.0}
+                for name, (runs, total) in self.timings.items()
+            }
+
+if __name__ == "__main__":
+    # قياس مقارن على ردود واقعية بطول 2000 حرف: python -m utils.postprocess
+    import timeit
+
+    keywords = ['dev:', 'support', 'channel', '@', "don't forget"]
+
+    def legacy(raw_text):
+        ai_response = raw_text.strip()
+        if '{"date"' in ai_response and '"response"' in ai_response:
+            import re
+            match = re.search(r'"response":"([^"]+)', ai_response)
+            if match:
+                ai_response = match.group(1)
+        lines = ai_response.split('\n')
+        clean_lines = []
+        for line in lines:
+            if not any(x in line.lower() for x in keywords):
+                clean_lines.append(line)
+        ai_response = '\n'.join(clean_lines).strip()
+        ai_response = ai_response.replace('\\n', '\n').replace('\\t', '\t')
+        if len(ai_response) > 2000:
+            ai_response = ai_response[:2000] + "..."
+        return ai_response
+
+    paragraph = "الذكاء الاصطناعي هو فرع من علوم الحاسوب يهتم ببناء أنظمة قادرة على التعلم والاستنتاج. "
+    body = "\n".join([paragraph * 2] * 11) + "\nDev: @support_channel\nDon't forget to join our channel"
+    samples = {
+        'json': json.dumps({"date": "2025-01-01", "response": body}, ensure_ascii=False).replace(' "response": ', '"response":'),
+        'json_ascii': json.dumps({"date": "2025-01-01", "response": body}),
+        'text': body
+    }
+    pipeline = ResponsePipeline(filter_keywords=keywords)
+    runs = 5000
+    for name, sample in samples.items():
+        old = timeit.timeit(lambda: legacy(sample), number=runs) / runs * 1e6
+        new = timeit.timeit(lambda: pipeline.run(sample), number=runs) / runs * 1e6
+        # طول الناتج يوضح الفرق في الصحة: القديم يحذف الرد كله إذا كان سطراً واحداً فيه '@'
+        print(f"{name:<11} {len(sample):>5} حرف | القديم {old:7.1f}µs -> {len(legacy(sample)):>5} | "
+              f"الجديد {new:7.1f}µs -> {len(pipeline.run(sample)):>5}")
+    print(pipeline.stats())
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+تحويل تحديثات python-telegram-bot إلى كائنات telebot حتى تعمل نفس المعالجات في الوضعين
+"""
+
+import telebot
+
+# حقول خدمية يضعها PTB بقيمة False دائماً، بينما telebot يحدد نوع المحتوى بمجرد وجود المفتاح
+SERVICE_FLAGS = (
+    'channel_chat_created', 'delete_chat_photo',
+    'group_chat_created', 'supergroup_chat_created'
+)
+
+def _clean(data):
+    if isinstance(data, dict):
+        return {
+            key: _clean(value) for key, value in data.items()
+            if not (key in SERVICE_FLAGS and value is False)
+        }
+    if isinstance(data, list):
+        return [_clean(value) for value in data]
+    return data
+
+def to_telebot_update(update):
+    """Update من PTB إلى telebot.types.Update بنفس بيانات Telegram الأصلية"""
+    return telebot.types.Update.de_json(_clean(update.to_dict()))
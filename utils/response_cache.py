@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+ذاكرة مؤقتة لردود الذكاء الاصطناعي بمفتاح السؤال بعد تطبيعه
+"""
+
+import logging
+import threading
+
+from utils.arabic import normalize_arabic
+from utils.cache import TTLCache
+
+logger = logging.getLogger("موبي_الردود")
+
+class CachedResponse:
+    __slots__ = ('prompt', 'response', 'hits')
+
+    def __init__(self, prompt, response):
+        self.prompt = prompt
+        self.response = response
+        self.hits = 0
+
+class ResponseCache:
+    """الأسئلة المتكررة تُجاب من الذاكرة بدلاً من استهلاك سعة النظام"""
+
+    def __init__(self, max_size=5000, ttl=3600, max_prompt_length=200, enabled=True):
+        self.entries = TTLCache(max_size=max_size, ttl=ttl)
+        self.max_prompt_length = max_prompt_length
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+    def key(self, prompt):
+        """مفتاح السؤال - None للأسئلة الطويلة التي لا تتكرر عادة"""
+        if not prompt or len(prompt) > self.max_prompt_length:
+            return None
+        return normalize_arabic(prompt) or None
+
+    def get(self, prompt):
+        if not self.enabled:
+            return None
+        key = self.key(prompt)
+        if key is None:
+            return None
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        with self.lock:
+            entry.hits += 1
+        return entry.response
+
+    def set(self, prompt, response):
+        if not self.enabled or not response:
+            return
+        key = self.key(prompt)
+        if key is not None:
+            self.entries.set(key, CachedResponse(prompt, response))
+
+    def flush(self):
+        """مسح كل الردود - إرجاع عددها"""
+        count = len(self.entries)
+        self.entries.clear()
+        logger.info(f"🧹 تم مسح {count} رد من الذاكرة المؤقتة")
+        return count
+
+    def top(self, limit=5):
+        """أكثر الأسئلة استخداماً للذاكرة المؤقتة"""
+        entries = [self.entries.peek(key) for key in self.entries.keys()]
+        entries = [entry for entry in entries if entry is not None]
+        return sorted(entries, key=lambda entry: entry.hits, reverse=True)[:limit]
+
+    def stats(self):
+        stats = self.entries.stats()
+        stats['enabled'] = self.enabled
+        return stats
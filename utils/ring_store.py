@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+مخزن محادثات في ملف واحد مربوط بالذاكرة (mmap) - حلقة ثابتة السعة لكل مستخدم
+"""
+
+import atexit
+import logging
+import mmap
+import struct
+import threading
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger("موبي_الحلقات")
+
+MAGIC = b"MOBIRING"
+VERSION = 1
+
+# رأس الملف: التوقيع، الإصدار، عدد الخانات، رسائل لكل خانة، حجم نص الرسالة
+FILE_HEADER = struct.Struct("<8sIIII")
+FILE_HEADER_SIZE = 64
+
+# رأس الخانة: رقم المستخدم (0 = فارغة)، موضع أقدم رسالة، عدد الرسائل
+SLOT_HEADER = struct.Struct("<qII")
+
+# رأس الرسالة: الوقت (epoch)، الدور، طول النص
+MESSAGE_HEADER = struct.Struct("<dB3xI")
+
+ROLE_CODES = {'user': 1, 'assistant': 2, 'system': 3}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+class RingBufferConversationStore:
+    """كل مستخدم يحصل على خانة حلقية، والخانات المنتهية تعود لقائمة الخانات الحرة"""
+
+    def __init__(self, path, capacity=15, message_size=4096, initial_slots=1024):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.index = {}
+        self.free_slots = []
+        self.mm = None
+
+        if not self.path.exists():
+            self.path.touch()
+        new_file = self.path.stat().st_size < FILE_HEADER_SIZE
+        self.file = open(self.path, 'r+b')
+        if new_file:
+            self.capacity = capacity
+            self.message_size = message_size
+            self.slot_count = 0
+            self._resize(initial_slots)
+        else:
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+            magic, version, slot_count, capacity, message_size = FILE_HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"ملف محادثات غير صالح: {self.path}")
+            self.capacity = capacity
+            self.message_size = message_size
+            self.slot_count = slot_count
+            self._rebuild_index(0)
+
+        atexit.register(self.close)
+        logger.info(f"💽 مخزن المحادثات: {len(self.index)} محادثة في {self.slot_count} خانة")
+
+    @property
+    def record_size(self):
+        return MESSAGE_HEADER.size + self.message_size
+
+    @property
+    def slot_size(self):
+        return SLOT_HEADER.size + self.capacity * self.record_size
+
+    def _slot_offset(self, slot):
+        return FILE_HEADER_SIZE + slot * self.slot_size
+
+    def _resize(self, slot_count):
+        """توسيع الملف وإعادة ربطه - الخانات الجديدة تضاف لقائمة الحرة"""
+        old_count = self.slot_count
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+        self.file.truncate(FILE_HEADER_SIZE + slot_count * self.slot_size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.slot_count = slot_count
+        FILE_HEADER.pack_into(self.mm, 0, MAGIC, VERSION, slot_count, self.capacity, self.message_size)
+        # الملف الموسَّع مملوء بالأصفار، أي خانات فارغة
+        self.free_slots.extend(range(slot_count - 1, old_count - 1, -1))
+
+    def _rebuild_index(self, start_slot):
+        for slot in range(self.slot_count - 1, start_slot - 1, -1):
+            user_id, _, _ = SLOT_HEADER.unpack_from(self.mm, self._slot_offset(slot))
+            if user_id:
+                self.index[user_id] = slot
+            else:
+                self.free_slots.append(slot)
+
+    def _allocate(self, user_id):
+        if not self.free_slots:
+            self._resize(self.slot_count * 2)
+        slot = self.free_slots.pop()
+        SLOT_HEADER.pack_into(self.mm, self._slot_offset(slot), user_id, 0, 0)
+        self.index[user_id] = slot
+        return slot
+
+    def _encode(self, content):
+        data = (content or "").encode('utf-8')
+        if len(data) > self.message_size:
+            # قص على حدود حرف UTF-8 صحيح
+            data = data[:self.message_size].decode('utf-8', 'ignore').encode('utf-8')
+        return data
+
+    def _timestamp(self, message):
+        timestamp = message.get('timestamp')
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp).timestamp()
+        return timestamp or 0.0
+
+    def _write_message(self, slot, position, message):
+        offset = self._slot_offset(slot) + SLOT_HEADER.size + position * self.record_size
+        data = self._encode(message.get('content'))
+        MESSAGE_HEADER.pack_into(
+            self.mm, offset, self._timestamp(message), ROLE_CODES.get(message.get('role'), 0), len(data)
+        )
+        start = offset + MESSAGE_HEADER.size
+        self.mm[start:start + len(data)] = data
+
+    def _append(self, user_id, slot, message):
+        slot_offset = self._slot_offset(slot)
+        _, head, count = SLOT_HEADER.unpack_from(self.mm, slot_offset)
+        if count < self.capacity:
+            position = (head + count) % self.capacity
+            count += 1
+        else:
+            position = head
+            head = (head + 1) % self.capacity
+        self._write_message(slot, position, message)
+        SLOT_HEADER.pack_into(self.mm, slot_offset, user_id, head, count)
+
+    def append_message(self, user_id, message):
+        """إضافة رسالة - إذا امتلأت الحلقة تُستبدل أقدم رسالة"""
+        with self.lock:
+            slot = self.index.get(user_id)
+            if slot is None:
+                slot = self._allocate(user_id)
+            self._append(user_id, slot, message)
+
+    def _new_tail(self, slot, conversation):
+        """الرسائل الجديدة فقط إذا كانت المحادثة امتداداً لما في الحلقة، وإلا None (إعادة كتابة كاملة)"""
+        slot_offset = self._slot_offset(slot)
+        _, head, count = SLOT_HEADER.unpack_from(self.mm, slot_offset)
+        if not count:
+            return None
+        newest = slot_offset + SLOT_HEADER.size + ((head + count - 1) % self.capacity) * self.record_size
+        timestamp, role, _ = MESSAGE_HEADER.unpack_from(self.mm, newest)
+        for position in range(len(conversation) - 1, -1, -1):
+            message = conversation[position]
+            if self._timestamp(message) == timestamp and ROLE_CODES.get(message.get('role'), 0) == role:
+                # نفس عدد الرسائل حتى هذه النقطة - وإلا حُذفت رسائل قديمة (انتهاء صلاحية) فالحلقة تحتاج إعادة كتابة
+                if min(position + 1, self.capacity) != count:
+                    return None
+                return conversation[position + 1:]
+        return None
+
+    def load_conversation(self, user_id):
+        with self.lock:
+            slot = self.index.get(user_id)
+            if slot is None:
+                return []
+            slot_offset = self._slot_offset(slot)
+            _, head, count = SLOT_HEADER.unpack_from(self.mm, slot_offset)
+            conversation = []
+            for i in range(count):
+                offset = slot_offset + SLOT_HEADER.size + ((head + i) % self.capacity) * self.record_size
+                timestamp, role, length = MESSAGE_HEADER.unpack_from(self.mm, offset)
+                start = offset + MESSAGE_HEADER.size
+                conversation.append({
+                    'role': ROLE_NAMES.get(role, 'user'),
+                    'content': self.mm[start:start + length].decode('utf-8', 'ignore'),
+                    'timestamp': datetime.fromtimestamp(timestamp).isoformat()
+                })
+            return conversation
+
+    def save_conversation(self, user_id, conversation):
+        """حفظ المحادثة: إلحاق الرسائل الجديدة فقط إذا تغير الذيل، وإلا استبدال محتوى الحلقة"""
+        with self.lock:
+            slot = self.index.get(user_id)
+            if slot is None:
+                slot = self._allocate(user_id)
+            tail = self._new_tail(slot, conversation)
+            if tail is not None and len(tail) < self.capacity:
+                for message in tail:
+                    self._append(user_id, slot, message)
+                return
+            conversation = conversation[-self.capacity:]
+            for position, message in enumerate(conversation):
+                self._write_message(slot, position, message)
+            SLOT_HEADER.pack_into(self.mm, self._slot_offset(slot), user_id, 0, len(conversation))
+
+    def delete_conversation(self, user_id):
+        """تحرير خانة المستخدم لإعادة استخدامها"""
+        with self.lock:
+            slot = self.index.pop(user_id, None)
+            if slot is None:
+                return False
+            SLOT_HEADER.pack_into(self.mm, self._slot_offset(slot), 0, 0, 0)
+            self.free_slots.append(slot)
+            return True
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        with self.lock:
+            if self.mm is not None and not self.mm.closed:
+                self.mm.flush()
+                self.mm.close()
+            if not self.file.closed:
+                self.file.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+فهرس أدوار المستخدمين (مشرف، VIP، محظور)
+"""
+
+import threading
+
+ROLE_ADMIN = 1
+ROLE_VIP = 2
+ROLE_BANNED = 4
+
+def normalize_user_id(user_id):
+    """توحيد رقم المستخدم - مفاتيح JSON تعود نصوصاً بعد إعادة التحميل"""
+    try:
+        return int(user_id)
+    except (ValueError, TypeError):
+        return user_id
+
+class RoleIndex:
+    """قناع بتّي لكل مستخدم مع فحص عضوية بزمن ثابت"""
+
+    def __init__(self):
+        self.masks = {}
+        self.lists = {}
+        self.lock = threading.Lock()
+
+    def load(self, role, user_ids):
+        """إنشاء قائمة دور من البيانات المحفوظة"""
+        role_list = RoleList(self, role)
+        self.lists[role] = role_list
+        for user_id in user_ids:
+            self.add(user_id, role)
+        return role_list
+
+    def add(self, user_id, role):
+        user_id = normalize_user_id(user_id)
+        with self.lock:
+            mask = self.masks.get(user_id, 0)
+            if mask & role:
+                return False
+            self.masks[user_id] = mask | role
+            self.lists[role].members[user_id] = None
+            return True
+
+    def remove(self, user_id, role):
+        user_id = normalize_user_id(user_id)
+        with self.lock:
+            mask = self.masks.get(user_id, 0)
+            if not mask & role:
+                return False
+            mask &= ~role
+            if mask:
+                self.masks[user_id] = mask
+            else:
+                del self.masks[user_id]
+            del self.lists[role].members[user_id]
+            return True
+
+    def mask(self, user_id):
+        """قناع أدوار المستخدم (0 إذا لم يكن له أي دور)"""
+        return self.masks.get(normalize_user_id(user_id), 0)
+
+    def has(self, user_id, role):
+        return bool(self.mask(user_id) & role)
+
+    def has_any(self, user_id, roles):
+        return bool(self.mask(user_id) & roles)
+
+class RoleList:
+    """عرض متوافق مع القائمة لأعضاء دور واحد - يُحفظ كقائمة JSON كما كان"""
+
+    def __init__(self, index, role):
+        self.index = index
+        self.role = role
+        # قاموس مرتب بدلاً من set للحفاظ على ترتيب الإضافة في الملف
+        self.members = {}
+
+    def __contains__(self, user_id):
+        return self.index.has(user_id, self.role)
+
+    def __iter__(self):
+        return iter(list(self.members))
+
+    def __len__(self):
+        return len(self.members)
+
+    def __repr__(self):
+        return repr(list(self.members))
+
+    def append(self, user_id):
+        self.index.add(user_id, self.role)
+
+    def remove(self, user_id):
+        if not self.index.remove(user_id, self.role):
+            raise ValueError(f"{user_id} not in list")
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+جدولة طلبات الذكاء الاصطناعي: حد عام للطلبات المتزامنة، طابور محدود لكل مستخدم، ومسارات موزونة بعدالة
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+LANE_PRIORITY = "priority"
+LANE_FREE = "free"
+
+WAITING = 0
+GRANTED = 1
+MERGED = 2
+TIMED_OUT = 3
+
+class RequestMerged(Exception):
+    """الطلب دُمج في طلب أحدث لنفس المستخدم - الرد سيصل مع الطلب الأحدث"""
+
+class SchedulerTimeout(Exception):
+    """انتهت مهلة الانتظار في الطابور"""
+
+class Ticket:
+    __slots__ = ('user_id', 'lane', 'payload', 'merged', 'enqueued_at', 'state', 'waiter')
+
+    def __init__(self, user_id, lane, payload, waiter):
+        self.user_id = user_id
+        self.lane = lane
+        self.payload = payload
+        # حمولات الطلبات الأقدم التي دُمجت في هذا الطلب
+        self.merged = []
+        self.enqueued_at = time.monotonic()
+        self.state = WAITING
+        self.waiter = waiter
+
+    def payloads(self):
+        return self.merged + [self.payload]
+
+class Lane:
+    __slots__ = ('name', 'weight', 'users', 'passes', 'waits', 'granted')
+
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = weight
+        # المستخدمون الذين لديهم طلبات منتظرة بالترتيب الدوري
+        self.users = deque()
+        self.passes = 0.0
+        self.waits = deque(maxlen=500)
+        self.granted = 0
+
+class FairScheduler:
+    """جدولة بالخطوات (stride): المسار ذو الوزن الأعلى يحصل على حصة أكبر من الفتحات،
+    وداخل المسار يُخدم المستخدمون بالتناوب حتى لا يحتكر مستخدم واحد المسار"""
+
+    def __init__(self, max_concurrent=16, weights=None, max_pending_per_user=2):
+        self.max_concurrent = max_concurrent
+        self.max_pending_per_user = max_pending_per_user
+        weights = weights or {LANE_PRIORITY: 4, LANE_FREE: 1}
+        self.lanes = {name: Lane(name, weight) for name, weight in weights.items()}
+        self.user_queues = {}
+        self.running = 0
+        self.virtual_time = 0.0
+        self.lock = threading.Lock()
+        self.merged = 0
+        self.timeouts = 0
+
+    def _enqueue(self, ticket):
+        """إضافة طلب - إرجاع الطلب الأقدم الذي دُمج فيه إن امتلأ طابور المستخدم"""
+        lane = self.lanes[ticket.lane]
+        key = (ticket.lane, ticket.user_id)
+        queue = self.user_queues.get(key)
+        if queue is None:
+            queue = self.user_queues[key] = deque()
+            if not lane.users:
+                # مسار عاد بعد خمول لا يحصل على رصيد متراكم
+                lane.passes = max(lane.passes, self.virtual_time)
+            lane.users.append(ticket.user_id)
+
+        dropped = None
+        if len(queue) >= self.max_pending_per_user:
+            dropped = queue.popleft()
+            dropped.state = MERGED
+            ticket.merged = dropped.payloads()
+            self.merged += 1
+        queue.append(ticket)
+        return dropped
+
+    def _remove(self, ticket):
+        key = (ticket.lane, ticket.user_id)
+        queue = self.user_queues.get(key)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self.user_queues[key]
+            self.lanes[ticket.lane].users.remove(ticket.user_id)
+
+    def _dispatch(self):
+        """منح الفتحات المتاحة - إرجاع الطلبات الممنوحة"""
+        granted = []
+        while self.running < self.max_concurrent:
+            active = [lane for lane in self.lanes.values() if lane.users]
+            if not active:
+                break
+            lane = min(active, key=lambda candidate: candidate.passes)
+            self.virtual_time = lane.passes
+            lane.passes += 1.0 / lane.weight
+
+            user_id = lane.users.popleft()
+            key = (lane.name, user_id)
+            queue = self.user_queues[key]
+            ticket = queue.popleft()
+            if queue:
+                lane.users.append(user_id)
+            else:
+                del self.user_queues[key]
+
+            ticket.state = GRANTED
+            lane.waits.append(time.monotonic() - ticket.enqueued_at)
+            lane.granted += 1
+            self.running += 1
+            granted.append(ticket)
+        return granted
+
+    def _release(self):
+        self.running -= 1
+        return self._dispatch()
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'running': self.running,
+                'max_concurrent': self.max_concurrent,
+                'merged': self.merged,
+                'timeouts': self.timeouts
+            }
+            for name, lane in self.lanes.items():
+                depth = sum(len(queue) for (lane_name, _), queue in self.user_queues.items() if lane_name == name)
+                waits = sorted(lane.waits)
+                stats[name] = {
+                    'depth': depth,
+                    'users': len(lane.users),
+                    'granted': lane.granted,
+                    'wait_avg_ms': round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                    'wait_p95_ms': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0
+                }
+            return stats
+
+class ThreadScheduler(FairScheduler):
+    """للخيوط: الخيط ينتظر حتى تُمنح له فتحة"""
+
+    def acquire(self, user_id, lane, payload=None, timeout=None):
+        ticket = Ticket(user_id, lane, payload, threading.Event())
+        with self.lock:
+            dropped = self._enqueue(ticket)
+            granted = self._dispatch()
+        for other in granted:
+            other.waiter.set()
+        if dropped is not None:
+            dropped.waiter.set()
+
+        if not ticket.waiter.wait(timeout):
+            with self.lock:
+                if ticket.state == WAITING:
+                    self._remove(ticket)
+                    ticket.state = TIMED_OUT
+                    self.timeouts += 1
+        return self._check(ticket)
+
+    def _check(self, ticket):
+        if ticket.state == MERGED:
+            raise RequestMerged("تم دمج الطلب في رسالة أحدث")
+        if ticket.state == TIMED_OUT:
+            raise SchedulerTimeout("انتهت مهلة الانتظار في الطابور")
+        return ticket
+
+    def release(self, ticket):
+        with self.lock:
+            granted = self._release()
+        for other in granted:
+            other.waiter.set()
+
+    @contextmanager
+    def slot(self, user_id, lane, payload=None, timeout=None):
+        ticket = self.acquire(user_id, lane, payload, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+class AsyncScheduler(ThreadScheduler):
+    """لحلقة الأحداث: المنتظر Future بدلاً من Event"""
+
+    async def acquire(self, user_id, lane, payload=None, timeout=None):
+        ticket = Ticket(user_id, lane, payload, asyncio.get_running_loop().create_future())
+        with self.lock:
+            dropped = self._enqueue(ticket)
+            granted = self._dispatch()
+        self._wake(granted)
+        if dropped is not None:
+            self._wake([dropped])
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.waiter), timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                if ticket.state == WAITING:
+                    self._remove(ticket)
+                    ticket.state = TIMED_OUT
+                    self.timeouts += 1
+        except asyncio.CancelledError:
+            # المعالج أُلغي: لا نترك الطلب في الطابور ولا نحجز فتحة لن تُحرر
+            with self.lock:
+                if ticket.state == WAITING:
+                    self._remove(ticket)
+                    ticket.state = TIMED_OUT
+                    granted = []
+                elif ticket.state == GRANTED:
+                    granted = self._release()
+                else:
+                    granted = []
+            self._wake(granted)
+            raise
+        return self._check(ticket)
+
+    def _wake(self, tickets):
+        for ticket in tickets:
+            if not ticket.waiter.done():
+                ticket.waiter.set_result(True)
+
+    def release(self, ticket):
+        with self.lock:
+            granted = self._release()
+        self._wake(granted)
+
+    @asynccontextmanager
+    async def slot(self, user_id, lane, payload=None, timeout=None):
+        ticket = await self.acquire(user_id, lane, payload, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
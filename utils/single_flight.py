@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+دمج الطلبات المتطابقة المعلقة (single-flight): طلب واحد للنظام وكل المنتظرين يأخذون نتيجته
+"""
+
+import asyncio
+import threading
+
+class SingleFlightTimeout(Exception):
+    """انتهت مهلة انتظار طلب مشترك"""
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """للخيوط: أول خيط ينفذ الطلب والبقية ينتظرون نفس النتيجة أو نفس الخطأ"""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, func, timeout=None):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = func()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    self.calls.pop(key, None)
+                call.done.set()
+        elif not call.done.wait(timeout):
+            with self.lock:
+                self.timeouts += 1
+            raise SingleFlightTimeout(f"انتهت مهلة انتظار الطلب المشترك ({timeout} ثانية)")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        return {
+            'in_flight': len(self.calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts
+        }
+
+class AsyncSingleFlight(SingleFlight):
+    """لحلقة الأحداث: المهمة المشتركة محمية من إلغاء أي منتظر"""
+
+    async def do(self, key, func, timeout=None):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise SingleFlightTimeout(f"انتهت مهلة انتظار الطلب المشترك ({timeout} ثانية)")
+
+    def _finished(self, key, task):
+        self.calls.pop(key, None)
+        # قراءة الخطأ حتى لا يظهر تحذير إذا انتهت مهلة كل المنتظرين قبل المهمة
+        if not task.cancelled():
+            task.exception()
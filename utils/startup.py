@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+قياس مراحل بدء تشغيل موبي
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("موبي_التشغيل")
+
+class StartupTimer:
+    """كل مرحلة تُسجّل بزمنها، والتقرير يُطبع مرة واحدة عند الجاهزية"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        breakdown = "، ".join(f"{name}: {duration * 1000:.1f}ms" for name, duration in self.steps)
+        logger.info(f"⏱️ زمن بدء التشغيل {self.elapsed() * 1000:.1f}ms ({breakdown})")
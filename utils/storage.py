@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+واجهات تخزين بيانات موبي
+"""
+
+import json
+import logging
+from pathlib import Path
+
+from utils.journal import StatsJournal
+from utils.user_index import SnapshotIndex, write_indexed_snapshot
+from utils.user_registry import merge_duplicate_user_ids
+
+logger = logging.getLogger("موبي_التخزين")
+
+class StorageBackend:
+    """الواجهة التي يعتمد عليها MemorySystem لحفظ البيانات وتحميلها"""
+
+    # القوائم المحفوظة: المشرفين، VIP، المحظورين
+    LISTS = ('admins', 'vip_users', 'banned_users')
+
+    def load_user_stats(self):
+        raise NotImplementedError
+
+    def save_user_stats(self, user_stats):
+        """حفظ إحصائيات جميع المستخدمين"""
+        raise NotImplementedError
+
+    def open_user_index(self):
+        """فهرس على القرص لتحميل سجلات المستخدمين عند الطلب - None إذا لم يكن متاحاً"""
+        return None
+
+    def load_unindexed_user_stats(self):
+        """السجلات غير الموجودة في الفهرس بعد (مثل السجل الإلحاقي)"""
+        return {}
+
+    def save_user_records(self, records, user_stats):
+        """حفظ سجلات محددة - records قائمة من (user_id, record) و user_stats للتخزين الذي لا يدعم الحفظ الجزئي"""
+        raise NotImplementedError
+
+    def load_list(self, name):
+        raise NotImplementedError
+
+    def save_list(self, name, user_ids):
+        raise NotImplementedError
+
+    def load_settings(self):
+        """إرجاع الإعدادات المحفوظة أو None"""
+        raise NotImplementedError
+
+    def save_settings(self, settings):
+        raise NotImplementedError
+
+    def load_broadcast_messages(self):
+        raise NotImplementedError
+
+    def save_broadcast_messages(self, broadcast_messages):
+        raise NotImplementedError
+
+    def load_delivery_status(self):
+        """حالة التوصيل لكل مستخدم: {user_id: [آخر نجاح, الفشل المتتالي, محظور]}"""
+        raise NotImplementedError
+
+    def save_delivery_status(self, delivery_status):
+        raise NotImplementedError
+
+    def load_conversation(self, user_id):
+        raise NotImplementedError
+
+    def save_conversation(self, user_id, conversation):
+        raise NotImplementedError
+
+    def delete_conversation(self, user_id):
+        """حذف محادثة - إرجاع True إذا كانت موجودة"""
+        raise NotImplementedError
+
+    def start(self, get_user_stats):
+        """تشغيل مهام الخلفية الخاصة بالتخزين"""
+
+    def close(self):
+        """إغلاق الموارد"""
+
+
+class JsonStorageBackend(StorageBackend):
+    """التخزين في ملفات JSON داخل مجلد العمل"""
+
+    def __init__(self, workspace, use_journal=True, compact_interval=300, compact_threshold=5000,
+                 conversation_store=None):
+        self.workspace = Path(workspace)
+        self.workspace.mkdir(exist_ok=True)
+        # مخزن بديل للمحادثات (مثل RingBufferConversationStore) بدلاً من ملف لكل مستخدم
+        self.conversation_store = conversation_store
+        self.stats_journal = None
+        if use_journal:
+            self.stats_journal = StatsJournal(
+                self.get_stats_file(),
+                compact_interval=compact_interval,
+                compact_threshold=compact_threshold
+            )
+
+    def get_user_file(self, user_id):
+        return self.workspace / f"user_{user_id}.json"
+
+    def get_stats_file(self):
+        return self.workspace / "user_stats.json"
+
+    def get_list_file(self, name):
+        return self.workspace / f"{name}.json"
+
+    def get_settings_file(self):
+        return self.workspace / "bot_settings.json"
+
+    def get_broadcast_file(self):
+        return self.workspace / "broadcast_messages.json"
+
+    def get_delivery_file(self):
+        return self.workspace / "delivery_status.json"
+
+    def _read_json(self, path, default, object_pairs_hook=None):
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f, object_pairs_hook=object_pairs_hook)
+            except:
+                return default
+        return default
+
+    def _write_json(self, path, data, indent=2):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+
+    def load_user_stats(self):
+        if self.stats_journal:
+            return self.stats_journal.load()
+        return self._read_json(self.get_stats_file(), {}, object_pairs_hook=merge_duplicate_user_ids)
+
+    def save_user_stats(self, user_stats):
+        if self.stats_journal:
+            # كل تغيير ملحق بالسجل أصلاً - الضغط من خيط الضاغط وحده بدل خيط الكتابة المؤجلة
+            self.stats_journal.request_compaction(user_stats)
+            return
+        write_indexed_snapshot(self.get_stats_file(), user_stats.snapshot_items())
+        user_stats.attach_index(SnapshotIndex.open(self.get_stats_file()))
+
+    def open_user_index(self):
+        return SnapshotIndex.open(self.get_stats_file())
+
+    def load_unindexed_user_stats(self):
+        if self.stats_journal:
+            return self.stats_journal.load(include_snapshot=False)
+        return {}
+
+    def save_user_records(self, records, user_stats):
+        # بدون السجل الإلحاقي لا يوجد حفظ جزئي - نعيد كتابة الملف كاملاً
+        if self.stats_journal:
+            self.stats_journal.append_many(records)
+        else:
+            self.save_user_stats(user_stats)
+
+    def load_list(self, name):
+        return self._read_json(self.get_list_file(name), [])
+
+    def save_list(self, name, user_ids):
+        self._write_json(self.get_list_file(name), list(user_ids))
+
+    def load_settings(self):
+        return self._read_json(self.get_settings_file(), None)
+
+    def save_settings(self, settings):
+        self._write_json(self.get_settings_file(), settings)
+
+    def load_broadcast_messages(self):
+        return self._read_json(self.get_broadcast_file(), {})
+
+    def save_broadcast_messages(self, broadcast_messages):
+        self._write_json(self.get_broadcast_file(), broadcast_messages)
+
+    def load_delivery_status(self):
+        return self._read_json(self.get_delivery_file(), {})
+
+    def save_delivery_status(self, delivery_status):
+        # سطر واحد: سجل لكل مستخدم والملف يُكتب كثيراً أثناء البث
+        self._write_json(self.get_delivery_file(), delivery_status, indent=None)
+
+    def load_conversation(self, user_id):
+        if self.conversation_store is not None:
+            return self.conversation_store.load_conversation(user_id)
+        user_file = self.get_user_file(user_id)
+        if user_file.exists():
+            try:
+                with open(user_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"❌ خطأ في تحميل محادثة المستخدم {user_id}: {e}")
+                return []
+        return []
+
+    def save_conversation(self, user_id, conversation):
+        if self.conversation_store is not None:
+            self.conversation_store.save_conversation(user_id, conversation)
+            return
+        self._write_json(self.get_user_file(user_id), conversation)
+
+    def delete_conversation(self, user_id):
+        if self.conversation_store is not None:
+            return self.conversation_store.delete_conversation(user_id)
+        user_file = self.get_user_file(user_id)
+        if user_file.exists():
+            user_file.unlink()
+            return True
+        return False
+
+    def start(self, get_user_stats):
+        if self.stats_journal:
+            self.stats_journal.start_compactor(get_user_stats)
+
+    def close(self):
+        if self.conversation_store is not None:
+            self.conversation_store.close()
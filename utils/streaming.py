@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+ردود تدريجية: إرسال أول جزء فوراً ثم تعديل نفس الرسالة بمعدل يحترم حدود Telegram
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("موبي_البث_التدريجي")
+
+# حد Telegram لطول الرسالة
+MAX_MESSAGE_LENGTH = 4096
+
+def retry_after(error):
+    """مدة الانتظار التي يطلبها Telegram عند الخطأ 429 (telebot أو PTB)"""
+    seconds = getattr(error, 'retry_after', None)
+    if seconds is None:
+        result = getattr(error, 'result_json', None) or {}
+        seconds = result.get('parameters', {}).get('retry_after')
+    return seconds
+
+class StreamingReplyBase:
+    """منطق التوقيت المشترك: تعديل واحد كل min_interval ثانية كحد أقصى"""
+
+    def __init__(self, chat_id, min_interval=1.0):
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.message_id = None
+        self.shown = ""
+        self.next_edit_at = 0.0
+        self.edits = 0
+
+    def _text(self, text):
+        """text نص أو دالة تعيده - الدالة (تنظيف الرد الجزئي) تُستدعى فقط عند الإرسال فعلاً"""
+        if callable(text):
+            text = text()
+        return text[:MAX_MESSAGE_LENGTH]
+
+    def _waiting(self):
+        """رسالة أُرسلت والفاصل لم ينقضِ - لا حاجة لحساب النص أصلاً"""
+        return self.message_id is not None and time.monotonic() < self.next_edit_at
+
+    def _sent(self, message_id, text):
+        self.message_id = message_id
+        self.shown = text
+        self.next_edit_at = time.monotonic() + self.min_interval
+
+    def _edited(self, text):
+        self.shown = text
+        self.edits += 1
+        self.next_edit_at = time.monotonic() + self.min_interval
+
+    def _edit_failed(self, error):
+        # عند 429 ننتظر المدة المطلوبة، وغير ذلك نضاعف الفاصل مرة واحدة
+        delay = retry_after(error) or self.min_interval * 2
+        self.next_edit_at = time.monotonic() + delay
+        logger.warning(f"⚠️ تأجيل تعديل الرد {delay} ثانية: {error}")
+
+class StreamingReply(StreamingReplyBase):
+    """لـ telebot: send_message ثم edit_message_text"""
+
+    def __init__(self, bot, chat_id, min_interval=1.0):
+        super().__init__(chat_id, min_interval)
+        self.bot = bot
+
+    def update(self, text):
+        if self._waiting():
+            return
+        text = self._text(text)
+        if not text.strip():
+            return
+        if self.message_id is None:
+            message = self.bot.send_message(self.chat_id, text)
+            self._sent(message.message_id, text)
+        elif text != self.shown:
+            try:
+                self.bot.edit_message_text(text, self.chat_id, self.message_id)
+                self._edited(text)
+            except Exception as e:
+                self._edit_failed(e)
+
+    def finish(self, text):
+        """النص النهائي يُرسل دائماً - ننتظر الفاصل المتبقي بدلاً من تخطيه"""
+        text = self._text(text)
+        if self.message_id is None:
+            self.update(text)
+            return
+        if text == self.shown:
+            return
+        time.sleep(max(0.0, self.next_edit_at - time.monotonic()))
+        try:
+            self.bot.edit_message_text(text, self.chat_id, self.message_id)
+            self._edited(text)
+        except Exception as e:
+            self._edit_failed(e)
+            time.sleep(max(0.0, self.next_edit_at - time.monotonic()))
+            try:
+                self.bot.edit_message_text(text, self.chat_id, self.message_id)
+                self._edited(text)
+            except Exception as e:
+                # الرد محفوظ بالفعل - المستخدم يرى آخر نص جزئي بدل خطأ في المعالج
+                logger.error(f"❌ تعذر إرسال النص النهائي للرد: {e}")
+
+class AsyncStreamingReply(StreamingReplyBase):
+    """لـ python-telegram-bot غير المتزامن"""
+
+    def __init__(self, bot, chat_id, min_interval=1.0):
+        super().__init__(chat_id, min_interval)
+        self.bot = bot
+
+    async def update(self, text):
+        if self._waiting():
+            return
+        text = self._text(text)
+        if not text.strip():
+            return
+        if self.message_id is None:
+            message = await self.bot.send_message(self.chat_id, text)
+            self._sent(message.message_id, text)
+        elif text != self.shown:
+            try:
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+                self._edited(text)
+            except Exception as e:
+                self._edit_failed(e)
+
+    async def finish(self, text):
+        text = self._text(text)
+        if self.message_id is None:
+            await self.update(text)
+            return
+        if text == self.shown:
+            return
+        await asyncio.sleep(max(0.0, self.next_edit_at - time.monotonic()))
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+            self._edited(text)
+        except Exception as e:
+            self._edit_failed(e)
+            await asyncio.sleep(max(0.0, self.next_edit_at - time.monotonic()))
+            try:
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+                self._edited(text)
+            except Exception as e:
+                logger.error(f"❌ تعذر إرسال النص النهائي للرد: {e}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+فهرس على القرص للقطة إحصائيات المستخدمين - قراءة سجل واحد بدون تحليل الملف كاملاً
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger("موبي_الفهرس")
+
+MAGIC = b"MOBIIDX1"
+
+# رأس الفهرس: التوقيع، حجم اللقطة، وقت تعديلها (ns)، عدد المدخلات
+INDEX_HEADER = struct.Struct("<8sQqQ")
+
+# مدخل لكل مستخدم مرتب حسب الرقم: رقم المستخدم، موضع السجل في اللقطة، طوله
+INDEX_ENTRY = struct.Struct("<qQI")
+
+def index_path_for(snapshot_path):
+    snapshot_path = Path(snapshot_path)
+    return snapshot_path.with_name(snapshot_path.name + ".idx")
+
+def _write_atomic(path, write):
+    """كتابة عبر ملف مؤقت خاص بهذه الكتابة ثم os.replace - كتابتان متزامنتان لا تتشاركان ملفاً"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            result = write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return result
+
+def write_indexed_snapshot(snapshot_path, records):
+    """كتابة اللقطة بسجل في كل سطر (JSON صالح) ثم فهرس المواضع
+
+    records: قائمة من (user_id, record) حيث record قاموس أو bytes جاهزة من لقطة سابقة
+    """
+    snapshot_path = Path(snapshot_path)
+
+    def write_snapshot(f):
+        entries = []
+        f.write(b"{\n")
+        offset = 2
+        for user_id, record in records:
+            try:
+                key = int(user_id)
+            except (ValueError, TypeError):
+                # مفتاح غير رقمي بقي من ملفات JSON قديمة - الفهرس للأرقام فقط
+                logger.warning(f"⚠️ تخطي سجل بمعرف غير رقمي: {user_id!r}")
+                continue
+            if not isinstance(record, bytes):
+                record = json.dumps(dict(record), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            prefix = (",\n" if entries else "") + json.dumps(str(user_id)) + ":"
+            prefix = prefix.encode('utf-8')
+            f.write(prefix)
+            f.write(record)
+            entries.append((key, offset + len(prefix), len(record)))
+            offset += len(prefix) + len(record)
+        f.write(b"\n}\n")
+        return entries
+
+    entries = _write_atomic(snapshot_path, write_snapshot)
+
+    # الفهرس يُكتب بعد اللقطة ويحمل حجمها ووقتها - أي فهرس لا يطابقها يُهمل
+    entries.sort()
+    stat = snapshot_path.stat()
+
+    def write_index(f):
+        f.write(INDEX_HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, len(entries)))
+        f.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+
+    _write_atomic(index_path_for(snapshot_path), write_index)
+    return len(entries)
+
+class SnapshotIndex:
+    """بحث ثنائي في فهرس مربوط بالذاكرة، والسجل يُقرأ من اللقطة عند الطلب"""
+
+    def __init__(self, snapshot_path, index_mm, snapshot_mm, count):
+        self.snapshot_path = Path(snapshot_path)
+        self.index_mm = index_mm
+        self.snapshot_mm = snapshot_mm
+        self.count = count
+
+    @classmethod
+    def open(cls, snapshot_path):
+        """فتح الفهرس - إرجاع None إذا كان غير موجود أو لا يطابق اللقطة"""
+        snapshot_path = Path(snapshot_path)
+        index_path = index_path_for(snapshot_path)
+        if not snapshot_path.exists() or not index_path.exists():
+            return None
+        try:
+            with open(index_path, 'rb') as f:
+                index_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, size, mtime_ns, count = INDEX_HEADER.unpack_from(index_mm, 0)
+            stat = snapshot_path.stat()
+            if (magic != MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns
+                    or len(index_mm) != INDEX_HEADER.size + count * INDEX_ENTRY.size):
+                index_mm.close()
+                logger.warning("⚠️ فهرس المستخدمين لا يطابق اللقطة - سيتم التحميل الكامل")
+                return None
+            with open(snapshot_path, 'rb') as f:
+                snapshot_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(snapshot_path, index_mm, snapshot_mm, count)
+        except Exception as e:
+            logger.error(f"❌ خطأ في فتح فهرس المستخدمين: {e}")
+            return None
+
+    def _entry(self, position):
+        return INDEX_ENTRY.unpack_from(self.index_mm, INDEX_HEADER.size + position * INDEX_ENTRY.size)
+
+    def _find(self, user_id):
+        if not isinstance(user_id, int):
+            return None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            if entry[0] < user_id:
+                low = middle + 1
+            elif entry[0] > user_id:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def __contains__(self, user_id):
+        return self._find(user_id) is not None
+
+    def __len__(self):
+        return self.count
+
+    def ids(self):
+        for position in range(self.count):
+            yield self._entry(position)[0]
+
+    def read_raw(self, user_id):
+        entry = self._find(user_id)
+        if entry is None:
+            return None
+        _, offset, length = entry
+        return self.snapshot_mm[offset:offset + length]
+
+    def read(self, user_id):
+        raw = self.read_raw(user_id)
+        return None if raw is None else json.loads(raw)
+
+    def close(self):
+        for mm in (self.index_mm, self.snapshot_mm):
+            if not mm.closed:
+                mm.close()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+سجل المستخدمين المضغوط بمفاتيح رقمية
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+from utils.roles import ROLE_ADMIN, ROLE_VIP, ROLE_BANNED, normalize_user_id
+
+logger = logging.getLogger("موبي_المستخدمين")
+
+# الحقول المخزنة كأوقات epoch وتُعرض كنص ISO
+TIME_FIELDS = ('first_seen', 'last_seen')
+
+# الحقول المنطقية المخزنة كبتات في قناع واحد
+FLAG_FIELDS = {
+    'is_admin': ROLE_ADMIN,
+    'is_vip': ROLE_VIP,
+    'is_banned': ROLE_BANNED
+}
+
+# الحقول المخزنة كما هي
+PLAIN_FIELDS = (
+    'username', 'first_name', 'message_count', 'last_message',
+    'message_limit', 'used_messages', 'points'
+)
+
+# ترتيب المفاتيح كما في user_stats.json
+RECORD_KEYS = (
+    'username', 'first_name', 'message_count', 'first_seen', 'last_seen',
+    'last_message', 'is_admin', 'is_banned', 'is_vip', 'message_limit',
+    'used_messages', 'points'
+)
+
+def to_epoch(value):
+    if value is None or isinstance(value, float):
+        return value
+    if isinstance(value, int):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class UserRecord:
+    """سجل مستخدم بـ __slots__ - يتصرف كقاموس حتى يبقى باقي الكود كما هو"""
+
+    __slots__ = PLAIN_FIELDS + TIME_FIELDS + ('flags',)
+
+    def __init__(self):
+        self.username = None
+        self.first_name = None
+        self.message_count = 0
+        self.last_message = ""
+        self.message_limit = None
+        self.used_messages = 0
+        self.points = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.flags = 0
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls()
+        for key, value in data.items():
+            if key in RECORD_KEYS:
+                record[key] = value
+        return record
+
+    def __getitem__(self, key):
+        if key in FLAG_FIELDS:
+            return bool(self.flags & FLAG_FIELDS[key])
+        if key in TIME_FIELDS:
+            value = getattr(self, key)
+            return datetime.fromtimestamp(value).isoformat() if value is not None else None
+        if key in PLAIN_FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in FLAG_FIELDS:
+            if value:
+                self.flags |= FLAG_FIELDS[key]
+            else:
+                self.flags &= ~FLAG_FIELDS[key]
+        elif key in TIME_FIELDS:
+            setattr(self, key, to_epoch(value))
+        elif key in PLAIN_FIELDS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in RECORD_KEYS
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def keys(self):
+        return RECORD_KEYS
+
+    def items(self):
+        return [(key, self[key]) for key in RECORD_KEYS]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"UserRecord({self.to_dict()!r})"
+
+def merge_user_records(first, second):
+    """دمج سجلين لنفس المستخدم نشآ بسبب اختلاف نوع المفتاح (نص/رقم)"""
+    first, second = dict(first), dict(second)
+    if (second.get('last_seen') or '') >= (first.get('last_seen') or ''):
+        older, newer = first, second
+    else:
+        older, newer = second, first
+
+    merged = {**older, **newer}
+    # كل سجل عدّ رسائل فترة مختلفة
+    for key in ('message_count', 'used_messages', 'points'):
+        merged[key] = (older.get(key) or 0) + (newer.get(key) or 0)
+    first_seen = [value for value in (older.get('first_seen'), newer.get('first_seen')) if value]
+    if first_seen:
+        merged['first_seen'] = min(first_seen)
+    return merged
+
+def merge_duplicate_user_ids(pairs):
+    """object_pairs_hook لملفات JSON القديمة التي تكرر فيها نفس المعرف كمفتاحين"""
+    result = {}
+    for key, value in pairs:
+        if key in result and isinstance(value, dict) and isinstance(result[key], dict):
+            value = merge_user_records(result[key], value)
+        result[key] = value
+    return result
+
+class UserRegistry:
+    """قاموس المستخدمين بمفاتيح رقمية وسجلات مضغوطة"""
+
+    def __init__(self):
+        self.records = {}
+
+    def load(self, raw_stats):
+        """تحميل البيانات المحفوظة مع دمج المفاتيح المكررة - إرجاع عدد السجلات المدموجة"""
+        merged = 0
+        for user_id, data in raw_stats.items():
+            key = normalize_user_id(user_id)
+            if isinstance(data, UserRecord):
+                data = data.to_dict()
+            if key in self.records:
+                data = merge_user_records(self.records[key], data)
+                merged += 1
+            self.records[key] = UserRecord.from_dict(data)
+        if merged:
+            logger.info(f"🔀 تم دمج {merged} سجل مستخدم مكرر (نص/رقم)")
+        return merged
+
+    def __getitem__(self, user_id):
+        return self.records[normalize_user_id(user_id)]
+
+    def __setitem__(self, user_id, record):
+        if not isinstance(record, UserRecord):
+            record = UserRecord.from_dict(record)
+        self.records[normalize_user_id(user_id)] = record
+
+    def __delitem__(self, user_id):
+        del self.records[normalize_user_id(user_id)]
+
+    def __contains__(self, user_id):
+        return normalize_user_id(user_id) in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(list(self.records))
+
+    def get(self, user_id, default=None):
+        return self.records.get(normalize_user_id(user_id), default)
+
+    def keys(self):
+        return list(self.records.keys())
+
+    def values(self):
+        return list(self.records.values())
+
+    def items(self):
+        return list(self.records.items())
+
+    def snapshot_items(self):
+        """السجلات كما تُكتب في لقطة الإحصائيات"""
+        return [(user_id, record.to_dict()) for user_id, record in list(self.records.items())]
+
+    def attach_index(self, index):
+        """السجل الكامل في الذاكرة لا يحتاج الفهرس"""
+        if index is not None:
+            index.close()
+
+class LazyUserRegistry(UserRegistry):
+    """سجل المستخدمين بتحميل كسول: السجل يُقرأ من فهرس اللقطة عند أول وصول إليه"""
+
+    def __init__(self, index=None):
+        super().__init__()
+        self.index = index
+        self.lock = threading.RLock()
+        # مستخدمون في الذاكرة غير موجودين في الفهرس (جدد أو من السجل الإلحاقي)
+        self.unindexed = 0
+
+    def attach_index(self, index):
+        """استبدال الفهرس بعد كتابة لقطة جديدة - القديم يُغلق حتى لا تبقى خرائطه مفتوحة"""
+        with self.lock:
+            previous, self.index = self.index, index
+            self.unindexed = sum(1 for user_id in self.records if index is None or user_id not in index)
+        if previous is not None and previous is not index:
+            previous.close()
+
+    def _in_index(self, key):
+        # تحت القفل: الفهرس قد يُستبدل ويُغلق من خيط الضغط
+        with self.lock:
+            return self.index is not None and key in self.index
+
+    def _load(self, key):
+        """تحميل سجل من الفهرس إلى الذاكرة - None إذا لم يكن موجوداً"""
+        record = self.records.get(key)
+        if record is not None or self.index is None:
+            return record
+        with self.lock:
+            record = self.records.get(key)
+            if record is None:
+                data = self.index.read(key)
+                if data is None:
+                    return None
+                record = UserRecord.from_dict(data)
+                self.records[key] = record
+            return record
+
+    def load(self, raw_stats):
+        """إضافة سجلات كاملة (مثل السجل الإلحاقي) فوق الفهرس"""
+        with self.lock:
+            for user_id, data in raw_stats.items():
+                self[user_id] = data.to_dict() if isinstance(data, UserRecord) else data
+        return 0
+
+    def __getitem__(self, user_id):
+        record = self._load(normalize_user_id(user_id))
+        if record is None:
+            raise KeyError(user_id)
+        return record
+
+    def __setitem__(self, user_id, record):
+        key = normalize_user_id(user_id)
+        if not isinstance(record, UserRecord):
+            record = UserRecord.from_dict(record)
+        with self.lock:
+            if key not in self.records and not self._in_index(key):
+                self.unindexed += 1
+            self.records[key] = record
+
+    def __delitem__(self, user_id):
+        raise TypeError("حذف المستخدمين غير مدعوم في وضع التحميل الكسول")
+
+    def __contains__(self, user_id):
+        key = normalize_user_id(user_id)
+        return key in self.records or self._in_index(key)
+
+    def __len__(self):
+        return (len(self.index) if self.index is not None else 0) + self.unindexed
+
+    def loaded_count(self):
+        return len(self.records)
+
+    def keys(self):
+        with self.lock:
+            keys = list(self.records)
+            if self.index is not None:
+                keys.extend(user_id for user_id in self.index.ids() if user_id not in self.records)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, user_id, default=None):
+        record = self._load(normalize_user_id(user_id))
+        return default if record is None else record
+
+    def _peek(self, key):
+        """السجل للقراءة فقط: المحمّل كما هو، وغير المحمّل يُحلل مؤقتاً دون إضافته للذاكرة"""
+        record = self.records.get(key)
+        if record is not None:
+            return record
+        with self.lock:
+            record = self.records.get(key)
+            if record is None and self.index is not None:
+                data = self.index.read(key)
+                if data is not None:
+                    record = UserRecord.from_dict(data)
+        return record
+
+    def values(self):
+        """للإحصائيات والقوائم: المرور على كل المستخدمين لا يحمّلهم - التعديل عبر registry[user_id]"""
+        for _, record in self.items():
+            yield record
+
+    def items(self):
+        for user_id in self.keys():
+            record = self._peek(user_id)
+            if record is not None:
+                yield user_id, record
+
+    def snapshot_items(self):
+        """السجلات غير المحمّلة تُنسخ كما هي من اللقطة السابقة بدون تحليل"""
+        with self.lock:
+            items = [(user_id, record.to_dict()) for user_id, record in list(self.records.items())]
+            if self.index is not None:
+                items.extend(
+                    (user_id, self.index.read_raw(user_id))
+                    for user_id in self.index.ids() if user_id not in self.records
+                )
+        return items
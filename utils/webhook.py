@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+استقبال تحديثات Telegram عبر webhook: خادم HTTP مدمج يتحقق من الرمز السري،
+يرد فوراً ويضع التحديث في طابور محدود، وخيط واحد يمرره لنفس المعالجات
+"""
+
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("موبي_webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """handle(updates): قائمة تحديثات JSON (قواميس) - تُستدعى من خيط التوزيع فقط
+
+    الطابور الممتلئ يرد 503 فيعيد Telegram المحاولة لاحقاً بدل أن تتراكم الذاكرة.
+    backlog(): عدد التحديثات المنتظرة بعد handle (طوابير المعالجات) - خيط التوزيع لا يمرر
+    دفعة جديدة ما دام فوق max_backlog، فيمتلئ الطابور هنا ويصل الضغط إلى Telegram"""
+
+    def __init__(self, handle, secret_token, path="/telegram", host="0.0.0.0", port=8443,
+                 queue_size=1000, batch_size=50, max_body=1024 * 1024, backlog=None, max_backlog=500):
+        self.handle = handle
+        self.backlog = backlog
+        self.max_backlog = max_backlog
+        self.secret_token = secret_token.encode()
+        self.path = path
+        self.batch_size = batch_size
+        self.max_body = max_body
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.counters = {'received': 0, 'rejected': 0, 'dropped': 0, 'processed': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.dispatcher = None
+        self.serving = False
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # فحص الحياة من منصة الاستضافة
+                self._reply(200, b"ok")
+
+            def do_POST(self):
+                self._reply(*server.accept(self.path, self.headers, self.rfile))
+
+            def _reply(self, status, body=b""):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # سجل لكل طلب يغرق السجلات - العدادات في stats
+                pass
+
+        return Handler
+
+    def accept(self, path, headers, body):
+        """(الحالة، النص) لطلب POST - التحقق والتحليل في خيط الاتصال، المعالجة في خيط التوزيع"""
+        if path.split("?", 1)[0] != self.path:
+            return 404, b"not found"
+        token = (headers.get(SECRET_HEADER) or "").encode()
+        if not hmac.compare_digest(token, self.secret_token):
+            self._count('rejected')
+            return 403, b"forbidden"
+        try:
+            length = int(headers.get("Content-Length") or 0)
+        except ValueError:
+            return 400, b"bad length"
+        if length <= 0 or length > self.max_body:
+            return 413 if length > self.max_body else 400, b"bad length"
+        try:
+            update = json.loads(body.read(length))
+        except ValueError:
+            return 400, b"bad json"
+        if not isinstance(update, dict) or 'update_id' not in update:
+            return 400, b"not an update"
+        try:
+            self.queue.put_nowait(update)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning("⚠️ طابور التحديثات ممتلئ - Telegram سيعيد الإرسال")
+            return 503, b"busy"
+        self._count('received')
+        return 200, b"ok"
+
+    def dispatch(self):
+        """سحب دفعات من الطابور وتمريرها للمعالجات"""
+        while not self.stopped.is_set():
+            if self.backlog is not None and self.backlog() >= self.max_backlog:
+                self.stopped.wait(0.05)
+                continue
+            try:
+                updates = [self.queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            while len(updates) < self.batch_size:
+                try:
+                    updates.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.handle(updates)
+                with self.lock:
+                    self.counters['processed'] += len(updates)
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"❌ خطأ في معالجة تحديثات webhook: {e}")
+
+    def start(self):
+        """خيط التوزيع فقط - serve_forever يُستدعى من الخيط الرئيسي أو عبر serve_in_background"""
+        self.dispatcher = threading.Thread(target=self.dispatch, name="webhook-dispatch", daemon=True)
+        self.dispatcher.start()
+
+    def serve_forever(self):
+        logger.info(f"🌐 webhook يستمع على المنفذ {self.port}{self.path}")
+        self.serving = True
+        self.httpd.serve_forever(poll_interval=0.5)
+
+    def serve_in_background(self):
+        # قبل بدء الخيط حتى لا يتخطى stop السريع shutdown ويترك الخادم يعمل
+        self.serving = True
+        thread = threading.Thread(target=self.serve_forever, name="webhook-http", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+        # shutdown ينتظر serve_forever - لا يُستدعى إذا لم يبدأ
+        if self.serving:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['queued'] = self.queue.qsize()
+        return stats
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+طبقة كتابة مؤجلة (write-behind) لبيانات موبي
+"""
+
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger("موبي_الكتابة")
+
+class WriteBehindQueue:
+    """التغييرات تُعلَّم كمتسخة، وخيط الكتابة يحفظها في دفعات"""
+
+    def __init__(self, interval=2.0, max_dirty=500):
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self.writers = {}
+        self.dirty = {}
+        self.in_flight = {}
+        self.dirty_count = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def register(self, kind, writer, keyed=False):
+        """تسجيل دالة الكتابة لنوع بيانات - المفهرس يستقبل مجموعة المفاتيح المتسخة"""
+        self.writers[kind] = (writer, keyed)
+
+    def mark_dirty(self, kind, key=None):
+        """تعليم سجل كمتسخ - لا يلمس القرص"""
+        with self.lock:
+            keys = self.dirty.setdefault(kind, set())
+            if key not in keys:
+                keys.add(key)
+                self.dirty_count += 1
+            if self.dirty_count >= self.max_dirty:
+                self.wakeup.set()
+
+    def is_dirty(self, kind, key=None):
+        """هل السجل بانتظار الكتابة (أو قيد الكتابة الآن)"""
+        with self.lock:
+            return key in self.dirty.get(kind, ()) or key in self.in_flight.get(kind, ())
+
+    def flush(self):
+        """كتابة كل ما هو متسخ الآن"""
+        with self.flush_lock:
+            with self.lock:
+                batch = self.dirty
+                self.in_flight = batch
+                self.dirty = {}
+                self.dirty_count = 0
+
+            # الكتابة بترتيب التسجيل حتى تبقى الملفات المترابطة متسقة
+            for kind, (writer, keyed) in self.writers.items():
+                keys = batch.get(kind)
+                if not keys:
+                    continue
+                try:
+                    if keyed:
+                        writer(keys)
+                    else:
+                        writer()
+                except Exception as e:
+                    logger.error(f"❌ خطأ في الكتابة المؤجلة ({kind}): {e}")
+                    for key in keys:
+                        self.mark_dirty(kind, key)
+
+            with self.lock:
+                self.in_flight = {}
+
+    def start(self):
+        """تشغيل خيط الكتابة والتأكد من الحفظ عند الإيقاف"""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """إيقاف الخيط مع كتابة أخيرة"""
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=10)
+        self.flush()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(timeout=self.interval)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            self.flush()